@@ -34,6 +34,9 @@ setup(
         "m3u8>=1.0.0,<4.0.0",
         "httpx>=0.17.0,<1.0.0",
     ],
+    extras_require={
+        "http2": ["h2>=3.0.0,<5.0.0"],
+    },
     entry_points={
         "console_scripts": [
             "twitch-dl=twitchdl.console:main",
@@ -0,0 +1,81 @@
+import json
+import os
+import time
+
+from twitchdl.cache import ACCESS_TOKEN, GAME_ID, VIDEO, Cache
+
+
+def test_cached_fetches_once(tmp_path):
+    cache = Cache(str(tmp_path))
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return {"id": "123"}
+
+    assert cache.cached(VIDEO, "123", fetch) == {"id": "123"}
+    assert cache.cached(VIDEO, "123", fetch) == {"id": "123"}
+    assert len(calls) == 1
+
+
+def test_cached_many_fetches_missing(tmp_path):
+    cache = Cache(str(tmp_path))
+    cache.set(GAME_ID, "Foo", "1")
+    requested = []
+
+    def fetch(names):
+        requested.extend(names)
+        return {name: str(n + 2) for n, name in enumerate(names)}
+
+    assert cache.cached_many(GAME_ID, ["Foo", "Bar", "Baz"], fetch) == {
+        "Foo": "1", "Bar": "2", "Baz": "3"}
+    assert requested == ["Bar", "Baz"]
+
+
+def test_not_found_is_not_cached(tmp_path):
+    cache = Cache(str(tmp_path))
+    cache.set(VIDEO, "123", None)
+    assert not os.path.exists(tmp_path) or not os.listdir(tmp_path)
+
+
+def test_disabled_and_refresh(tmp_path):
+    Cache(str(tmp_path)).set(VIDEO, "123", {"id": "123"})
+
+    assert Cache(str(tmp_path), enabled=False).get(VIDEO, "123") is None
+
+    refreshed = Cache(str(tmp_path), refresh=True)
+    assert refreshed.cached(VIDEO, "123", lambda: {"id": "456"}) == {"id": "456"}
+    assert Cache(str(tmp_path)).get(VIDEO, "123") == {"id": "456"}
+
+
+def test_access_token_expires(tmp_path):
+    cache = Cache(str(tmp_path))
+
+    def token(expires):
+        return {"value": json.dumps({"expires": expires}), "signature": "x"}
+
+    cache.set(ACCESS_TOKEN, "valid", token(time.time() + 3600))
+    cache.set(ACCESS_TOKEN, "expiring", token(time.time() + 10))
+    cache.set(ACCESS_TOKEN, "unknown", {"value": "", "signature": "x"})
+
+    assert cache.get(ACCESS_TOKEN, "valid") is not None
+    assert cache.get(ACCESS_TOKEN, "expiring") is None
+    assert cache.get(ACCESS_TOKEN, "unknown") is None
+
+
+def test_prune_evicts_least_recently_used(tmp_path):
+    cache = Cache(str(tmp_path))
+    for n in range(3):
+        cache.set(VIDEO, str(n), {"id": "x" * 100})
+
+    # Entries were last used in order, then the first one is used again
+    for n in range(3):
+        os.utime(cache._entry_path(VIDEO, str(n)), (1000 + n, 1000 + n))
+    cache.get(VIDEO, "0")
+
+    cache.max_size = sum(os.path.getsize(cache._entry_path(VIDEO, key)) for key in ["0", "2"])
+    cache.prune()
+
+    assert cache.get(VIDEO, "0") is not None
+    assert cache.get(VIDEO, "1") is None
+    assert cache.get(VIDEO, "2") is not None
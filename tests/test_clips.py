@@ -0,0 +1,95 @@
+import asyncio
+import importlib
+import pytest
+
+from argparse import Namespace
+
+# Module is shadowed by the `clips` command function in `twitchdl.commands`
+clips = importlib.import_module("twitchdl.commands.clips")
+
+
+def _clip(slug):
+    return {
+        "id": slug,
+        "slug": slug,
+        "title": f"Clip {slug}",
+        "createdAt": "2022-01-01T00:00:00Z",
+        "broadcaster": {"login": "foo"},
+        "videoQualities": [{"quality": "720", "sourceURL": f"http://x/{slug}.mp4"}],
+    }
+
+
+def _mock_pipeline(monkeypatch, download_with_retries):
+    token_requests = []
+    closed = []
+
+    async def get_clip_access_tokens_async(slugs):
+        slugs = list(slugs)
+        token_requests.append(slugs)
+        return {slug: {
+            "videoQualities": _clip(slug)["videoQualities"],
+            "playbackAccessToken": {"signature": "sig", "value": slug},
+        } for slug in slugs}
+
+    async def close_async_client():
+        closed.append(True)
+
+    monkeypatch.setattr(clips.twitch, "get_clip_access_tokens_async", get_clip_access_tokens_async)
+    monkeypatch.setattr(clips, "download_with_retries", download_with_retries)
+    monkeypatch.setattr(clips, "get_async_client", lambda: None)
+    monkeypatch.setattr(clips, "close_async_client", close_async_client)
+    return token_requests, closed
+
+
+def _args():
+    return Namespace(rate_limit=None, max_workers=2)
+
+
+def test_download_clips(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    downloaded = []
+
+    async def download_with_retries(client, semaphore, task_id, url, target, progress, *args):
+        downloaded.append((task_id, url, target))
+
+    token_requests, closed = _mock_pipeline(monkeypatch, download_with_retries)
+
+    # Downloaded before, doesn't need a token
+    (tmp_path / "20220101_b_foo_clip_b.mp4").write_bytes(b"foo")
+
+    clips._download_clips([_clip("a"), _clip("b"), _clip("c")], _args())
+
+    assert sorted(downloaded) == [
+        (0, "http://x/a.mp4?sig=sig&token=a", "20220101_a_foo_clip_a.mp4"),
+        (2, "http://x/c.mp4?sig=sig&token=c", "20220101_c_foo_clip_c.mp4"),
+    ]
+    assert sorted(slug for batch in token_requests for slug in batch) == ["a", "c"]
+    assert closed == [True]
+
+
+def test_download_clips_failure_stops_pipeline_before_closing_client(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    active = set()
+    active_when_closed = []
+
+    async def download_with_retries(client, semaphore, task_id, url, target, progress, *args):
+        active.add(task_id)
+        try:
+            if task_id == 1:
+                raise ValueError("failed")
+            await asyncio.sleep(10)
+        finally:
+            active.discard(task_id)
+
+    _mock_pipeline(monkeypatch, download_with_retries)
+
+    async def close_async_client():
+        active_when_closed.append(set(active))
+
+    monkeypatch.setattr(clips, "close_async_client", close_async_client)
+
+    with pytest.raises(ValueError):
+        clips._download_clips([_clip("a"), _clip("b"), _clip("c")], _args())
+
+    # The other download was cancelled before the client was closed
+    assert active_when_closed == [set()]
@@ -0,0 +1,390 @@
+import asyncio
+import httpx
+import importlib
+import m3u8
+import os
+import pytest
+import signal
+import sys
+
+from argparse import Namespace
+from twitchdl import http
+from twitchdl.commands.download import Timeline, _get_vod_paths, _range_target_filename
+from twitchdl.exceptions import ConsoleError
+from twitchdl.journal import Journal
+
+# Module is shadowed by the `download` command function in `twitchdl.commands`
+download = importlib.import_module("twitchdl.commands.download")
+
+
+def _playlist_text(durations, ended=True, target_duration=10):
+    lines = ["#EXTM3U", f"#EXT-X-TARGETDURATION:{target_duration}"]
+    for n, duration in enumerate(durations):
+        lines.append(f"#EXTINF:{duration},")
+        lines.append(f"{n}.ts")
+    if ended:
+        lines.append("#EXT-X-ENDLIST")
+    return "\n".join(lines)
+
+
+def _playlist(durations):
+    return m3u8.loads(_playlist_text(durations))
+
+
+def test_get_vod_paths():
+    timeline = Timeline(_playlist([10] * 10))
+
+    assert _get_vod_paths(timeline, [(None, None)]) == [f"{n}.ts" for n in range(10)]
+    assert _get_vod_paths(timeline, [(20, 40)]) == ["2.ts", "3.ts"]
+    assert _get_vod_paths(timeline, [(25, 35)]) == ["2.ts", "3.ts"]
+    assert _get_vod_paths(timeline, [(None, 15)]) == ["0.ts", "1.ts"]
+    assert _get_vod_paths(timeline, [(85, None)]) == ["8.ts", "9.ts"]
+
+
+def test_get_vod_paths_for_multiple_ranges():
+    timeline = Timeline(_playlist([10, 5, 5, 10, 10, 10]))
+
+    # Segments shared between ranges are downloaded once, in playlist order
+    vod_paths = _get_vod_paths(timeline, [(40, 50), (12, 31)])
+    assert vod_paths == ["1.ts", "2.ts", "3.ts", "4.ts", "5.ts"]
+
+
+def test_get_vod_paths_for_empty_playlist():
+    timeline = Timeline(_playlist([]))
+
+    assert _get_vod_paths(timeline, [(None, None)]) == []
+    assert _get_vod_paths(timeline, [(None, 30), (10, None), (10, 30)]) == []
+
+
+def test_range_target_filename():
+    assert _range_target_filename("foo.mkv", (65, 3725)) == "foo_0h01m05s-1h02m05s.mkv"
+
+
+def _args(**kwargs):
+    defaults = dict(max_workers=5, rate_limit=None, http2=False, chunk_size=1024,
+                    write_buffer=1024, fsync="none", validate="sync", hedge_budget=None,
+                    segment_cache=False)
+    return Namespace(**{**defaults, **kwargs})
+
+
+def test_download_following(tmp_path, monkeypatch):
+    # Playlist grows by one segment on each poll, and ends after the third one
+    polls = [_playlist_text([10] * n, ended=n == 5, target_duration=0) for n in range(3, 6)]
+    # A failed poll is retried
+    polls.insert(1, None)
+    downloaded = []
+    clients = set()
+
+    def handler(request):
+        text = polls.pop(0)
+        return httpx.Response(200, text=text) if text else httpx.Response(503)
+
+    async def download_all(sources, targets, workers, client, **kwargs):
+        downloaded.append(sources)
+        clients.add(client)
+
+    def make_download_client(workers, http2):
+        return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    monkeypatch.setattr(download, "FOLLOW_INTERVAL", 0)
+    monkeypatch.setattr(download, "download_all", download_all)
+    monkeypatch.setattr(download, "make_download_client", make_download_client)
+
+    playlist = m3u8.loads(_playlist_text([10] * 2, ended=False, target_duration=0))
+    paths = ["0.ts", "1.ts"]
+    job = download.VideoJob(
+        video={"id": "1"},
+        outputs=[download.Output("out.mkv", paths, "playlist_downloaded.m3u8")],
+        target_dir=str(tmp_path),
+        playlist=playlist,
+        playlist_uri="http://x/playlist.m3u8",
+        base_uri="http://x/",
+        vod_paths=paths,
+        sources=["http://x/" + p for p in paths],
+        targets=[str(tmp_path / f"{n:05d}.ts") for n in range(2)],
+        overwrite=False,
+        ranges=[(None, None)],
+    )
+
+    with Journal(str(tmp_path)) as journal:
+        job = asyncio.run(download._download_following(job, journal, _args(),
+                                                       http.RetryPolicy(backoff=0)))
+
+    assert downloaded == [
+        ["http://x/0.ts", "http://x/1.ts"],
+        ["http://x/2.ts"],
+        ["http://x/3.ts"],
+        ["http://x/4.ts"],
+    ]
+    assert job.vod_paths == [f"{n}.ts" for n in range(5)]
+    assert job.targets[-1] == str(tmp_path / "00004.ts")
+    assert job.outputs[0].vod_paths == job.vod_paths
+    assert job.playlist.is_endlist
+    assert not polls
+
+    # Connections are kept open between polls
+    assert len(clients) == 1
+
+
+def test_resume_downloads_remaining_vods(tmp_path, monkeypatch):
+    downloaded = []
+    interrupted = []
+
+    async def download_all(sources, targets, workers, on_complete, **kwargs):
+        for task_id, (source, target) in enumerate(zip(sources, targets)):
+            # Interrupted while downloading the fourth VOD
+            if source.endswith("3.ts") and not interrupted:
+                interrupted.append(source)
+                raise KeyboardInterrupt()
+            with open(target, "w") as f:
+                f.write(source)
+            downloaded.append(source)
+            on_complete(task_id)
+
+    monkeypatch.setattr(download, "download_all", download_all)
+
+    playlist = _playlist([10] * 6)
+    download._save_playlist(playlist, str(tmp_path))
+    video = {"id": "1", "title": "Foo", "creator": {"displayName": "Bar"}}
+    job = download._make_job(video, ["out.mkv"], [(None, None)], str(tmp_path), playlist,
+                             "http://x/playlist.m3u8", False)
+
+    try:
+        with Journal(str(tmp_path)) as journal:
+            asyncio.run(download._download_vods(job, journal, _args(), http.RetryPolicy()))
+    except KeyboardInterrupt:
+        pass
+
+    # Resumed from the journal alone, without looking up the video
+    resumed = download._resume_job(str(tmp_path))
+    assert resumed == job._replace(playlist=resumed.playlist)
+
+    downloaded.clear()
+    completed = []
+    with Journal(str(tmp_path)) as journal:
+        asyncio.run(download._download_vods(resumed, journal, _args(), http.RetryPolicy(),
+                                            on_complete=completed.append))
+
+    assert downloaded == ["http://x/3.ts", "http://x/4.ts", "http://x/5.ts"]
+    assert sorted(completed) == list(range(6))
+
+
+def _clip(slug):
+    return {
+        "id": slug,
+        "slug": slug,
+        "title": f"Clip {slug}",
+        "createdAt": "2022-01-01T00:00:00Z",
+        "durationSeconds": 10,
+        "game": None,
+        "broadcaster": {"displayName": "Foo", "login": "foo"},
+        "videoQualities": [
+            {"quality": "720", "frameRate": 30, "sourceURL": f"http://x/{slug}.mp4"},
+        ],
+    }
+
+
+def _token(slug):
+    return {
+        "videoQualities": _clip(slug)["videoQualities"],
+        "playbackAccessToken": {"signature": "sig", "value": slug},
+    }
+
+
+def test_download_multiple_clips_looks_them_up_in_batches(tmp_path, monkeypatch):
+    lookups = []
+    downloaded = []
+
+    def get_clip(slug):
+        raise AssertionError("Clips should be looked up in a batch")
+
+    monkeypatch.setattr(download.twitch, "get_clip", get_clip)
+    monkeypatch.setattr(download.twitch, "get_clip_access_token", get_clip)
+    monkeypatch.setattr(download.twitch, "get_clips",
+                        lambda slugs: lookups.append(slugs) or {s: _clip(s) for s in slugs})
+    monkeypatch.setattr(download.twitch, "get_clip_access_tokens",
+                        lambda slugs: lookups.append(slugs) or {s: _token(s) for s in slugs})
+    monkeypatch.setattr(download, "download_file",
+                        lambda url, target: downloaded.append((url, target)))
+
+    args = _args(videos=["FooClip", "BarClip"], resume=None, follow=False, metrics=None,
+                 metrics_format="json-lines", overwrite=False, quality="source",
+                 output=str(tmp_path / "{slug}.{format}"))
+    download.download(args)
+
+    assert lookups == [["FooClip", "BarClip"], ["FooClip", "BarClip"]]
+    assert downloaded == [
+        ("http://x/FooClip.mp4?sig=sig&token=FooClip", str(tmp_path / "FooClip.mp4")),
+        ("http://x/BarClip.mp4?sig=sig&token=BarClip", str(tmp_path / "BarClip.mp4")),
+    ]
+
+
+def _fake_join_command(source, target, overwrite, video, input_format=None):
+    return [sys.executable, "-c", f"open({target!r}, 'w').close()", "-stats"]
+
+
+def test_download_and_join_all(tmp_path, monkeypatch):
+    jobs = []
+    for n in range(2):
+        target_dir = tmp_path / f"job{n}"
+        target_dir.mkdir()
+        playlist = _playlist([10] * 2)
+        video = {"id": str(n), "title": "Foo", "creator": {"displayName": "Bar"}}
+        jobs.append(download._make_job(video, [str(tmp_path / f"out{n}.mkv")], [(None, None)],
+                                       str(target_dir), playlist, f"http://x/{n}/playlist.m3u8",
+                                       False))
+
+    joined_while_downloading = []
+
+    async def download_all(sources, targets, workers, on_complete, **kwargs):
+        for task_id, (source, target) in enumerate(zip(sources, targets)):
+            with open(target, "w") as f:
+                f.write(source)
+            on_complete(task_id)
+
+            # Wait for the first video to be joined before finishing the second one
+            if task_id == 1:
+                for _ in range(500):
+                    if (tmp_path / "out0.mkv").exists():
+                        joined_while_downloading.append(True)
+                        break
+                    await asyncio.sleep(0.01)
+
+    monkeypatch.setattr(download, "download_all", download_all)
+    monkeypatch.setattr(download, "_join_command", _fake_join_command)
+
+    args = _args(retries=5, retry_backoff=1, no_join=False, keep=True)
+    asyncio.run(download._download_and_join_all(jobs, args))
+
+    assert joined_while_downloading == [True]
+    assert (tmp_path / "out1.mkv").exists()
+
+    for job in jobs:
+        journal = Journal(job.target_dir)
+        assert list(journal.completed) == ["0.ts", "1.ts"]
+        assert all(journal.is_completed(vod_path, target)
+                   for vod_path, target in zip(job.vod_paths, job.targets))
+
+
+def _concurrent_join_job(tmp_path, count):
+    playlist = _playlist([10] * count)
+    video = {"id": "1", "title": "Foo", "creator": {"displayName": "Bar"}}
+    return download._make_job(video, [str(tmp_path / "out.mkv")], [(None, None)], str(tmp_path),
+                              playlist, "http://x/playlist.m3u8", False)
+
+
+def test_download_and_join_feeds_vods_in_order(tmp_path, monkeypatch):
+    def join_command(source, target, overwrite, video, input_format=None):
+        script = f"import shutil, sys; shutil.copyfileobj(sys.stdin.buffer, open({target!r}, 'wb'))"
+        return [sys.executable, "-c", script, "-stats"]
+
+    async def download_all(sources, targets, workers, on_complete, **kwargs):
+        # VODs complete out of order
+        for task_id in [2, 0, 3, 1]:
+            with open(targets[task_id], "w") as f:
+                f.write(f"<{task_id}>")
+            on_complete(task_id)
+            await asyncio.sleep(0.01)
+
+    monkeypatch.setattr(download, "download_all", download_all)
+    monkeypatch.setattr(download, "_join_command", join_command)
+
+    job = _concurrent_join_job(tmp_path, 4)
+    with Journal(str(tmp_path)) as journal:
+        asyncio.run(download._download_and_join(job, journal, _args(), http.RetryPolicy()))
+
+    assert (tmp_path / "out.mkv").read_text() == "<0><1><2><3>"
+
+
+def test_download_and_join_kills_ffmpeg_on_failure(tmp_path, monkeypatch):
+    processes = []
+    create_subprocess_exec = asyncio.create_subprocess_exec
+
+    async def create_process(*args, **kwargs):
+        process = await create_subprocess_exec(*args, **kwargs)
+        processes.append(process)
+        return process
+
+    def join_command(source, target, overwrite, video, input_format=None):
+        return [sys.executable, "-c", "import time; time.sleep(60)", "-stats"]
+
+    async def download_all(sources, targets, workers, on_complete, **kwargs):
+        with open(targets[0], "w") as f:
+            f.write("<0>")
+        on_complete(0)
+        await asyncio.sleep(0.01)
+        raise httpx.ConnectError("failed")
+
+    monkeypatch.setattr(asyncio, "create_subprocess_exec", create_process)
+    monkeypatch.setattr(download, "download_all", download_all)
+    monkeypatch.setattr(download, "_join_command", join_command)
+
+    job = _concurrent_join_job(tmp_path, 2)
+    with pytest.raises(httpx.ConnectError):
+        with Journal(str(tmp_path)) as journal:
+            asyncio.run(download._download_and_join(job, journal, _args(), http.RetryPolicy()))
+
+    [process] = processes
+    assert process.returncode == -signal.SIGKILL
+
+
+def test_download_and_join_all_fsyncs_each_video(tmp_path, monkeypatch):
+    jobs = []
+    for n, count in enumerate([1, 10]):
+        target_dir = tmp_path / f"job{n}"
+        target_dir.mkdir()
+        video = {"id": str(n), "title": "Foo", "creator": {"displayName": "Bar"}}
+        jobs.append(download._make_job(video, [str(tmp_path / f"out{n}.mkv")], [(None, None)],
+                                       str(target_dir), _playlist([10] * count),
+                                       f"http://x/{n}/playlist.m3u8", False))
+
+    async def handler(request):
+        await asyncio.sleep(0.01)
+        return httpx.Response(200, content=request.url.path.encode())
+
+    def make_client(workers, http2):
+        return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    synced = []
+
+    def fsync_files(paths):
+        paths = list(paths)
+        # Files of other videos may have been deleted after joining
+        assert all(os.path.exists(path) for path in paths)
+        synced.append(paths)
+
+    monkeypatch.setattr(http, "make_download_client", make_client)
+    monkeypatch.setattr(download, "fsync_files", fsync_files)
+    monkeypatch.setattr(download, "_join_command", _fake_join_command)
+
+    args = _args(retries=5, retry_backoff=1, no_join=False, keep=False, fsync="end",
+                 validate="none", hedge_budget=0, max_workers=1)
+    asyncio.run(download._download_and_join_all(jobs, args))
+
+    assert sorted(synced) == sorted(job.targets for job in jobs)
+    assert (tmp_path / "out0.mkv").exists() and (tmp_path / "out1.mkv").exists()
+    assert not (tmp_path / "job0").exists()
+
+
+def test_download_and_join_stops_when_ffmpeg_fails(tmp_path, monkeypatch):
+    cancelled = []
+
+    def join_command(source, target, overwrite, video, input_format=None):
+        return [sys.executable, "-c", "import sys; sys.exit(1)", "-stats"]
+
+    async def download_all(sources, targets, workers, on_complete, **kwargs):
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    monkeypatch.setattr(download, "download_all", download_all)
+    monkeypatch.setattr(download, "_join_command", join_command)
+
+    job = _concurrent_join_job(tmp_path, 2)
+    with pytest.raises(ConsoleError, match="Joining files failed"):
+        with Journal(str(tmp_path)) as journal:
+            asyncio.run(download._download_and_join(job, journal, _args(), http.RetryPolicy()))
+
+    assert cancelled == [True]
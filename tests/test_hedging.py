@@ -0,0 +1,79 @@
+import asyncio
+import os
+
+from twitchdl import hedging
+from twitchdl.hedging import Hedger
+from twitchdl.progress import Progress
+
+
+def _fetcher(delays, requests):
+    """Fetch which takes the given delay for each request, in order."""
+    async def fetch(progress_id, path):
+        requests.append(progress_id)
+        delay = delays.pop(0)
+        progress.start(progress_id, 100)
+        await asyncio.sleep(delay)
+        progress.advance(progress_id, 100)
+        with open(f"{path}.tmp", "w") as f:
+            f.write(str(progress_id).ljust(100))
+        progress.end(progress_id)
+        os.rename(f"{path}.tmp", path)
+
+    progress = Progress(6)
+    return progress, fetch
+
+
+def _run(tmp_path, delays, budget=None, max_active=5):
+    requests = []
+    progress, fetch = _fetcher(delays, requests)
+    hedger = Hedger(progress, 6, max_active=lambda: max_active, budget=budget)
+
+    async def run():
+        monitor = asyncio.create_task(hedger.monitor())
+        for task_id in range(6):
+            hedger.dequeued()
+        for task_id in range(5):
+            await hedger.run(task_id, str(tmp_path / f"{task_id}.ts"), fetch)
+        await hedger.run(5, str(tmp_path / "5.ts"), fetch)
+        monitor.cancel()
+
+    asyncio.run(run())
+    return hedger, progress, requests
+
+
+def test_hedges_straggler(tmp_path, monkeypatch):
+    monkeypatch.setattr(hedging, "HEDGE_INTERVAL", 0.01)
+
+    # The last VOD is slow, its hedged request finishes first
+    hedger, progress, requests = _run(tmp_path, [0.01] * 5 + [10, 0.01], budget=100)
+
+    assert requests == [0, 1, 2, 3, 4, 5, -6]
+    assert (tmp_path / "5.ts").read_text().strip() == "-6"
+    assert not list(tmp_path.glob("5.ts.*"))
+    assert hedger.hedged == hedger.won == {5}
+    assert hedger.hedged_bytes == 100
+
+    # The slow request is no longer counted
+    assert 5 not in progress.tasks
+    assert progress.vod_downloaded_count == 6
+
+
+def test_hedging_is_capped(tmp_path, monkeypatch):
+    monkeypatch.setattr(hedging, "HEDGE_INTERVAL", 0.01)
+
+    # Default budget is 5% of 600 bytes, too little for hedging a 100 byte VOD
+    hedger, _, requests = _run(tmp_path, [0.01] * 5 + [0.2])
+
+    assert requests == [0, 1, 2, 3, 4, 5]
+    assert (tmp_path / "5.ts").read_text().strip() == "5"
+    assert not hedger.hedged
+
+
+def test_hedging_respects_worker_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(hedging, "HEDGE_INTERVAL", 0.01)
+
+    # The only worker is busy with the slow VOD, so there's no room for hedging
+    hedger, _, requests = _run(tmp_path, [0.01] * 5 + [0.2], budget=100, max_active=1)
+
+    assert requests == [0, 1, 2, 3, 4, 5]
+    assert not hedger.hedged
@@ -0,0 +1,394 @@
+import asyncio
+import httpx
+import pytest
+import time
+
+from twitchdl import http
+from twitchdl.http import (
+    AUTO_WINDOW, AdaptiveSemaphore, ConnectionStats, EndlessTokenBucket, RetryPolicy, ShortRead,
+    TokenBucket, close_async_client, download, download_all, download_with_retries,
+    get_async_client, get_client,
+)
+from twitchdl.progress import Progress
+from twitchdl.validator import VALIDATE_SYNC
+
+
+def test_token_bucket_limits_rate():
+    async def run():
+        bucket = TokenBucket(1000)
+        start = time.monotonic()
+        for _ in range(5):
+            await bucket.advance(100)
+        return time.monotonic() - start
+
+    # 500 bytes at 1000 B/s, starting from an empty bucket
+    assert 0.4 < asyncio.run(run()) < 0.8
+
+
+def test_token_bucket_does_not_block_event_loop():
+    async def run():
+        bucket = TokenBucket(1000)
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        await bucket.advance(300)
+        task.cancel()
+        return ticks
+
+    assert asyncio.run(run()) > 10
+
+
+def test_token_bucket_is_fair():
+    async def run():
+        bucket = TokenBucket(10000)
+        order = []
+
+        async def worker(name):
+            for _ in range(3):
+                await bucket.advance(500)
+                order.append(name)
+
+        await asyncio.gather(worker("a"), worker("b"))
+        return order
+
+    assert asyncio.run(run()) == ["a", "b", "a", "b", "a", "b"]
+
+
+def test_token_bucket_set_rate():
+    async def run():
+        bucket = TokenBucket(100)
+        await bucket.set_rate(10000)
+        start = time.monotonic()
+        await bucket.advance(1000)
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) < 0.5
+
+
+def test_token_bucket_set_rate_while_throttled():
+    async def run():
+        bucket = TokenBucket(1000)
+        start = time.monotonic()
+
+        # Waits for the throttled chunk, then speeds up the next ones
+        throttled = asyncio.create_task(bucket.advance(200))
+        await asyncio.sleep(0.05)
+        await bucket.set_rate(100000)
+        changed = time.monotonic() - start
+
+        await throttled
+        await bucket.advance(10000)
+        return changed, time.monotonic() - start
+
+    changed, elapsed = asyncio.run(run())
+    assert changed >= 0.15
+    assert elapsed < 0.5
+
+
+def test_download_all_uses_given_token_bucket(tmp_path, monkeypatch):
+    advanced = []
+
+    class Bucket(EndlessTokenBucket):
+        async def advance(self, size):
+            advanced.append(size)
+
+    async def run():
+        targets = [str(tmp_path / f"{n:05d}.ts") for n in range(2)]
+        await download_all(["http://x/0.ts", "http://x/1.ts"], targets, 1, token_bucket=Bucket(),
+                           hedge_budget=0)
+
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, content=b"x" * 100))
+    monkeypatch.setattr(http, "make_download_client",
+                        lambda *args: httpx.AsyncClient(transport=transport))
+    asyncio.run(run())
+
+    assert advanced == [100, 100]
+
+
+def _record_window(semaphore, throughput, latency=1.0):
+    """Record a full measurement window at the given throughput."""
+    count = max(semaphore.limit, AUTO_WINDOW)
+    semaphore.window_start = time.monotonic() - 1
+    for _ in range(count):
+        semaphore.record(throughput // count, latency)
+
+
+def test_adaptive_semaphore_ramps_up_and_settles():
+    semaphore = AdaptiveSemaphore(10, initial_workers=2)
+
+    _record_window(semaphore, 1000)
+    assert semaphore.limit == 3
+    _record_window(semaphore, 1500)
+    assert semaphore.limit == 4
+    _record_window(semaphore, 1510)  # no significant improvement
+    assert semaphore.limit == 3
+    assert semaphore.settled
+
+
+def test_adaptive_semaphore_respects_ceiling():
+    semaphore = AdaptiveSemaphore(3, initial_workers=2)
+
+    _record_window(semaphore, 1000)
+    _record_window(semaphore, 2000)
+    _record_window(semaphore, 3000)
+    assert semaphore.limit == 3
+    assert semaphore.settled
+
+
+def test_adaptive_semaphore_backs_off_when_latency_grows():
+    semaphore = AdaptiveSemaphore(10, initial_workers=4)
+
+    _record_window(semaphore, 4000, latency=1.0)
+    _record_window(semaphore, 4000, latency=1.0)
+    assert semaphore.settled
+    assert semaphore.limit == 4
+
+    _record_window(semaphore, 2000, latency=3.0)
+    assert semaphore.limit == 3
+
+
+def test_adaptive_semaphore_limits_concurrency():
+    async def run():
+        semaphore = AdaptiveSemaphore(10, initial_workers=2)
+        active = 0
+        peak = 0
+
+        async def worker():
+            nonlocal active, peak
+            async with semaphore:
+                active += 1
+                peak = max(peak, active)
+                await asyncio.sleep(0.01)
+                active -= 1
+
+        await asyncio.gather(*[worker() for _ in range(10)])
+        return peak
+
+    assert asyncio.run(run()) == 2
+
+
+CONTENT = bytes(range(256)) * 40
+
+
+def _range_handler(honor_range=True):
+    def handler(request):
+        range_header = request.headers.get("range")
+        if honor_range and range_header:
+            start = int(range_header[len("bytes="):-1])
+            return httpx.Response(206, content=CONTENT[start:], headers={
+                "content-range": f"bytes {start}-{len(CONTENT) - 1}/{len(CONTENT)}",
+            })
+        return httpx.Response(200, content=CONTENT)
+
+    return handler
+
+
+def _download(tmp_path, handler):
+    async def run():
+        target = str(tmp_path / "00000.ts")
+        transport = httpx.MockTransport(handler)
+        async with httpx.AsyncClient(transport=transport) as client:
+            await download(client, 0, "http://x/0.ts", target, Progress(1), EndlessTokenBucket())
+        with open(target, "rb") as f:
+            return f.read()
+
+    return asyncio.run(run())
+
+
+def test_download_resumes_partial_file(tmp_path):
+    (tmp_path / "00000.ts.tmp").write_bytes(CONTENT[:1000])
+    requested_ranges = []
+
+    def handler(request):
+        requested_ranges.append(request.headers.get("range"))
+        return _range_handler()(request)
+
+    assert _download(tmp_path, handler) == CONTENT
+    assert requested_ranges == ["bytes=1000-"]
+
+
+def test_download_resumes_preallocated_file(tmp_path):
+    # Left behind by a process which died while writing a preallocated file
+    (tmp_path / "00000.ts.tmp").write_bytes(CONTENT[:1000] + bytes(len(CONTENT) - 1000))
+    (tmp_path / "00000.ts.tmp.offset").write_bytes(b"%020d" % 1000)
+    requested_ranges = []
+
+    def handler(request):
+        requested_ranges.append(request.headers.get("range"))
+        return _range_handler()(request)
+
+    assert _download(tmp_path, handler) == CONTENT
+    assert requested_ranges == ["bytes=1000-"]
+    assert not (tmp_path / "00000.ts.tmp.offset").exists()
+
+
+def test_download_falls_back_when_range_ignored(tmp_path):
+    (tmp_path / "00000.ts.tmp").write_bytes(CONTENT[:1000])
+    assert _download(tmp_path, _range_handler(honor_range=False)) == CONTENT
+
+
+def test_download_refetches_on_unexpected_content_range(tmp_path):
+    (tmp_path / "00000.ts.tmp").write_bytes(CONTENT[:1000])
+
+    def handler(request):
+        if request.headers.get("range"):
+            return httpx.Response(206, content=CONTENT[500:], headers={
+                "content-range": f"bytes 500-{len(CONTENT) - 1}/{len(CONTENT)}",
+            })
+        return httpx.Response(200, content=CONTENT)
+
+    assert _download(tmp_path, handler) == CONTENT
+
+
+def test_retry_policy_classifies_status_codes():
+    policy = RetryPolicy()
+
+    def status_error(status_code):
+        request = httpx.Request("GET", "http://x/0.ts")
+        response = httpx.Response(status_code, request=request)
+        return httpx.HTTPStatusError("", request=request, response=response)
+
+    assert policy.is_retryable(status_error(429))
+    assert policy.is_retryable(status_error(503))
+    assert not policy.is_retryable(status_error(403))
+    assert not policy.is_retryable(status_error(404))
+    assert policy.is_retryable(httpx.ConnectError("failed"))
+    assert policy.is_retryable(ShortRead())
+
+
+def test_retry_policy_delay():
+    policy = RetryPolicy(backoff=1, max_delay=10)
+    error = httpx.ConnectError("failed")
+
+    for attempt in range(10):
+        assert 0 <= policy.get_delay(attempt, error) <= min(2 ** attempt, 10)
+
+    request = httpx.Request("GET", "http://x/0.ts")
+    response = httpx.Response(429, request=request, headers={"retry-after": "3"})
+    error = httpx.HTTPStatusError("", request=request, response=response)
+    assert policy.get_delay(0, error) == 3
+
+    response = httpx.Response(429, request=request, headers={"retry-after": "300"})
+    error = httpx.HTTPStatusError("", request=request, response=response)
+    assert policy.get_delay(0, error) == 10
+
+
+def _download_all(tmp_path, handler, retry_policy):
+    async def run():
+        target = str(tmp_path / "00000.ts")
+        transport = httpx.MockTransport(handler)
+        async with httpx.AsyncClient(transport=transport) as client:
+            await download_with_retries(client, asyncio.Semaphore(1), 0, "http://x/0.ts", target,
+                                        Progress(1), EndlessTokenBucket(), retry_policy)
+        with open(target, "rb") as f:
+            return f.read()
+
+    return asyncio.run(run())
+
+
+def test_download_retries_throttled_and_short_responses(tmp_path):
+    responses = [
+        httpx.Response(503),
+        httpx.Response(200, content=CONTENT[:1000], headers={"content-length": str(len(CONTENT))}),
+    ]
+
+    def handler(request):
+        if responses:
+            return responses.pop(0)
+        return _range_handler()(request)
+
+    policy = RetryPolicy(retries=3, backoff=0)
+    assert _download_all(tmp_path, handler, policy) == CONTENT
+    assert not responses
+
+
+def test_download_does_not_retry_client_errors(tmp_path):
+    attempts = []
+
+    def handler(request):
+        attempts.append(request)
+        return httpx.Response(404)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        _download_all(tmp_path, handler, RetryPolicy(retries=3, backoff=0))
+
+    assert len(attempts) == 1
+
+
+def test_connection_stats():
+    async def run():
+        stats = ConnectionStats()
+        request = httpx.Request("GET", "https://x/0.ts")
+        await stats.on_request(request)
+
+        trace = request.extensions["trace"]
+        await trace("connection.connect_tcp.complete", {})
+        await trace("connection.start_tls.complete", {})
+        await trace("http11.send_request_headers.started", {})
+        await trace("http11.send_request_headers.started", {})
+        await trace("http2.send_request_headers.started", {})
+        return stats
+
+    stats = asyncio.run(run())
+    assert stats.requests == 3
+    assert stats.connections == 1
+    assert stats.tls_handshakes == 1
+
+
+def test_get_client_is_shared():
+    assert get_client() is get_client()
+
+
+def test_get_async_client_is_shared_within_loop():
+    async def run():
+        client = get_async_client()
+        assert get_async_client() is client
+        await close_async_client()
+        assert client.is_closed
+        return client
+
+    first = asyncio.run(run())
+    second = asyncio.run(run())
+    assert first is not second
+
+
+def test_download_retries_corrupt_vods(tmp_path):
+    vod = (b"\x47" + bytes(187)) * 20
+    corrupt = vod[:940] + b"x" + vod[941:]
+    responses = [httpx.Response(200, content=corrupt)]
+
+    def handler(request):
+        assert not request.headers.get("range")
+        if responses:
+            return responses.pop(0)
+        return httpx.Response(200, content=vod)
+
+    async def run():
+        target = str(tmp_path / "00000.ts")
+        transport = httpx.MockTransport(handler)
+        async with httpx.AsyncClient(transport=transport) as client:
+            await download_with_retries(client, asyncio.Semaphore(1), 0, "http://x/0.ts", target,
+                                        Progress(1), EndlessTokenBucket(), RetryPolicy(retries=2),
+                                        validation=VALIDATE_SYNC)
+        with open(target, "rb") as f:
+            return f.read()
+
+    assert asyncio.run(run()) == vod
+    assert not responses
+
+
+def test_download_without_content_length(tmp_path):
+    async def chunks():
+        yield CONTENT[:1000]
+        yield CONTENT[1000:]
+
+    def handler(request):
+        return httpx.Response(200, content=chunks())
+
+    assert _download(tmp_path, handler) == CONTENT
@@ -0,0 +1,57 @@
+from twitchdl.journal import Journal
+
+
+def test_journal_records_completed_vods(tmp_path):
+    (tmp_path / "00000.ts").write_bytes(b"foo")
+    (tmp_path / "00001.ts").write_bytes(b"bar")
+
+    with Journal(str(tmp_path)) as journal:
+        journal.start({"id": "1"})
+        journal.record("0.ts", str(tmp_path / "00000.ts"))
+        journal.record("1.ts", str(tmp_path / "00001.ts"))
+
+    journal = Journal(str(tmp_path))
+    assert journal.job == {"id": "1"}
+    assert journal.completed["0.ts"]["size"] == 3
+    assert journal.is_completed("1.ts", str(tmp_path / "00001.ts"))
+
+    # Downloaded to a different target, e.g. when ranges changed
+    assert not journal.is_completed("1.ts", str(tmp_path / "00000.ts"))
+    assert not journal.is_completed("2.ts", str(tmp_path / "00002.ts"))
+
+    # Target was truncated or removed after being recorded
+    (tmp_path / "00001.ts").write_bytes(b"b")
+    assert not journal.is_completed("1.ts", str(tmp_path / "00001.ts"))
+    (tmp_path / "00001.ts").unlink()
+    assert not journal.is_completed("1.ts", str(tmp_path / "00001.ts"))
+
+
+def test_journal_ignores_incomplete_record(tmp_path):
+    (tmp_path / "00000.ts").write_bytes(b"foo")
+    with Journal(str(tmp_path)) as journal:
+        journal.start({"id": "1"})
+        journal.record("0.ts", str(tmp_path / "00000.ts"))
+
+    # Interrupted while writing a record
+    with open(tmp_path / "journal.jsonl", "a") as f:
+        f.write('{"type": "vod", "path": "1.ts", "tar')
+
+    with Journal(str(tmp_path)) as journal:
+        assert list(journal.completed) == ["0.ts"]
+        journal.record("0.ts", str(tmp_path / "00000.ts"))
+
+    # Later records are not lost after the incomplete one
+    assert Journal(str(tmp_path)).job == {"id": "1"}
+    assert len(Journal(str(tmp_path)).completed) == 1
+    assert len((tmp_path / "journal.jsonl").read_text().splitlines()) == 4
+
+
+def test_journal_records_job_once(tmp_path):
+    with Journal(str(tmp_path)) as journal:
+        journal.start({"id": "1"})
+        journal.start({"id": "1"})
+
+    with Journal(str(tmp_path)) as journal:
+        journal.start({"id": "1"})
+
+    assert len((tmp_path / "journal.jsonl").read_text().splitlines()) == 1
@@ -0,0 +1,112 @@
+import asyncio
+import httpx
+import json
+import pytest
+
+from twitchdl.http import EndlessTokenBucket, RetryPolicy, download_with_retries
+from twitchdl.metrics import (
+    FORMAT_PROMETHEUS, STATUS_DOWNLOADED, STATUS_EXISTING, STATUS_FAILED, Metrics, VodMetrics)
+from twitchdl.progress import Progress
+
+CONTENT = b"x" * 1000
+
+
+def _run(metrics):
+    run = metrics.start_run(workers=5)
+    run.vods.extend([
+        VodMetrics("http://x/0.ts", queue_wait=0.01, ttfb=0.2, transfer_time=1.5,
+                   write_time=0.1, bytes=1000, status=STATUS_DOWNLOADED),
+        VodMetrics("http://x/1.ts", queue_wait=0.5, ttfb=3.0, transfer_time=4.0,
+                   bytes=500, retries=2, hedged=True, status=STATUS_DOWNLOADED),
+        VodMetrics("http://x/2.ts", queue_wait=0.02, status=STATUS_EXISTING),
+        VodMetrics("http://x/3.ts"),
+    ])
+    run.hedge_wins = 1
+    metrics.end_run(run)
+
+
+def test_writes_json_lines(tmp_path):
+    path = tmp_path / "metrics.jsonl"
+    metrics = Metrics(str(path))
+    _run(metrics)
+    _run(metrics)
+
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [record["type"] for record in records] == ["vod"] * 4 + ["run"] + ["vod"] * 4 + ["run"]
+    assert records[1]["url"] == "http://x/1.ts"
+    assert records[1]["retries"] == 2
+    assert records[3]["status"] == "cancelled"
+
+    run = records[4]
+    assert run["vods"] == 4
+    assert run["statuses"] == {"downloaded": 2, "existing": 1, "cancelled": 1}
+    assert run["bytes"] == 1500
+    assert run["retries"] == 2
+    assert run["hedged"] == 1
+    assert run["hedge_wins"] == 1
+    assert run["workers"] == 5
+
+
+def test_writes_prometheus_textfile(tmp_path):
+    path = tmp_path / "twitchdl.prom"
+    metrics = Metrics(str(path), FORMAT_PROMETHEUS)
+    _run(metrics)
+    _run(metrics)
+
+    lines = path.read_text().splitlines()
+    assert 'twitchdl_vods_total{status="downloaded"} 4' in lines
+    assert 'twitchdl_vods_total{status="cancelled"} 2' in lines
+    assert "twitchdl_vod_bytes_total 3000" in lines
+    assert "twitchdl_vod_retries_total 4" in lines
+    assert 'twitchdl_vod_ttfb_seconds_bucket{le="0.25"} 2' in lines
+    assert 'twitchdl_vod_ttfb_seconds_bucket{le="2.5"} 2' in lines
+    assert 'twitchdl_vod_ttfb_seconds_bucket{le="+Inf"} 4' in lines
+    assert "twitchdl_vod_ttfb_seconds_count 4" in lines
+    assert "twitchdl_runs_total 2" in lines
+    assert "# TYPE twitchdl_vod_transfer_seconds histogram" in lines
+    assert not (tmp_path / "twitchdl.prom.tmp").exists()
+
+
+def _download(tmp_path, handler, vod_metrics, retries=3):
+    async def run():
+        transport = httpx.MockTransport(handler)
+        async with httpx.AsyncClient(transport=transport) as client:
+            await download_with_retries(client, asyncio.Semaphore(1), 0, "http://x/0.ts",
+                                        str(tmp_path / "00000.ts"), Progress(1),
+                                        EndlessTokenBucket(), RetryPolicy(retries, backoff=0),
+                                        vod_metrics=vod_metrics)
+
+    asyncio.run(run())
+
+
+def test_download_records_vod_metrics(tmp_path):
+    responses = [httpx.Response(503)]
+
+    def handler(request):
+        return responses.pop(0) if responses else httpx.Response(200, content=CONTENT)
+
+    vod_metrics = VodMetrics("http://x/0.ts")
+    _download(tmp_path, handler, vod_metrics)
+
+    assert vod_metrics.status == STATUS_DOWNLOADED
+    assert vod_metrics.retries == 1
+    assert vod_metrics.bytes == len(CONTENT)
+    assert vod_metrics.queue_wait is not None
+    assert vod_metrics.ttfb is not None
+    assert vod_metrics.transfer_time is not None
+
+    # Already downloaded
+    vod_metrics = VodMetrics("http://x/0.ts")
+    _download(tmp_path, handler, vod_metrics)
+    assert vod_metrics.status == STATUS_EXISTING
+    assert vod_metrics.bytes == 0
+
+
+def test_download_records_failure(tmp_path):
+    vod_metrics = VodMetrics("http://x/0.ts")
+    with pytest.raises(httpx.HTTPStatusError):
+        _download(tmp_path, lambda request: httpx.Response(503), vod_metrics, retries=2)
+
+    assert vod_metrics.status == STATUS_FAILED
+    assert vod_metrics.retries == 1
+    assert "503" in vod_metrics.error
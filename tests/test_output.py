@@ -0,0 +1,87 @@
+import io
+import json
+import sys
+
+from twitchdl import twitch
+from twitchdl.console import get_parser
+from twitchdl.output import print_json_lines
+
+
+class FlushRecorder(io.StringIO):
+    """Records output which has been flushed."""
+    def __init__(self):
+        super().__init__()
+        self.flushed = ""
+
+    def flush(self):
+        self.flushed = self.getvalue()
+
+
+def _pages(stdout, page_size, page_count):
+    """Yield pages of items, checking previous pages were flushed before each new one."""
+    for page in range(page_count):
+        lines = stdout.flushed.splitlines()
+        assert [json.loads(line)["n"] for line in lines] == list(range(page * page_size))
+        for n in range(page * page_size, (page + 1) * page_size):
+            yield {"n": n, "title": f"Item {n}"}
+
+
+def test_print_json_lines(monkeypatch):
+    stdout = FlushRecorder()
+    monkeypatch.setattr(sys, "stdout", stdout)
+
+    print_json_lines(_pages(stdout, 3, 3), 3)
+
+    lines = stdout.getvalue().splitlines()
+    assert [json.loads(line) for line in lines] == [
+        {"n": n, "title": f"Item {n}"} for n in range(9)
+    ]
+    assert stdout.flushed == stdout.getvalue()
+
+
+def test_print_json_lines_flushes_partial_page(monkeypatch):
+    stdout = FlushRecorder()
+    monkeypatch.setattr(sys, "stdout", stdout)
+
+    print_json_lines(iter([{"n": 0}, {"n": 1}]), 10)
+
+    assert stdout.flushed == '{"n": 0}\n{"n": 1}\n'
+
+
+def _run(argv):
+    args = get_parser().parse_args(argv)
+    args.func(args)
+
+
+def test_videos_json_lines(monkeypatch):
+    stdout = FlushRecorder()
+    monkeypatch.setattr(sys, "stdout", stdout)
+    monkeypatch.setattr(twitch, "PAGE_SIZE", 2)
+
+    def channel_videos_generator(channel_name, max_videos, sort, type, game_ids=None):
+        assert channel_name == "foo"
+        return 6, _pages(stdout, 2, 3)
+
+    monkeypatch.setattr(twitch, "channel_videos_generator", channel_videos_generator)
+    _run(["videos", "foo", "--json-lines", "--all"])
+
+    lines = stdout.getvalue().splitlines()
+    assert [json.loads(line)["n"] for line in lines] == list(range(6))
+    assert stdout.flushed == stdout.getvalue()
+
+
+def test_clips_json_lines(monkeypatch):
+    stdout = FlushRecorder()
+    monkeypatch.setattr(sys, "stdout", stdout)
+    monkeypatch.setattr(twitch, "PAGE_SIZE", 2)
+
+    def channel_clips_generator(channel_name, period, limit):
+        assert channel_name == "foo"
+        return _pages(stdout, 2, 3)
+
+    monkeypatch.setattr(twitch, "channel_clips_generator", channel_clips_generator)
+    _run(["clips", "foo", "--json-lines", "--all"])
+
+    lines = stdout.getvalue().splitlines()
+    assert [json.loads(line)["n"] for line in lines] == list(range(6))
+    assert stdout.flushed == stdout.getvalue()
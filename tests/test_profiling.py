@@ -0,0 +1,42 @@
+import asyncio
+import pstats
+import time
+
+from twitchdl import profiling
+from twitchdl.profiling import Profiler
+
+
+def _blocking_work():
+    time.sleep(0.2)
+
+
+def test_profiler_reports_event_loop_stalls(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "_profiler", None)
+    path = str(tmp_path / "twitch-dl.prof")
+    profiler = Profiler(path)
+    profiler.start()
+
+    async def run():
+        sampler = profiler.lag_sampler()
+        sampling = asyncio.create_task(sampler.run())
+        await asyncio.sleep(0.05)
+        _blocking_work()
+        await asyncio.sleep(0.05)
+        sampling.cancel()
+
+    asyncio.run(run())
+    profiler.stop()
+
+    assert "_blocking_work" in str(pstats.Stats(path).stats)
+
+    [stall] = profiler.samplers[0].stalls
+    assert stall.lag >= 0.15
+
+    summary = profiler.summary()
+    assert "1 stalls over 50.0ms, worst ones:" in summary
+    assert "time.sleep" in summary
+
+
+def test_no_sampler_unless_profiling(monkeypatch):
+    monkeypatch.setattr(profiling, "_profiler", None)
+    assert profiling.lag_sampler() is None
@@ -1,3 +1,5 @@
+import time
+
 from twitchdl.progress import Progress
 
 
@@ -100,3 +102,76 @@ def test_vod_downloaded_count():
     progress.advance(3, 100)
     progress.end(3)
     assert progress.vod_downloaded_count == 3
+
+
+def test_resumed():
+    progress = Progress(2)
+
+    progress.start(1, 300, 100)
+    assert progress.downloaded == 0
+    assert progress.progress_bytes == 100
+
+    progress.advance(1, 200)
+    assert progress.downloaded == 200
+    assert progress.progress_bytes == 300
+
+    progress.abort(1)
+    assert progress.progress_bytes == 0
+
+
+def test_speed(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(time, "time", lambda: now)
+
+    progress = Progress(2)
+    progress.bucket_start = now
+    progress.start(1, 10000)
+    progress.start(2, 10000)
+
+    progress.advance(1, 500)
+    assert progress.speed is None
+
+    now += 0.5
+    progress.advance(2, 500)
+    assert progress.speed == 2000
+    assert progress.remaining_time == 9
+
+    now += 1
+    progress.advance(1, 4000)
+    assert progress.speed == 0.3 * 4000 + 0.7 * 2000
+
+
+def test_many_tasks():
+    count = 20000
+    progress = Progress(count)
+
+    start = time.perf_counter()
+    for task_id in range(count):
+        progress.start(task_id, 1000)
+        for _ in range(4):
+            progress.advance(task_id, 250)
+        if task_id % 10 == 0:
+            progress.abort(task_id)
+            progress.start(task_id, 1000)
+            progress.advance(task_id, 1000)
+        progress.end(task_id)
+    duration = time.perf_counter() - start
+
+    assert progress.estimated_total == count * 1000
+    assert progress.progress_bytes == count * 1000
+    assert progress.progress_perc == 100
+    assert progress.vod_downloaded_count == count
+
+    # Quadratic bookkeeping would take minutes
+    assert duration < 10
+
+
+def test_set_size():
+    progress = Progress(1)
+
+    # Size is not known until the task is done
+    progress.start(1, 0)
+    progress.advance(1, 300)
+    progress.set_size(1, 300)
+    assert progress.total_size == 300
+    assert progress.estimated_total == 300
@@ -0,0 +1,67 @@
+import os
+
+from twitchdl.segment_cache import SegmentCache
+
+VIDEO = {"id": "123", "title": "Test video"}
+BASE_URI = "https://cdn.example.com/abc_chan_123/chunked/"
+
+
+def _write_targets(directory, names):
+    directory.mkdir(exist_ok=True)
+    targets = []
+    for name in names:
+        target = directory / name
+        target.write_bytes(name.encode() * 100)
+        targets.append(str(target))
+    return targets
+
+
+def test_store_and_restore(tmp_path):
+    cache = SegmentCache(str(tmp_path / "cache"))
+    targets = _write_targets(tmp_path / "first", ["00000.ts", "00001.ts"])
+    cache.store(VIDEO, BASE_URI, ["0.ts", "1.ts"], targets)
+
+    # Overlapping range, with the CDN host differing between runs
+    second = tmp_path / "second"
+    second.mkdir()
+    targets = [str(second / "00000.ts"), str(second / "00001.ts")]
+    base_uri = BASE_URI.replace("cdn", "other-cdn")
+    assert cache.restore(VIDEO, base_uri, ["1.ts", "2.ts"], targets) == 1
+
+    with open(targets[0], "rb") as f:
+        assert f.read() == b"00001.ts" * 100
+    assert not os.path.exists(targets[1])
+
+
+def test_list(tmp_path):
+    cache = SegmentCache(str(tmp_path / "cache"))
+    targets = _write_targets(tmp_path / "vods", ["00000.ts", "00001.ts"])
+    cache.store(VIDEO, BASE_URI, ["0.ts", "1.ts"], targets)
+
+    [video] = cache.list()
+    assert video.video_id == "123"
+    assert video.title == "Test video"
+    assert video.quality_path == "/abc_chan_123/chunked/"
+    assert video.segment_count == 2
+    assert video.size == 1600
+
+
+def test_prune_evicts_least_recently_used(tmp_path):
+    cache = SegmentCache(str(tmp_path / "cache"))
+    targets = _write_targets(tmp_path / "vods", ["00000.ts", "00001.ts", "00002.ts"])
+    cache.store(VIDEO, BASE_URI, ["0.ts", "1.ts", "2.ts"], targets)
+
+    video_dir = cache._video_dir(VIDEO, BASE_URI)
+    for n, vod_path in enumerate(["1.ts", "0.ts", "2.ts"]):
+        mtime = 1000 + n
+        os.utime(cache._segment_path(video_dir, vod_path), (mtime, mtime))
+
+    assert cache.prune(1600) == 800
+    restore_dir = tmp_path / "restore"
+    restore_dir.mkdir()
+    restore_targets = [str(restore_dir / name) for name in ["a.ts", "b.ts", "c.ts"]]
+    assert cache.restore(VIDEO, BASE_URI, ["0.ts", "1.ts", "2.ts"], restore_targets) == 2
+    assert not os.path.exists(restore_targets[1])
+
+    assert cache.prune(0) == 1600
+    assert cache.list() == []
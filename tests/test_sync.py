@@ -0,0 +1,98 @@
+import sys
+
+from argparse import Namespace
+
+from twitchdl import twitch
+from twitchdl.commands.sync import _list_new_videos, sync
+from twitchdl.exceptions import ConsoleError, OutputExists
+from twitchdl.http import ShortRead
+from twitchdl.sync_state import SyncState
+
+
+def _video(id, published_at="2022-01-01T00:00:00Z"):
+    return {"id": id, "title": f"Video {id}", "publishedAt": published_at}
+
+
+def _mock_channel(monkeypatch, videos):
+    listed = []
+
+    def generator():
+        for video in videos:
+            listed.append(video["id"])
+            yield video
+
+    def channel_videos_generator(channel_name, max_videos, sort, type):
+        return len(videos), generator()
+
+    monkeypatch.setattr(twitch, "channel_videos_generator", channel_videos_generator)
+    return listed
+
+
+def test_list_new_videos_stops_at_seen_video(tmp_path, monkeypatch):
+    listed = _mock_channel(monkeypatch, [_video("4"), _video("3"), _video("2"), _video("1")])
+
+    with SyncState(str(tmp_path / "sync.db")) as state:
+        state.add_seen("channel", [_video("2")])
+        new_videos = _list_new_videos("channel", "archive", state)
+
+    assert [video["id"] for video in new_videos] == ["4", "3"]
+    assert listed == ["4", "3", "2"]
+
+
+def test_sync_continues_after_failures(tmp_path, monkeypatch):
+    _mock_channel(monkeypatch, [
+        _video("3", "2022-01-03T00:00:00Z"),
+        _video("2", "2022-01-02T00:00:00Z"),
+        _video("1", "2022-01-01T00:00:00Z"),
+    ])
+
+    downloaded = []
+
+    def download_one(video_id, args, prompt=True):
+        assert not prompt
+        if video_id == "1":
+            raise ShortRead("Task 0: got 10b, expected 20b")
+        if video_id == "2":
+            raise OutputExists("File exists: 2.mkv")
+        downloaded.append(video_id)
+
+    # The module is shadowed by the sync function in twitchdl.commands
+    monkeypatch.setattr(sys.modules["twitchdl.commands.sync"], "download_one", download_one)
+
+    db = str(tmp_path / "sync.db")
+    args = Namespace(channel_name="channel", type="archive", db=db, dry_run=False,
+                     quality=None, http2=False, metrics=None, metrics_format="json-lines")
+
+    try:
+        sync(args)
+        assert False, "Expected ConsoleError"
+    except ConsoleError as e:
+        assert str(e) == "Failed downloading 1 of 3 videos"
+
+    assert downloaded == ["3"]
+    with SyncState(db) as state:
+        # Existing output counts as downloaded, the failed video is retried
+        assert [video.id for video in state.pending("channel")] == ["1"]
+
+
+def test_list_new_videos_query(tmp_path, monkeypatch):
+    queries = []
+
+    def gql_query(query, headers={}):
+        queries.append(query)
+        return {"data": {"user": {"videos": {
+            "totalCount": 2,
+            "pageInfo": {"hasNextPage": False},
+            "edges": [{"cursor": "1", "node": _video("2")}, {"cursor": "2", "node": _video("1")}],
+        }}}}
+
+    monkeypatch.setattr(twitch, "gql_query", gql_query)
+
+    with SyncState(str(tmp_path / "sync.db")) as state:
+        new_videos = _list_new_videos("channel", "archive", state)
+
+    assert [video["id"] for video in new_videos] == ["2", "1"]
+    [query] = queries
+    assert "gameIDs: []" in query
+    assert "type: ARCHIVE" in query
+    assert "sort: TIME" in query
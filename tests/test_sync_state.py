@@ -0,0 +1,25 @@
+from twitchdl.sync_state import SyncState
+
+
+def _video(id, published_at):
+    return {"id": id, "title": f"Video {id}", "publishedAt": published_at}
+
+
+def test_sync_state(tmp_path):
+    path = str(tmp_path / "sync.db")
+
+    with SyncState(path) as state:
+        state.add_seen("Channel", [
+            _video("2", "2022-01-02T00:00:00Z"),
+            _video("1", "2022-01-01T00:00:00Z"),
+        ])
+        state.add_seen("other", [_video("3", "2022-01-03T00:00:00Z")])
+        state.mark_completed("1")
+
+    with SyncState(path) as state:
+        assert state.seen_ids("channel") == {"1", "2"}
+        assert [video.id for video in state.pending("channel")] == ["2"]
+
+        # Seeing a video again does not reset its state
+        state.add_seen("channel", [_video("1", "2022-01-01T00:00:00Z")])
+        assert [video.id for video in state.pending("channel")] == ["2"]
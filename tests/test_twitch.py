@@ -0,0 +1,114 @@
+import pytest
+import re
+import threading
+
+from twitchdl import twitch
+from twitchdl.twitch import _paginate
+
+
+def _page(start, count, total):
+    end = min(start + count, total)
+    return {
+        "edges": [{"cursor": str(n), "node": n} for n in range(start, end)],
+        "pageInfo": {"hasNextPage": end < total},
+    }
+
+
+def _fetcher(total, requests):
+    def fetch_page(limit, cursor):
+        requests.append((limit, cursor))
+        return _page(int(cursor) + 1, limit, total)
+
+    return fetch_page
+
+
+def test_paginate_all():
+    requests = []
+    nodes = list(_paginate(_page(0, 100, 250), _fetcher(250, requests), 1000))
+    assert nodes == list(range(250))
+    assert requests == [(100, "99"), (100, "199")]
+
+
+def test_paginate_limit():
+    requests = []
+    nodes = list(_paginate(_page(0, 100, 1000), _fetcher(1000, requests), 150))
+    assert nodes == list(range(150))
+    assert requests == [(50, "99")]
+
+
+def test_paginate_prefetches_next_page():
+    fetched = threading.Event()
+
+    def fetch_page(limit, cursor):
+        fetched.set()
+        return _page(int(cursor) + 1, limit, 200)
+
+    generator = _paginate(_page(0, 100, 200), fetch_page, 1000)
+    assert next(generator) == 0
+    assert fetched.wait(timeout=1)
+    generator.close()
+
+
+def test_paginate_raises_fetch_errors():
+    def fetch_page(limit, cursor):
+        raise ValueError("failed")
+
+    generator = _paginate(_page(0, 10, 20), fetch_page, 1000)
+    assert list(next(generator) for _ in range(10)) == list(range(10))
+    with pytest.raises(ValueError):
+        next(generator)
+
+
+class _Response:
+    def __init__(self, data):
+        self.data = data
+
+    def json(self):
+        return self.data
+
+
+def _mock_post(monkeypatch, respond):
+    requests = []
+
+    def authenticated_post(url, data=None, json=None, headers={}):
+        requests.append(json)
+        return _Response(respond(json))
+
+    monkeypatch.setattr(twitch, "authenticated_post", authenticated_post)
+    return requests
+
+
+def test_gql_query_aliased_maps_results_to_items(monkeypatch):
+    monkeypatch.setattr(twitch, "GQL_BATCH_SIZE", 2)
+
+    def respond(json):
+        # Each line is "itemN: item(id: "X")", respond with the ID of each item
+        fields = re.findall(r'(item\d+): item\(id: "(\w+)"\)', json["query"])
+        return {"data": {alias: {"id": item} for alias, item in fields}}
+
+    requests = _mock_post(monkeypatch, respond)
+    results = twitch.gql_query_aliased(lambda item: f'item(id: "{item}")', ["a", "b", "c", "a"])
+
+    assert results == {"a": {"id": "a"}, "b": {"id": "b"}, "c": {"id": "c"}}
+    assert len(requests) == 2
+
+
+def test_gql_batch_splits_operations(monkeypatch):
+    monkeypatch.setattr(twitch, "GQL_BATCH_SIZE", 2)
+
+    def respond(operations):
+        return [{"data": {"clip": {"slug": operation["variables"]["slug"]}}}
+                for operation in operations]
+
+    requests = _mock_post(monkeypatch, respond)
+    tokens = twitch.get_clip_access_tokens(["foo", "bar", "baz"])
+
+    assert tokens == {slug: {"slug": slug} for slug in ["foo", "bar", "baz"]}
+    assert [len(operations) for operations in requests] == [2, 1]
+
+
+def test_gql_batch_raises_errors(monkeypatch):
+    _mock_post(monkeypatch, lambda operations: [{"data": {}}, {"errors": ["failed"]}])
+
+    with pytest.raises(twitch.GQLError):
+        twitch.gql_batch([{}, {}])
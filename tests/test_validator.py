@@ -0,0 +1,64 @@
+import pytest
+
+from twitchdl.validator import VALIDATE_CONTINUITY, VALIDATE_NONE, InvalidVod, VodValidator
+
+
+def _packet(pid=0x100, counter=0, payload=True, discontinuity=False):
+    adaptation = discontinuity
+    byte3 = (0x20 if adaptation else 0) | (0x10 if payload else 0) | counter
+    header = bytes([0x47, pid >> 8, pid & 0xFF, byte3])
+    if adaptation:
+        header += bytes([1, 0x80 if discontinuity else 0])
+    return header + bytes(188 - len(header))
+
+
+def _feed(validator, data, chunk_size=100):
+    for start in range(0, len(data), chunk_size):
+        validator.feed(data[start:start + chunk_size])
+    validator.finish()
+
+
+def test_accepts_valid_packets_split_across_chunks():
+    data = b"".join(_packet(counter=n % 16) for n in range(40))
+    _feed(VodValidator(VALIDATE_CONTINUITY), data)
+
+
+def test_detects_missing_sync_byte():
+    data = bytearray(_packet() * 10)
+    data[188 * 7] = 0
+
+    with pytest.raises(InvalidVod, match="offset 1316"):
+        _feed(VodValidator(), bytes(data))
+
+
+def test_detects_partial_packet():
+    with pytest.raises(InvalidVod, match="partial packet of 88 bytes"):
+        _feed(VodValidator(), _packet() * 2 + _packet()[:88])
+
+
+def test_detects_continuity_errors():
+    data = _packet(counter=0) + _packet(counter=1) + _packet(counter=3)
+
+    # Only checked when asked for
+    _feed(VodValidator(), data)
+
+    with pytest.raises(InvalidVod, match="PID 256 at offset 376 is 3, expected 2"):
+        _feed(VodValidator(VALIDATE_CONTINUITY), data)
+
+
+def test_continuity_allows_duplicates_and_discontinuities():
+    data = b"".join([
+        _packet(counter=14),
+        _packet(counter=15),
+        _packet(counter=15),  # Duplicate
+        _packet(counter=0),  # Wraps around
+        _packet(counter=0, payload=False),  # No payload, not incremented
+        _packet(counter=7, discontinuity=True),
+        _packet(pid=0x101, counter=5),  # Counted separately for each PID
+        _packet(counter=8),
+    ])
+    _feed(VodValidator(VALIDATE_CONTINUITY), data)
+
+
+def test_validation_disabled():
+    _feed(VodValidator(VALIDATE_NONE), b"foo")
@@ -0,0 +1,80 @@
+import os
+import pytest
+
+from twitchdl.writer import FSYNC_VOD, OFFSET_SUFFIX, VodWriter, WriteOptions, written_length
+
+
+def test_coalesces_writes(tmp_path):
+    path = str(tmp_path / "vod.ts")
+    options = WriteOptions(buffer_size=100)
+
+    with VodWriter(path, 250, 0, options) as writer:
+        writer.write(b"a" * 60)
+        assert writer.written == 0
+        writer.write(b"b" * 60)
+        assert writer.written == 120
+        writer.write(b"c" * 70)
+        assert writer.written == 120
+
+    assert writer.written == 190
+    with open(path, "rb") as f:
+        assert f.read() == b"a" * 60 + b"b" * 60 + b"c" * 70
+
+
+def test_truncates_preallocated_space_on_failure(tmp_path):
+    path = str(tmp_path / "vod.ts")
+
+    with pytest.raises(ValueError):
+        with VodWriter(path, 1000, 0, WriteOptions()) as writer:
+            writer.write(b"a" * 100)
+            raise ValueError()
+
+    assert os.path.getsize(path) == 100
+
+
+def test_resumes_at_offset(tmp_path):
+    path = str(tmp_path / "vod.ts")
+    with open(path, "wb") as f:
+        f.write(b"a" * 100)
+
+    with VodWriter(path, 200, 100, WriteOptions(fsync=FSYNC_VOD)) as writer:
+        writer.write(b"b" * 100)
+
+    with open(path, "rb") as f:
+        assert f.read() == b"a" * 100 + b"b" * 100
+
+
+@pytest.mark.skipif(not hasattr(os, "posix_fallocate"), reason="Preallocation not supported")
+def test_records_written_length_of_preallocated_file(tmp_path):
+    path = str(tmp_path / "vod.ts")
+
+    writer = VodWriter(path, 1000, 0, WriteOptions(buffer_size=100))
+    writer.write(b"a" * 150)
+    writer.write(b"b" * 50)
+
+    # Simulate the process dying before the writer is closed, losing the buffer
+    writer.file.close()
+    os.close(writer.offset_fd)
+    assert os.path.getsize(path) == 1000
+    assert written_length(path) == 150
+
+    with VodWriter(path, 1000, written_length(path), WriteOptions()) as writer:
+        writer.write(b"c" * 100)
+
+    assert not os.path.exists(path + OFFSET_SUFFIX)
+    assert written_length(path) == 250
+    with open(path, "rb") as f:
+        assert f.read() == b"a" * 150 + b"c" * 100
+
+
+def test_written_length(tmp_path):
+    path = str(tmp_path / "vod.ts")
+    assert written_length(path) == 0
+
+    with open(path, "wb") as f:
+        f.write(b"a" * 100)
+    assert written_length(path) == 100
+
+    with open(path + OFFSET_SUFFIX, "wb") as f:
+        f.write(b"60")
+    assert written_length(path) == 60
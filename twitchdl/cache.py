@@ -0,0 +1,201 @@
+"""
+On-disk cache for responses from the Twitch API.
+
+Each entry is stored as a JSON file in the cache directory. Entries expire
+after a time to live which depends on the kind of entry. When the cache grows
+over the size limit, least recently used entries are evicted.
+"""
+
+import atexit
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+MAX_SIZE = 20 * 1024 * 1024
+"""Maximum total size of cached entries in bytes"""
+
+VIDEO = "video"
+CLIP_ACCESS_TOKEN = "clip_access_token"
+ACCESS_TOKEN = "access_token"
+PLAYLISTS = "playlists"
+GAME_ID = "game_id"
+
+TOKEN_EXPIRY_MARGIN = 60
+"""Seconds before expiry when an access token is no longer used from the cache"""
+
+
+def _token_ttl(token: dict) -> Optional[float]:
+    """Access tokens are cached until they expire."""
+    try:
+        expires = json.loads(token["value"])["expires"]
+    except (KeyError, TypeError, ValueError):
+        return None
+    return expires - time.time() - TOKEN_EXPIRY_MARGIN
+
+
+def _clip_access_token_ttl(clip: dict) -> Optional[float]:
+    return _token_ttl(clip.get("playbackAccessToken") or {})
+
+
+TTL: Dict[str, Callable[[Any], Optional[float]]] = {
+    VIDEO: lambda _: 3600,
+    CLIP_ACCESS_TOKEN: _clip_access_token_ttl,
+    ACCESS_TOKEN: _token_ttl,
+    PLAYLISTS: lambda _: 3600,
+    GAME_ID: lambda _: 7 * 24 * 3600,
+}
+"""Number of seconds to keep each kind of entry, given the cached value"""
+
+
+def cache_dir() -> str:
+    """Base directory for all data cached by twitch-dl."""
+    base = os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "twitch-dl")
+
+
+def default_path() -> str:
+    return os.path.join(cache_dir(), "metadata")
+
+
+class Cache:
+    def __init__(self, path: str, enabled: bool = True, refresh: bool = False,
+                 max_size: int = MAX_SIZE):
+        self.path = path
+        self.enabled = enabled
+        self.refresh = refresh
+        self.max_size = max_size
+        self.modified = False
+
+    def get(self, kind: str, key: str) -> Optional[Any]:
+        if not self.enabled or self.refresh:
+            return None
+
+        path = self._entry_path(kind, key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if entry["expires"] < time.time():
+            self._remove(path)
+            return None
+
+        # Access time is used for evicting least recently used entries
+        os.utime(path)
+        return entry["value"]
+
+    def set(self, kind: str, key: str, value: Any):
+        ttl = TTL[kind](value)
+        if not self.enabled or value is None or not ttl or ttl <= 0:
+            return
+
+        os.makedirs(self.path, mode=0o700, exist_ok=True)
+        entry = {"expires": time.time() + ttl, "value": value}
+
+        # Write to a temp file and rename, so concurrent readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, self._entry_path(kind, key))
+        self.modified = True
+
+    def cached(self, kind: str, key: str, fetch: Callable[[], Any]) -> Any:
+        """Return the cached value, or fetch and cache it."""
+        value = self.get(kind, key)
+        if value is None:
+            value = fetch()
+            self.set(kind, key, value)
+        return value
+
+    def cached_many(
+        self,
+        kind: str,
+        keys: Iterable[str],
+        fetch: Callable[[List[str]], Dict[str, Any]],
+    ) -> Dict[str, Any]:
+        """Return cached values for given keys, fetching missing ones in one call."""
+        values, missing = self._get_many(kind, keys)
+        if missing:
+            fetched = fetch(missing)
+            self._set_many(kind, fetched)
+            values.update(fetched)
+        return values
+
+    async def cached_many_async(self, kind: str, keys: Iterable[str], fetch) -> Dict[str, Any]:
+        values, missing = self._get_many(kind, keys)
+        if missing:
+            fetched = await fetch(missing)
+            self._set_many(kind, fetched)
+            values.update(fetched)
+        return values
+
+    def prune(self):
+        """Evict least recently used entries until the cache is under the size limit."""
+        try:
+            names = os.listdir(self.path)
+        except FileNotFoundError:
+            return
+
+        entries = []
+        for name in names:
+            path = os.path.join(self.path, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            self._remove(path)
+            total_size -= size
+
+    def _get_many(self, kind, keys):
+        values = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            value = self.get(kind, key)
+            if value is None:
+                missing.append(key)
+            else:
+                values[key] = value
+        return values, missing
+
+    def _set_many(self, kind, values):
+        for key, value in values.items():
+            self.set(kind, key, value)
+
+    def _entry_path(self, kind: str, key: str) -> str:
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.path, f"{kind}-{digest}.json")
+
+    def _remove(self, path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+_cache = Cache(default_path(), enabled=False)
+
+
+def configure(enabled: bool, refresh: bool = False, path: Optional[str] = None):
+    global _cache
+    _cache = Cache(path or default_path(), enabled, refresh)
+    atexit.register(_prune)
+
+
+def get_cache() -> Cache:
+    return _cache
+
+
+def _prune():
+    if _cache.modified:
+        _cache.prune()
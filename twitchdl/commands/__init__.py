@@ -1,13 +1,17 @@
+from .cache import cache
 from .clips import clips
 from .download import download
 from .env import env
 from .info import info
+from .sync import sync
 from .videos import videos
 
 __all__ = [
+    cache,
     clips,
     download,
     env,
     info,
+    sync,
     videos,
 ]
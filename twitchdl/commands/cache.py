@@ -0,0 +1,31 @@
+from twitchdl import segment_cache, utils
+from twitchdl.output import print_out
+
+
+def cache(args):
+    segments = segment_cache.SegmentCache(segment_cache.default_path())
+
+    if args.clear or args.prune:
+        max_size = 0 if args.clear else args.max_size
+        freed = segments.prune(max_size)
+        print_out("Removed <blue>{}</blue> from the segment cache".format(utils.format_size(freed)))
+        return
+
+    videos = segments.list()
+    if not videos:
+        print_out("<yellow>Segment cache is empty</yellow>")
+        return
+
+    for video in videos:
+        print_out("<b>{}</b> <blue>{}</blue>".format(video.video_id, video.title))
+        print_out("<dim>{}</dim>".format(video.quality_path))
+        print_out("{} VODs, {}, last used {}".format(
+            video.segment_count,
+            utils.format_size(video.size),
+            video.last_used.strftime("%Y-%m-%d %H:%M"),
+        ))
+        print_out()
+
+    total_size = sum(video.size for video in videos)
+    print_out("Total: <blue>{}</blue> in <green>{}</green>".format(
+        utils.format_size(total_size), segments.path))
@@ -1,3 +1,4 @@
+import asyncio
 import re
 import sys
 
@@ -5,9 +6,11 @@ from itertools import islice
 from os import path
 
 from twitchdl import twitch, utils
-from twitchdl.commands.download import get_clip_authenticated_url
-from twitchdl.download import download_file
-from twitchdl.output import print_out, print_clip, print_json
+from twitchdl.commands.download import clip_authenticated_url
+from twitchdl.http import EndlessTokenBucket, RetryPolicy, TokenBucket
+from twitchdl.http import close_async_client, download_with_retries, get_async_client
+from twitchdl.output import print_out, print_clip, print_json, print_json_lines
+from twitchdl.progress import Progress
 
 
 def clips(args):
@@ -16,11 +19,14 @@ def clips(args):
 
     generator = twitch.channel_clips_generator(args.channel_name, args.period, limit)
 
+    if args.json_lines:
+        return print_json_lines(generator, twitch.PAGE_SIZE)
+
     if args.json:
         return print_json(list(generator))
 
     if args.download:
-        return _download_clips(generator)
+        return _download_clips(generator, args)
 
     if args.pager:
         print(args)
@@ -58,16 +64,95 @@ def _target_filename(clip):
     return "{}.{}".format(name, ext)
 
 
-def _download_clips(generator):
-    for clip in generator:
-        target = _target_filename(clip)
-
-        if path.exists(target):
-            print_out("Already downloaded: <green>{}</green>".format(target))
-        else:
-            url = get_clip_authenticated_url(clip["slug"], "source")
-            print_out("Downloading: <yellow>{}</yellow>".format(target))
-            download_file(url, target)
+def _download_clips(generator, args):
+    asyncio.run(_download_clips_async(generator, args))
+
+
+async def _download_clips_async(generator, args):
+    """
+    Download clips in a pipeline of three concurrent stages: fetching clip
+    pages, fetching access tokens in batches and downloading the clips.
+    Queues between the stages are bounded so access tokens are not fetched
+    too far in advance of the download.
+    """
+    progress = Progress(0)
+    token_bucket = TokenBucket(args.rate_limit) if args.rate_limit else EndlessTokenBucket()
+    semaphore = asyncio.Semaphore(args.max_workers)
+    retry_policy = RetryPolicy()
+    clips = asyncio.Queue(max(args.max_workers * 2, twitch.GQL_BATCH_SIZE))
+    downloads = asyncio.Queue(args.max_workers * 2)
+
+    async def paginate():
+        loop = asyncio.get_running_loop()
+        iterator = iter(generator)
+        while True:
+            # Blocks while a page is being fetched, so run it in a thread
+            clip = await loop.run_in_executor(None, next, iterator, None)
+            if clip is None:
+                break
+            progress.vod_count += 1
+            await clips.put((progress.vod_count - 1, clip))
+
+        await clips.put(None)
+
+    async def authenticate():
+        done = False
+        while not done:
+            # Fetch access tokens for all queued clips in one request
+            batch = [await clips.get()]
+            while not clips.empty() and len(batch) < twitch.GQL_BATCH_SIZE:
+                batch.append(clips.get_nowait())
+
+            if None in batch:
+                batch.remove(None)
+                done = True
+
+            pending = []
+            for task_id, clip in batch:
+                target = _target_filename(clip)
+                if path.exists(target):
+                    progress.already_downloaded(task_id, path.getsize(target))
+                else:
+                    pending.append((task_id, clip["slug"], target))
+
+            if not pending:
+                continue
+
+            tokens = await twitch.get_clip_access_tokens_async(slug for _, slug, _ in pending)
+            for task_id, slug, target in pending:
+                url = clip_authenticated_url(slug, tokens[slug], "source")
+                await downloads.put((task_id, url, target))
+
+        for _ in range(args.max_workers):
+            await downloads.put(None)
+
+    async def download(client):
+        while True:
+            item = await downloads.get()
+            if item is None:
+                break
+
+            task_id, url, target = item
+            await download_with_retries(client, semaphore, task_id, url, target, progress,
+                                        token_bucket, retry_policy)
+
+    # Shared with access token requests, so connections are reused between them
+    client = get_async_client()
+    tasks = [
+        asyncio.create_task(paginate()),
+        asyncio.create_task(authenticate()),
+        *[asyncio.create_task(download(client)) for _ in range(args.max_workers)],
+    ]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        # Stop the remaining stages if one failed, before closing their client
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await close_async_client()
+
+    print_out("\n\nDownloaded {} clips".format(progress.vod_downloaded_count))
 
 
 def _print_all(generator, args):
@@ -1,22 +1,39 @@
 import asyncio
+import copy
 import httpx
+import importlib.util
 import m3u8
 import os
 import re
 import shutil
 import subprocess
 import tempfile
+import time
 
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
 from os import path
 from pathlib import Path
-from typing import List, Optional, OrderedDict
+from typing import Callable, List, NamedTuple, Optional, OrderedDict, Tuple
 from urllib.parse import urlparse, urlencode
 
-from twitchdl import twitch, utils
+from twitchdl import metrics, segment_cache, twitch, utils
 from twitchdl.download import download_file
-from twitchdl.exceptions import ConsoleError
-from twitchdl.http import download_all
+from twitchdl.exceptions import ConsoleError, OutputExists
+from twitchdl.http import RetryPolicy, download_all, make_download_client
+from twitchdl.http import get_client
+from twitchdl.journal import Journal
 from twitchdl.output import print_out
+from twitchdl.writer import FSYNC_END, WriteOptions, fsync_files
+
+JOIN_CHUNK_SIZE = 1024 * 1024
+"""How much of a VOD to pass to ffmpeg at a time when joining concurrently"""
+
+FOLLOW_INTERVAL = 10
+"""Seconds between polling the playlist in follow mode, unless the playlist specifies it"""
+
+TimeRange = Tuple[Optional[int], Optional[int]]
+"""Start and end of a part of the video to download in seconds, None if unbounded"""
 
 
 def _parse_playlists(playlists_m3u8):
@@ -60,10 +77,14 @@ def _select_playlist_interactive(playlists):
     return uri
 
 
-def _join_vods(playlist_path, target, overwrite, video):
-    command = [
-        "ffmpeg",
-        "-i", playlist_path,
+def _join_command(source, target, overwrite, video, input_format=None):
+    command = ["ffmpeg"]
+
+    if input_format:
+        command.extend(["-f", input_format])
+
+    command.extend([
+        "-i", source,
         "-c", "copy",
         "-metadata", "artist={}".format(video["creator"]["displayName"]),
         "-metadata", "title={}".format(video["title"]),
@@ -71,17 +92,88 @@ def _join_vods(playlist_path, target, overwrite, video):
         "-stats",
         "-loglevel", "warning",
         "file:{}".format(target),
-    ]
+    ])
 
     if overwrite:
         command.append("-y")
 
+    return command
+
+
+def _join_vods(playlist_path, target, overwrite, video):
+    command = _join_command(playlist_path, target, overwrite, video)
+
     print_out("<dim>{}</dim>".format(" ".join(command)))
     result = subprocess.run(command)
     if result.returncode != 0:
         raise ConsoleError("Joining files failed")
 
 
+async def _feed_vods(
+    stdin: asyncio.StreamWriter,
+    targets: List[str],
+    downloaded: List[asyncio.Event],
+):
+    """Write VODs to ffmpeg in playlist order, each one as soon as it's downloaded."""
+    for vod_path, event in zip(targets, downloaded):
+        await event.wait()
+        with open(vod_path, "rb") as f:
+            while True:
+                chunk = f.read(JOIN_CHUNK_SIZE)
+                if not chunk:
+                    break
+                stdin.write(chunk)
+                await stdin.drain()
+
+    stdin.close()
+    await stdin.wait_closed()
+
+
+async def _download_and_join(job, journal, args, retry_policy):
+    """
+    Download VODs and concurrently pipe them into ffmpeg, so that joining
+    finishes shortly after the last VOD is downloaded.
+    """
+    [output] = job.outputs
+    command = _join_command("pipe:0", output.target, job.overwrite, job.video,
+                            input_format="mpegts")
+    command.remove("-stats")  # Would garble the download progress output
+    print_out("<dim>{}</dim>".format(" ".join(command)))
+
+    process = await asyncio.create_subprocess_exec(*command, stdin=asyncio.subprocess.PIPE)
+    downloaded = [asyncio.Event() for _ in job.targets]
+    feeder = asyncio.create_task(_feed_vods(process.stdin, job.targets, downloaded))
+
+    async def download_and_feed():
+        await _download_vods(job, journal, args, retry_policy,
+                             on_complete=lambda n: downloaded[n].set())
+        await feeder
+
+    work = asyncio.create_task(download_and_feed())
+    joining = asyncio.create_task(process.wait())
+
+    try:
+        # Stop downloading as soon as ffmpeg fails, e.g. due to a bad target path
+        await asyncio.wait([work, joining], return_when=asyncio.FIRST_COMPLETED)
+        if not work.done() and process.returncode != 0:
+            raise ConsoleError("Joining files failed")
+        await work
+    except (BrokenPipeError, ConnectionResetError):
+        await process.wait()
+        raise ConsoleError("Joining files failed")
+    except BaseException:
+        work.cancel()
+        feeder.cancel()
+        await asyncio.gather(work, feeder, return_exceptions=True)
+        if process.returncode is None:
+            process.kill()
+        await process.wait()
+        raise
+
+    if await process.wait() != 0:
+        raise ConsoleError("Joining files failed")
+
+
 def _video_target_filename(video, args):
     date, time = video['publishedAt'].split("T")
     game = video["game"]["name"] if video["game"] else "Unknown"
@@ -137,24 +229,71 @@ def _clip_target_filename(clip, args):
         raise ConsoleError("Invalid key {} used in --output. Supported keys are: {}".format(e, supported))
 
 
-def _get_vod_paths(playlist, start: Optional[int], end: Optional[int]) -> List[str]:
-    """Extract unique VOD paths for download from playlist."""
-    files = []
-    vod_start = 0
-    for segment in playlist.segments:
-        vod_end = vod_start + segment.duration
+class Timeline:
+    """Start and end times of playlist segments, for finding segments by time."""
+
+    def __init__(self, playlist):
+        self.segments = playlist.segments
+        self.ends = list(accumulate(segment.duration for segment in self.segments))
+        self.starts = [0] + self.ends[:-1] if self.ends else []
+
+    def find(self, start: Optional[int], end: Optional[int]) -> range:
+        """Returns indices of segments which overlap the given time range."""
+        # Partially overlapping segments are included because it's better to
+        # download a bit more than a bit less
+        first = bisect_right(self.ends, start) if start else 0
+        last = bisect_left(self.starts, end) if end else len(self.segments)
+        return range(first, last)
+
+
+def _get_vod_paths(timeline: Timeline, ranges: List[TimeRange]) -> List[str]:
+    """Extract unique VOD paths for download from playlist, in playlist order."""
+    indices = sorted(set(index for start, end in ranges for index in timeline.find(start, end)))
+    return list(dict.fromkeys(timeline.segments[index].uri for index in indices))
+
+
+def _dump_downloaded_playlist(playlist, vod_paths: List[str], targets: List[str], playlist_path):
+    """
+    Make a modified playlist which references downloaded VODs. Keep only the
+    given segments and skip the rest.
+    """
+    org_segments = playlist.segments.copy()
+
+    path_map = OrderedDict(zip(vod_paths, targets))
+    playlist.segments.clear()
+    for segment in org_segments:
+        if segment.uri in path_map:
+            segment = copy.copy(segment)
+            segment.uri = path_map[segment.uri]
+            playlist.segments.append(segment)
+
+    playlist.dump(playlist_path)
+
+    playlist.segments.clear()
+    playlist.segments.extend(org_segments)
+
+
+def _get_ranges(args) -> List[TimeRange]:
+    if args.range:
+        if args.start or args.end:
+            raise ConsoleError("--range cannot be combined with --start or --end")
+        return sorted(args.range)
+
+    if args.start and args.end and args.end <= args.start:
+        raise ConsoleError("End time must be greater than start time")
 
-        # `vod_end > start` is used here becuase it's better to download a bit
-        # more than a bit less, similar for the end condition
-        start_condition = not start or vod_end > start
-        end_condition = not end or vod_start < end
+    return [(args.start, args.end)]
 
-        if start_condition and end_condition and segment.uri not in files:
-            files.append(segment.uri)
 
-        vod_start = vod_end
+def _format_range_time(seconds: int) -> str:
+    return "{}h{:02}m{:02}s".format(seconds // 3600, seconds // 60 % 60, seconds % 60)
 
-    return files
+
+def _range_target_filename(target: str, time_range: TimeRange) -> str:
+    """Add the time range to the target file name, to tell apart the outputs of ranges."""
+    root, ext = path.splitext(target)
+    start, end = time_range
+    return "{}_{}-{}{}".format(root, _format_range_time(start), _format_range_time(end), ext)
 
 
 def _crete_temp_dir(base_uri: str) -> str:
@@ -165,19 +304,76 @@ def _crete_temp_dir(base_uri: str) -> str:
     return str(temp_dir)
 
 
+def _segment_cache(args) -> Optional[segment_cache.SegmentCache]:
+    if args.segment_cache:
+        return segment_cache.SegmentCache(segment_cache.default_path(), args.segment_cache_size)
+
+
+def _restore_segments(video, base_uri, vod_paths, targets, args):
+    cache = _segment_cache(args)
+    if cache:
+        restored = cache.restore(video, base_uri, vod_paths, targets)
+        if restored:
+            print_out("<dim>Found {} VODs in segment cache</dim>".format(restored))
+
+
+def _store_segments(job, args):
+    cache = _segment_cache(args)
+    if cache:
+        cache.store(job.video, job.base_uri, job.vod_paths, job.targets)
+
+
+def _write_options(args) -> WriteOptions:
+    return WriteOptions(args.write_buffer, args.fsync)
+
+
+def check_http2(args):
+    if args.http2 and importlib.util.find_spec("h2") is None:
+        raise ConsoleError(
+            "HTTP/2 support requires the h2 package, "
+            "install it by running: pip install twitch-dl[http2]"
+        )
+
+
 def download(args):
-    for video_id in args.videos:
-        download_one(video_id, args)
+    check_http2(args)
+    metrics.configure(args.metrics, args.metrics_format)
+
+    if args.resume:
+        if args.videos:
+            raise ConsoleError("--resume cannot be combined with videos to download")
+        return _download_job(_resume_job(args.resume), args)
+
+    if not args.videos:
+        raise ConsoleError("No videos given, expected one or more video IDs, clip slugs or URLs")
+
+    if args.follow and len(args.videos) > 1:
+        raise ConsoleError("--follow can only be used when downloading a single video")
 
+    video_ids = [utils.parse_video_identifier(video) for video in args.videos]
+    if all(video_ids) and len(video_ids) > 1:
+        return _download_videos(video_ids, args)
 
-def download_one(video: str, args):
+    clip_slugs = [utils.parse_clip_identifier(video) for video in args.videos]
+    if not any(video_ids) and all(clip_slugs) and len(clip_slugs) > 1:
+        return _download_clips(clip_slugs, args)
+
+    for video in args.videos:
+        download_one(video, args)
+
+
+def download_one(video: str, args, prompt: bool = True):
+    """
+    Download a video or clip. Unless `prompt` is set, OutputExists is raised
+    instead of asking whether to overwrite an existing file.
+    """
     video_id = utils.parse_video_identifier(video)
     if video_id:
-        return _download_video(video_id, args)
+        return _download_video(video_id, args, prompt)
 
     clip_slug = utils.parse_clip_identifier(video)
     if clip_slug:
-        return _download_clip(clip_slug, args)
+        return _download_clip(clip_slug, args, prompt)
 
     raise ConsoleError("Invalid input: {}".format(video))
 
@@ -211,9 +407,12 @@ def _get_clip_url(clip, quality):
 
 
 def get_clip_authenticated_url(slug, quality):
-    print_out("<dim>Fetching access token...</dim>")
     access_token = twitch.get_clip_access_token(slug)
+    return clip_authenticated_url(slug, access_token, quality)
+
 
+def clip_authenticated_url(slug, access_token, quality):
+    """Returns the clip URL in given quality, authenticated with the access token."""
     if not access_token:
         raise ConsoleError("Access token not found for slug '{}'".format(slug))
 
@@ -227,14 +426,43 @@ def get_clip_authenticated_url(slug, quality):
     return "{}?{}".format(url, query)
 
 
-def _download_clip(slug: str, args) -> None:
-    print_out("<dim>Looking up clip...</dim>")
-    clip = twitch.get_clip(slug)
-    game = clip["game"]["name"] if clip["game"] else "Unknown"
+def _check_overwrite(targets: List[str], args, prompt: bool = True) -> bool:
+    """Returns whether to overwrite targets, asking the user if any of them exist."""
+    existing = [target for target in targets if path.exists(target)]
+    if args.overwrite or not existing:
+        return args.overwrite
+
+    if not prompt:
+        raise OutputExists("File exists: {}".format(existing[0]))
+
+    response = input("File exists. Overwrite? [Y/n]: ")
+    if response.lower().strip() not in ["", "y"]:
+        raise ConsoleError("Aborted")
+    return True
+
+
+def _download_clips(slugs: List[str], args) -> None:
+    """Download multiple clips, looking them up and fetching access tokens in batches."""
+    print_out("<dim>Looking up {} clips...</dim>".format(len(slugs)))
+    clips = twitch.get_clips(slugs)
+
+    print_out("<dim>Fetching access tokens...</dim>")
+    access_tokens = twitch.get_clip_access_tokens(slugs)
+
+    for slug in slugs:
+        _download_clip(slug, args, clip=clips[slug], access_token=access_tokens[slug])
+
+
+def _download_clip(slug: str, args, prompt: bool = True, clip=None, access_token=None) -> None:
+    """Download a clip. The clip and access token are fetched unless given."""
+    if not clip:
+        print_out("<dim>Looking up clip...</dim>")
+        clip = twitch.get_clip(slug)
 
     if not clip:
         raise ConsoleError("Clip '{}' not found".format(slug))
 
+    game = clip["game"]["name"] if clip["game"] else "Unknown"
     print_out("Found: <green>{}</green> by <yellow>{}</yellow>, playing <blue>{}</blue> ({})".format(
         clip["title"],
         clip["broadcaster"]["displayName"],
@@ -245,13 +473,13 @@ def _download_clip(slug: str, args) -> None:
     target = _clip_target_filename(clip, args)
     print_out("Target: <blue>{}</blue>".format(target))
 
-    if not args.overwrite and path.exists(target):
-        response = input("File exists. Overwrite? [Y/n]: ")
-        if response.lower().strip() not in ["", "y"]:
-            raise ConsoleError("Aborted")
-        args.overwrite = True
+    args.overwrite = _check_overwrite([target], args, prompt)
 
-    url = get_clip_authenticated_url(slug, args.quality)
+    if not access_token:
+        print_out("<dim>Fetching access token...</dim>")
+        access_token = twitch.get_clip_access_token(slug)
+
+    url = clip_authenticated_url(slug, access_token, args.quality)
     print_out("<dim>Selected URL: {}</dim>".format(url))
 
     print_out("<dim>Downloading clip...</dim>")
@@ -260,12 +488,38 @@ def _download_clip(slug: str, args) -> None:
     print_out("Downloaded: <blue>{}</blue>".format(target))
 
 
-def _download_video(video_id, args) -> None:
-    if args.start and args.end and args.end <= args.start:
-        raise ConsoleError("End time must be greater than start time")
+class Output(NamedTuple):
+    """A file to be made by joining given VODs."""
+    target: str
+    vod_paths: List[str]
+    playlist_path: str
+
+
+class VideoJob(NamedTuple):
+    """A video which has been looked up and is ready to be downloaded."""
+    video: dict
+    outputs: List[Output]
+    target_dir: str
+    playlist: m3u8.M3U8
+    playlist_uri: str
+    base_uri: str
+    vod_paths: List[str]
+    sources: List[str]
+    targets: List[str]
+    overwrite: bool
+    ranges: List[TimeRange]
+
 
-    print_out("<dim>Looking up video...</dim>")
-    video = twitch.get_video(video_id)
+def _prepare_video(video_id, args, video=None, access_token=None, prompt=True) -> VideoJob:
+    """
+    Look up the video and its playlist. The video and access token are
+    fetched unless given.
+    """
+    ranges = _get_ranges(args)
+
+    if not video:
+        print_out("<dim>Looking up video...</dim>")
+        video = twitch.get_video(video_id)
 
     if not video:
         raise ConsoleError("Video {} not found".format(video_id))
@@ -274,16 +528,16 @@ def _download_video(video_id, args) -> None:
         video['title'], video['creator']['displayName']))
 
     target = _video_target_filename(video, args)
-    print_out("Output: <blue>{}</blue>".format(target))
+    targets = [target] if len(ranges) == 1 else [
+        _range_target_filename(target, time_range) for time_range in ranges]
+    for target in targets:
+        print_out("Output: <blue>{}</blue>".format(target))
 
-    if not args.overwrite and path.exists(target):
-        response = input("File exists. Overwrite? [Y/n]: ")
-        if response.lower().strip() not in ["", "y"]:
-            raise ConsoleError("Aborted")
-        args.overwrite = True
+    overwrite = _check_overwrite(targets, args, prompt)
 
-    print_out("<dim>Fetching access token...</dim>")
-    access_token = twitch.get_access_token(video_id, auth_token=args.auth_token)
+    if not access_token:
+        print_out("<dim>Fetching access token...</dim>")
+        access_token = twitch.get_access_token(video_id, auth_token=args.auth_token)
 
     print_out("<dim>Fetching playlists...</dim>")
     playlists_m3u8 = twitch.get_playlists(video_id, access_token)
@@ -292,52 +546,369 @@ def _download_video(video_id, args) -> None:
             else _select_playlist_interactive(playlists))
 
     print_out("<dim>Fetching playlist...</dim>")
-    response = httpx.get(playlist_uri)
+    response = get_client().get(playlist_uri)
     response.raise_for_status()
     playlist = m3u8.loads(response.text)
 
     base_uri = re.sub("/[^/]+$", "/", playlist_uri)
     target_dir = _crete_temp_dir(base_uri)
-    vod_paths = _get_vod_paths(playlist, args.start, args.end)
 
-    # Save playlists for debugging purposes
+    # Save playlists for debugging purposes, the playlist is also used for resuming
     with open(path.join(target_dir, "playlists.m3u8"), "w") as f:
         f.write(playlists_m3u8)
-    with open(path.join(target_dir, "playlist.m3u8"), "w") as f:
-        f.write(response.text)
+    _save_playlist(playlist, target_dir)
+
+    job = _make_job(video, targets, ranges, target_dir, playlist, playlist_uri, overwrite)
+    _restore_segments(video, base_uri, job.vod_paths, job.targets, args)
+    return job
+
+
+def _make_job(video, targets, ranges, target_dir, playlist, playlist_uri, overwrite) -> VideoJob:
+    base_uri = re.sub("/[^/]+$", "/", playlist_uri)
+
+    # Download segments needed by all ranges once, then join each range separately
+    timeline = Timeline(playlist)
+    vod_paths = _get_vod_paths(timeline, ranges)
+    outputs = [
+        Output(
+            target,
+            _get_vod_paths(timeline, [time_range]),
+            path.join(target_dir, "playlist_downloaded_{}.m3u8".format(n) if n else
+                      "playlist_downloaded.m3u8"),
+        )
+        for n, (target, time_range) in enumerate(zip(targets, ranges))
+    ]
 
-    print_out("\nDownloading {} VODs using {} workers to {}".format(
-        len(vod_paths), args.max_workers, target_dir))
     sources = [base_uri + path for path in vod_paths]
-    targets = [os.path.join(target_dir, "{:05d}.ts".format(k)) for k, _ in enumerate(vod_paths)]
-    asyncio.run(download_all(sources, targets, args.max_workers, rate_limit=args.rate_limit))
+    vod_targets = [os.path.join(target_dir, "{:05d}.ts".format(k)) for k, _ in enumerate(vod_paths)]
 
-    # Make a modified playlist which references downloaded VODs
-    # Keep only the downloaded segments and skip the rest
-    org_segments = playlist.segments.copy()
+    return VideoJob(video, outputs, target_dir, playlist, playlist_uri, base_uri, vod_paths,
+                    sources, vod_targets, overwrite, ranges)
 
-    path_map = OrderedDict(zip(vod_paths, targets))
-    playlist.segments.clear()
-    for segment in org_segments:
-        if segment.uri in path_map:
-            segment.uri = path_map[segment.uri]
-            playlist.segments.append(segment)
 
-    playlist_path = path.join(target_dir, "playlist_downloaded.m3u8")
-    playlist.dump(playlist_path)
+def _save_playlist(playlist, target_dir):
+    # Replaced in one go, so that an interrupted write doesn't break resuming
+    tmp_path = path.join(target_dir, "playlist.m3u8.tmp")
+    with open(tmp_path, "w") as f:
+        f.write(playlist.dumps())
+    os.replace(tmp_path, path.join(target_dir, "playlist.m3u8"))
+
+
+def _job_record(job: VideoJob) -> dict:
+    """Details of the job needed to resume it, recorded in the journal."""
+    return {
+        "video": job.video,
+        "playlist_uri": job.playlist_uri,
+        "targets": [output.target for output in job.outputs],
+        "ranges": job.ranges,
+        "overwrite": job.overwrite,
+    }
+
+
+def _resume_job(target_dir: str) -> VideoJob:
+    """Make the job for resuming a download from its journal and playlist."""
+    job = Journal(target_dir).job
+    if not job:
+        raise ConsoleError("No download to resume found in {}".format(target_dir))
+
+    playlist = m3u8.load(path.join(target_dir, "playlist.m3u8"))
+    ranges = [tuple(time_range) for time_range in job["ranges"]]
+
+    print_out("Resuming: <blue>{}</blue> by <yellow>{}</yellow>".format(
+        job["video"]["title"], job["video"]["creator"]["displayName"]))
+    for target in job["targets"]:
+        print_out("Output: <blue>{}</blue>".format(target))
+
+    return _make_job(job["video"], job["targets"], ranges, target_dir, playlist,
+                     job["playlist_uri"], job["overwrite"])
+
+
+def _pending_vods(job: VideoJob, journal: Journal) -> List[int]:
+    """
+    Start journaling the job, and return indices of VODs which are not
+    recorded as downloaded.
+    """
+    journal.start(_job_record(job))
+    pending = [n for n, (vod_path, target) in enumerate(zip(job.vod_paths, job.targets))
+               if not journal.is_completed(vod_path, target)]
+
+    # A target can hold a different VOD when the requested ranges have changed
+    recorded = {record["target"] for record in journal.completed.values()}
+    for n in pending:
+        if path.basename(job.targets[n]) in recorded and path.exists(job.targets[n]):
+            os.remove(job.targets[n])
+
+    if len(pending) < len(job.vod_paths):
+        print_out("<dim>Resuming, {} of {} VODs already downloaded</dim>".format(
+            len(job.vod_paths) - len(pending), len(job.vod_paths)))
+
+    return pending
+
+
+async def _download_vods(job: VideoJob, journal: Journal, args, retry_policy: RetryPolicy,
+                         on_complete: Optional[Callable[[int], None]] = None,
+                         client: Optional[httpx.AsyncClient] = None):
+    """
+    Download VODs of the job which have not been downloaded yet, and record
+    each one in the journal. `on_complete` is called with the index of each
+    VOD once it's available, including ones downloaded previously.
+    """
+    pending = _pending_vods(job, journal)
+    if on_complete:
+        for n in sorted(set(range(len(job.vod_paths))) - set(pending)):
+            on_complete(n)
+
+    def vod_completed(task_id):
+        n = pending[task_id]
+        journal.record(job.vod_paths[n], job.targets[n])
+        if on_complete:
+            on_complete(n)
+
+    await download_all([job.sources[n] for n in pending],
+                       [job.targets[n] for n in pending],
+                       args.max_workers,
+                       rate_limit=args.rate_limit,
+                       retry_policy=retry_policy,
+                       on_complete=vod_completed,
+                       http2=args.http2,
+                       chunk_size=args.chunk_size,
+                       write_options=_write_options(args),
+                       validation=args.validate,
+                       hedge_budget=args.hedge_budget,
+                       client=client)
+
+    if args.fsync == FSYNC_END:
+        targets = [job.targets[n] for n in pending]
+        await asyncio.get_running_loop().run_in_executor(None, fsync_files, targets)
+
+
+def _download_video(video_id, args, prompt: bool = True) -> None:
+    job = _prepare_video(video_id, args, prompt=prompt)
+    _download_job(job, args)
+
+
+def _download_job(job: VideoJob, args) -> None:
+    print_out("\nDownloading {} VODs using {} workers to {}".format(
+        len(job.vod_paths), args.max_workers or "auto", job.target_dir))
+    retry_policy = RetryPolicy(args.retries, args.retry_backoff)
+
+    if args.concurrent_join and not args.no_join and len(job.outputs) == 1 and not args.follow:
+        with Journal(job.target_dir) as journal:
+            asyncio.run(_download_and_join(job, journal, args, retry_policy))
+        _store_segments(job, args)
+    else:
+        with Journal(job.target_dir) as journal:
+            if args.follow:
+                job = asyncio.run(_download_following(job, journal, args, retry_policy))
+            else:
+                asyncio.run(_download_vods(job, journal, args, retry_policy))
+        _store_segments(job, args)
+        _dump_downloaded_playlists(job)
+
+        if args.no_join:
+            print_out("\n\n<dim>Skipping joining files...</dim>")
+            print_out("VODs downloaded to:\n<blue>{}</blue>".format(job.target_dir))
+            return
+
+        print_out("\n\nJoining files...")
+        for output in job.outputs:
+            _join_vods(output.playlist_path, output.target, job.overwrite, job.video)
+
+    _cleanup(job, args)
+
+
+async def _poll_playlist(client: httpx.AsyncClient, uri: str,
+                         retry_policy: RetryPolicy) -> m3u8.M3U8:
+    """Fetch the playlist, retrying failures so they don't end a long follow."""
+    for n in range(retry_policy.retries):
+        try:
+            response = await client.get(uri)
+            response.raise_for_status()
+            return m3u8.loads(response.text)
+        except (httpx.RequestError, httpx.HTTPStatusError) as e:
+            if n + 1 >= retry_policy.retries or not retry_policy.is_retryable(e):
+                raise
+
+            delay = retry_policy.get_delay(n, e)
+            print_out("\n<dim>Fetching playlist failed: {}. Retrying in {:.1f}s.</dim>".format(
+                e, delay))
+            await asyncio.sleep(delay)
+
+    raise Exception("Should not happen")
+
+
+async def _download_following(job: VideoJob, journal: Journal, args,
+                              retry_policy: RetryPolicy) -> VideoJob:
+    """
+    Download VODs of a video which is still being recorded. The playlist is
+    polled for new VODs, which are downloaded as they appear, until the
+    playlist ends or all requested ranges are available. Returns the job
+    updated with all downloaded VODs.
+
+    One client is used for polling and downloading, so connections are kept
+    open between polls.
+    """
+    ranges = job.ranges
+    last_end = None if any(end is None for _, end in ranges) else max(end for _, end in ranges)
+    playlist = job.playlist
+    vod_paths = list(job.vod_paths)
+    sources = list(job.sources)
+    targets = list(job.targets)
+    new_paths = job.vod_paths
+    new_sources = job.sources
+    new_targets = job.targets
+    timeline = Timeline(playlist)
+    client = make_download_client(args.max_workers, args.http2)
+
+    try:
+        while True:
+            polled_at = time.monotonic()
+            if new_paths:
+                new_job = job._replace(
+                    vod_paths=new_paths, sources=new_sources, targets=new_targets)
+                await _download_vods(new_job, journal, args, retry_policy, client=client)
+
+            duration = timeline.ends[-1] if timeline.ends else 0
+            if playlist.is_endlist or (last_end is not None and duration >= last_end):
+                break
+
+            interval = playlist.target_duration or FOLLOW_INTERVAL
+            await asyncio.sleep(max(interval - (time.monotonic() - polled_at), 0))
+
+            playlist = await _poll_playlist(client, job.playlist_uri, retry_policy)
+            timeline = Timeline(playlist)
+
+            known = set(vod_paths)
+            new_paths = [p for p in _get_vod_paths(timeline, ranges) if p not in known]
+            new_sources = [job.base_uri + vod_path for vod_path in new_paths]
+            new_targets = [os.path.join(job.target_dir, "{:05d}.ts".format(k))
+                           for k in range(len(vod_paths), len(vod_paths) + len(new_paths))]
+            vod_paths.extend(new_paths)
+            sources.extend(new_sources)
+            targets.extend(new_targets)
+
+            if new_paths:
+                print_out("\n\n<dim>Found {} new VODs, video is {} long</dim>".format(
+                    len(new_paths), utils.format_duration(timeline.ends[-1])))
+                _save_playlist(playlist, job.target_dir)
+                _restore_segments(job.video, job.base_uri, new_paths, new_targets, args)
+    finally:
+        await client.aclose()
+
+    print_out("\n\n<dim>Stopped following, all VODs downloaded</dim>")
+
+    outputs = [output._replace(vod_paths=_get_vod_paths(timeline, [time_range]))
+               for output, time_range in zip(job.outputs, ranges)]
+
+    _save_playlist(playlist, job.target_dir)
+
+    return job._replace(playlist=playlist, outputs=outputs, vod_paths=vod_paths,
+                        sources=sources, targets=targets)
+
+
+def _download_videos(video_ids: List[str], args) -> None:
+    """Download multiple videos concurrently, sharing workers and connections."""
+    print_out("<dim>Looking up {} videos...</dim>".format(len(video_ids)))
+    videos = twitch.get_videos(video_ids)
+
+    print_out("<dim>Fetching access tokens...</dim>")
+    access_tokens = twitch.get_access_tokens(video_ids, auth_token=args.auth_token)
+
+    jobs = [_prepare_video(video_id, args, videos[video_id], access_tokens[video_id])
+            for video_id in video_ids]
+
+    print_out("\nDownloading {} VODs from {} videos using {} workers".format(
+        sum(len(job.vod_paths) for job in jobs), len(jobs), args.max_workers or "auto"))
+
+    asyncio.run(_download_and_join_all(jobs, args))
+
+
+async def _download_and_join_all(jobs: List[VideoJob], args):
+    """
+    Download VODs for all jobs in one go. Each video is joined as soon as all
+    of its VODs are downloaded, while the remaining videos keep downloading.
+    """
+    journals = [Journal(job.target_dir) for job in jobs]
+    pending = [_pending_vods(job, journal) for job, journal in zip(jobs, journals)]
+
+    # Tasks as (job index, VOD index) pairs
+    tasks = [(n, k) for n, indices in enumerate(pending) for k in indices]
+    remaining = [len(indices) for indices in pending]
+    store_lock = asyncio.Lock()
+    finishing = [asyncio.create_task(_finish_video(job, args, store_lock))
+                 for job, indices in zip(jobs, pending) if not indices]
+
+    def on_complete(task_id):
+        n, k = tasks[task_id]
+        journals[n].record(jobs[n].vod_paths[k], jobs[n].targets[k])
+        remaining[n] -= 1
+        if remaining[n] == 0:
+            finishing.append(asyncio.create_task(_finish_video(jobs[n], args, store_lock)))
+
+    try:
+        await download_all([jobs[n].sources[k] for n, k in tasks],
+                           [jobs[n].targets[k] for n, k in tasks],
+                           args.max_workers,
+                           rate_limit=args.rate_limit,
+                           retry_policy=RetryPolicy(args.retries, args.retry_backoff),
+                           on_complete=on_complete,
+                           http2=args.http2,
+                           chunk_size=args.chunk_size,
+                           write_options=_write_options(args),
+                           validation=args.validate,
+                           hedge_budget=args.hedge_budget)
+    finally:
+        for journal in journals:
+            journal.close()
+
+    await asyncio.gather(*finishing)
+
+
+async def _finish_video(job: VideoJob, args, store_lock: asyncio.Lock):
+    """
+    Join a video while other videos are downloading. Blocking file operations
+    run in a thread, so they don't hold up the downloads.
+    """
+    loop = asyncio.get_running_loop()
+
+    # Other videos may still be downloading, so flush only this video's VODs
+    if args.fsync == FSYNC_END:
+        await loop.run_in_executor(None, fsync_files, job.targets)
+
+    # Storing segments prunes the whole cache, one video at a time
+    async with store_lock:
+        await loop.run_in_executor(None, _store_segments, job, args)
+    _dump_downloaded_playlists(job)
 
     if args.no_join:
-        print_out("\n\n<dim>Skipping joining files...</dim>")
-        print_out("VODs downloaded to:\n<blue>{}</blue>".format(target_dir))
+        print_out("\n<dim>VODs downloaded to: {}</dim>".format(job.target_dir))
         return
 
-    print_out("\n\nJoining files...")
-    _join_vods(playlist_path, target, args.overwrite, video)
+    for output in job.outputs:
+        command = _join_command(output.playlist_path, output.target, job.overwrite, job.video)
+        command.remove("-stats")  # Would garble the download progress output
+        print_out("\n<dim>{}</dim>".format(" ".join(command)))
+
+        process = await asyncio.create_subprocess_exec(*command)
+        if await process.wait() != 0:
+            raise ConsoleError("Joining files failed")
+
+    await loop.run_in_executor(None, _cleanup, job, args)
+
+
+def _dump_downloaded_playlists(job: VideoJob):
+    path_map = dict(zip(job.vod_paths, job.targets))
+    for output in job.outputs:
+        targets = [path_map[vod_path] for vod_path in output.vod_paths]
+        _dump_downloaded_playlist(job.playlist, output.vod_paths, targets, output.playlist_path)
+
 
+def _cleanup(job: VideoJob, args):
     if args.keep:
-        print_out("\n<dim>Temporary files not deleted: {}</dim>".format(target_dir))
+        print_out("\n<dim>Temporary files not deleted: {}</dim>".format(job.target_dir))
     else:
         print_out("\n<dim>Deleting temporary files...</dim>")
-        shutil.rmtree(target_dir)
+        shutil.rmtree(job.target_dir)
 
-    print_out("\nDownloaded: <green>{}</green>".format(target))
+    for output in job.outputs:
+        print_out("\nDownloaded: <green>{}</green>".format(output.target))
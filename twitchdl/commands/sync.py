@@ -0,0 +1,81 @@
+import logging
+import sys
+
+from twitchdl import metrics, sync_state, twitch
+from twitchdl.commands.download import check_http2, download_one
+from twitchdl.exceptions import ConsoleError, OutputExists
+from twitchdl.output import print_err, print_out
+
+logger = logging.getLogger(__name__)
+
+
+def sync(args):
+    # Options of the download command which don't apply to syncing. Videos
+    # which are still being recorded are followed, so they are not archived
+    # partially.
+    args.start = None
+    args.end = None
+    args.range = None
+    args.follow = True
+    args.quality = args.quality or "source"
+    check_http2(args)
+    metrics.configure(args.metrics, args.metrics_format)
+
+    with sync_state.SyncState(args.db or sync_state.default_path()) as state:
+        print_out("<dim>Looking for new videos...</dim>")
+        new_videos = _list_new_videos(args.channel_name, args.type, state)
+        state.add_seen(args.channel_name, new_videos)
+        print_out("Found <green>{}</green> new videos".format(len(new_videos)))
+
+        pending = state.pending(args.channel_name)
+        if not pending:
+            print_out("<green>Archive is up to date</green>")
+            return
+
+        print_out("Videos to download:")
+        for video in pending:
+            print_out("  {} <blue>{}</blue> <dim>{}</dim>".format(
+                video.id, video.title, video.published_at))
+
+        if args.dry_run:
+            return
+
+        failed = 0
+        for n, video in enumerate(pending, start=1):
+            print_out("\n<b>Downloading video {} of {}</b>".format(n, len(pending)))
+            try:
+                # Existing files are kept unless --overwrite is given, there
+                # may be no one to ask
+                download_one(video.id, args, prompt=False)
+                state.mark_completed(video.id)
+            except OutputExists as e:
+                print_out("<yellow>{}, skipping</yellow>".format(e))
+                state.mark_completed(video.id)
+            except Exception as e:
+                # Keep going, failed videos are retried on the next sync
+                logger.debug(f"Failed downloading video {video.id}", exc_info=True)
+                print_err(e)
+                failed += 1
+
+    if failed:
+        raise ConsoleError("Failed downloading {} of {} videos".format(failed, len(pending)))
+
+
+def _list_new_videos(channel_name, type, state):
+    """
+    List videos published since the last sync, newest first. Stops paging
+    once a video which has been seen before is reached.
+    """
+    seen = state.seen_ids(channel_name)
+    _, generator = twitch.channel_videos_generator(channel_name, sys.maxsize, "time", type)
+
+    new_videos = []
+    for video in generator:
+        if video["id"] in seen:
+            break
+        new_videos.append(video)
+
+    # Stops prefetching further pages
+    generator.close()
+
+    return new_videos
@@ -3,6 +3,7 @@ import sys
 from twitchdl import twitch
 from twitchdl.exceptions import ConsoleError
 from twitchdl.output import print_out, print_paged_videos, print_video, print_json, print_video_compact
+from twitchdl.output import print_json_lines
 
 
 def videos(args):
@@ -17,6 +18,10 @@ def videos(args):
     total_count, generator = twitch.channel_videos_generator(
         args.channel_name, max_videos, args.sort, args.type, game_ids=game_ids)
 
+    if args.json_lines:
+        print_json_lines(generator, twitch.PAGE_SIZE)
+        return
+
     if args.json:
         videos = list(generator)
         print_json({
@@ -58,10 +63,12 @@ def _get_game_ids(names):
     if not names:
         return []
 
+    print_out("<dim>Looking up games...</dim>")
+    games = twitch.get_game_ids(names)
+
     game_ids = []
     for name in names:
-        print_out("<dim>Looking up game '{}'...</dim>".format(name))
-        game_id = twitch.get_game_id(name)
+        game_id = games[name.strip()]
         if not game_id:
             raise ConsoleError("Game '{}' not found".format(name))
         game_ids.append(int(game_id))
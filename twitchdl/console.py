@@ -1,12 +1,14 @@
 # -*- coding: utf-8 -*-
 
 import logging
+import os
 import sys
 import re
 
 from argparse import ArgumentParser, ArgumentTypeError
-from typing import NamedTuple, List, Tuple, Any, Dict
+from typing import NamedTuple, List, Tuple, Any, Dict, Optional
 
+from twitchdl import cache, profiling
 from twitchdl.exceptions import ConsoleError
 from twitchdl.output import print_err
 from twitchdl.twitch import GQLError
@@ -42,6 +44,19 @@ def time(value: str) -> int:
     return hours * 3600 + minutes * 60 + seconds
 
 
+def time_range(value: str) -> Tuple[int, int]:
+    """Parse a time range (start-end, each as hh:mm or hh:mm:ss) to seconds."""
+    parts = value.split("-")
+    if len(parts) != 2:
+        raise ArgumentTypeError("must be given as start-end, e.g. 1:00:00-1:05:00")
+
+    start, end = time(parts[0]), time(parts[1])
+    if end <= start:
+        raise ArgumentTypeError("end time must be greater than start time")
+
+    return start, end
+
+
 def pos_integer(value: str) -> int:
     try:
         parsed = int(value)
@@ -54,6 +69,14 @@ def pos_integer(value: str) -> int:
     return parsed
 
 
+def workers(value: str) -> Optional[int]:
+    """Parse worker count, `auto` (returned as None) enables adaptive concurrency."""
+    if value.lower() == "auto":
+        return None
+
+    return pos_integer(value)
+
+
 def rate(value: str) -> int:
     match = re.search(r"^([0-9]+)(k|m|)$", value, flags=re.IGNORECASE)
 
@@ -72,6 +95,196 @@ def rate(value: str) -> int:
     return amount
 
 
+def size(value: str) -> int:
+    """Parse a size in bytes, with an optional 'k', 'm' or 'g' suffix."""
+    match = re.search(r"^([0-9]+)(k|m|g|)$", value, flags=re.IGNORECASE)
+
+    if not match:
+        raise ArgumentTypeError("must be an integer, followed by an optional 'k', 'm' or 'g'")
+
+    multipliers = {"": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}
+    return int(match.group(1)) * multipliers[match.group(2).lower()]
+
+
+def pos_size(value: str) -> int:
+    parsed = size(value)
+    if parsed < 1:
+        raise ArgumentTypeError("must be positive")
+
+    return parsed
+
+
+DOWNLOAD_OPTIONS = [
+    (["-w", "--max-workers"], {
+        "help": "Number of workers for downloading vods concurrently (default 5). "
+                "Set to 'auto' to adjust the worker count based on measured throughput.",
+        "type": workers,
+        "default": 5,
+    }),
+    (["-s", "--start"], {
+        "help": "Download video from this time (hh:mm or hh:mm:ss)",
+        "type": time,
+        "default": None,
+    }),
+    (["-e", "--end"], {
+        "help": "Download video up to this time (hh:mm or hh:mm:ss)",
+        "type": time,
+        "default": None,
+    }),
+    (["--range"], {
+        "help": "Download a part of the video given as start-end (e.g. 1:00:00-1:05:00). "
+                "Can be given multiple times to make a file for each part, VODs "
+                "shared between parts are downloaded once. Cannot be combined with "
+                "--start and --end.",
+        "type": time_range,
+        "action": "append",
+    }),
+    (["-f", "--format"], {
+        "help": "Video format to convert into, passed to ffmpeg as the "
+                "target file extension. Defaults to `mkv`.",
+        "type": str,
+        "default": "mkv",
+    }),
+    (["-k", "--keep"], {
+        "help": "Don't delete downloaded VODs and playlists after merging.",
+        "action": "store_true",
+        "default": False,
+    }),
+    (["-q", "--quality"], {
+        "help": "Video quality, e.g. 720p. Set to 'source' to get best quality.",
+        "type": str,
+    }),
+    (["-a", "--auth-token"], {
+        "help": "Authentication token, passed to Twitch to access subscriber only "
+                "VODs. Can be copied from the 'auth_token' cookie in any browser "
+                "logged in on Twitch.",
+        "type": str,
+        "default": None,
+    }),
+    (["--no-join"], {
+        "help": "Don't run ffmpeg to join the downloaded vods, implies --keep.",
+        "action": "store_true",
+        "default": False,
+    }),
+    (["--follow"], {
+        "help": "Keep downloading new VODs of a video which is still being recorded "
+                "until the broadcast ends, then join them.",
+        "action": "store_true",
+        "default": False,
+    }),
+    (["--resume"], {
+        "help": "Resume an interrupted download from its temp dir, using the "
+                "journal kept there instead of looking up the video again.",
+        "metavar": "DIR",
+        "type": str,
+    }),
+    (["--concurrent-join"], {
+        "help": "Start joining VODs with ffmpeg while the remaining ones are still "
+                "downloading, instead of waiting for all of them to download.",
+        "action": "store_true",
+        "default": False,
+    }),
+    (["--http2"], {
+        "help": "Use HTTP/2 to download VODs, multiplexing requests over fewer "
+                "connections. Requires the h2 package.",
+        "action": "store_true",
+        "default": False,
+    }),
+    (["--overwrite"], {
+        "help": "Overwrite the target file if it already exists without prompting.",
+        "action": "store_true",
+        "default": False,
+    }),
+    (["-o", "--output"], {
+        "help": "Output file name template. See docs for details.",
+        "type": str,
+        "default": "{date}_{id}_{channel_login}_{title_slug}.{format}"
+    }),
+    (["-r", "--rate-limit"], {
+        "help": "Limit the maximum download speed in bytes per second. "
+                "Use 'k' and 'm' suffixes for kbps and mbps.",
+        "type": rate,
+    }),
+    (["--chunk-size"], {
+        "help": "How much data to read from the network at a time, in bytes. "
+                "Use 'k' and 'm' suffixes for kB and MB. Defaults to 256k.",
+        "type": pos_size,
+        "default": 256 * 1024,
+    }),
+    (["--write-buffer"], {
+        "help": "How much data to buffer before writing to disk, in bytes. "
+                "Use 'k' and 'm' suffixes for kB and MB. Defaults to 1m.",
+        "type": pos_size,
+        "default": 1024 * 1024,
+    }),
+    (["--validate"], {
+        "help": "How to check downloaded VODs, corrupt VODs are downloaded again "
+                "right away: 'none' checks only their length, 'sync' also checks "
+                "MPEG-TS sync bytes, 'continuity' also checks continuity counters. "
+                "Defaults to 'sync'.",
+        "type": str,
+        "choices": ["none", "sync", "continuity"],
+        "default": "sync",
+    }),
+    (["--fsync"], {
+        "help": "When to flush downloaded VODs to disk: 'none' leaves it to the "
+                "operating system, 'vod' flushes each VOD, 'end' flushes all VODs "
+                "once downloaded. Defaults to 'none'.",
+        "type": str,
+        "choices": ["none", "vod", "end"],
+        "default": "none",
+    }),
+    (["--retries"], {
+        "help": "Number of attempts to download each VOD before giving up (default 5)",
+        "type": pos_integer,
+        "default": 5,
+    }),
+    (["--retry-backoff"], {
+        "help": "Base delay in seconds between download attempts, doubled on each "
+                "subsequent attempt and randomized. Defaults to 1.",
+        "type": float,
+        "default": 1.0,
+    }),
+    (["--hedge-budget"], {
+        "help": "Once all VODs are downloading, VODs which are much slower than "
+                "the rest are requested again and the first response to finish "
+                "is used. This caps the extra data such requests may download. "
+                "Use 'k', 'm' and 'g' suffixes for kB, MB and GB, set to 0 to "
+                "disable. Defaults to 5 percent of the download size.",
+        "type": size,
+    }),
+    (["--metrics"], {
+        "help": "Write timings of each VOD and totals of the download to this file, "
+                "for finding out what slows down downloads.",
+        "metavar": "PATH",
+        "type": str,
+    }),
+    (["--metrics-format"], {
+        "help": "Format of the --metrics file: 'json-lines' appends a line for each "
+                "VOD and download, 'prometheus' writes totals in the format read by "
+                "the node exporter's textfile collector. Defaults to 'json-lines'.",
+        "type": str,
+        "choices": ["json-lines", "prometheus"],
+        "default": "json-lines",
+    }),
+    (["--segment-cache"], {
+        "help": "Keep downloaded VODs in a persistent cache and reuse them when "
+                "downloading overlapping parts of the same video.",
+        "action": "store_true",
+        "default": False,
+    }),
+    (["--segment-cache-size"], {
+        "help": "Maximum size of the segment cache, least recently used VODs are "
+                "removed when it grows larger. Use 'k', 'm' and 'g' suffixes for kB, "
+                "MB and GB. Defaults to 10g.",
+        "type": size,
+        "default": 10 * 1024 ** 3,
+    }),
+]
+
+SYNC_EXCLUDED = {"--start", "--end", "--range", "--follow", "--resume"}
+"""Download options which don't apply to the sync command"""
+
 COMMANDS = [
     Command(
         name="videos",
@@ -112,6 +325,12 @@ COMMANDS = [
                 "action": "store_true",
                 "default": False,
             }),
+            (["--json-lines"], {
+                "help": "Show results as JSON lines, one video per line, printed as they are "
+                        "fetched. Ignores `--pager`.",
+                "action": "store_true",
+                "default": False,
+            }),
             (["-p", "--pager"], {
                 "help": "Print videos in pages. Ignores `--limit`. Defaults to 10.",
                 "type": pos_integer,
@@ -154,6 +373,12 @@ COMMANDS = [
                 "action": "store_true",
                 "default": False,
             }),
+            (["--json-lines"], {
+                "help": "Show results as JSON lines, one clip per line, printed as they are "
+                        "fetched. Ignores `--pager`.",
+                "action": "store_true",
+                "default": False,
+            }),
             (["-p", "--pager"], {
                 "help": "Number of clips to show per page. Disabled by default.",
                 "type": pos_integer,
@@ -165,6 +390,16 @@ COMMANDS = [
                 "action": "store_true",
                 "default": False,
             }),
+            (["-w", "--max-workers"], {
+                "help": "Number of clips to download concurrently with --download (default 5)",
+                "type": pos_integer,
+                "default": 5,
+            }),
+            (["-r", "--rate-limit"], {
+                "help": "Limit the maximum download speed in bytes per second with "
+                        "--download. Use 'k' and 'm' suffixes for kbps and mbps.",
+                "type": rate,
+            }),
         ],
     ),
     Command(
@@ -174,66 +409,35 @@ COMMANDS = [
             (["videos"], {
                 "help": "One or more video ID, clip slug or twitch URL to download.",
                 "type": str,
-                "nargs": "+",
-            }),
-            (["-w", "--max-workers"], {
-                "help": "Number of workers for downloading vods concurrently (default 5)",
-                "type": int,
-                "default": 5,
-            }),
-            (["-s", "--start"], {
-                "help": "Download video from this time (hh:mm or hh:mm:ss)",
-                "type": time,
-                "default": None,
+                "nargs": "*",
             }),
-            (["-e", "--end"], {
-                "help": "Download video up to this time (hh:mm or hh:mm:ss)",
-                "type": time,
-                "default": None,
-            }),
-            (["-f", "--format"], {
-                "help": "Video format to convert into, passed to ffmpeg as the "
-                        "target file extension. Defaults to `mkv`.",
+        ] + DOWNLOAD_OPTIONS,
+    ),
+    Command(
+        name="sync",
+        description="Download videos of a channel which have not been downloaded before.",
+        arguments=[
+            (["channel_name"], {
+                "help": "Name of the channel to sync.",
                 "type": str,
-                "default": "mkv",
-            }),
-            (["-k", "--keep"], {
-                "help": "Don't delete downloaded VODs and playlists after merging.",
-                "action": "store_true",
-                "default": False,
             }),
-            (["-q", "--quality"], {
-                "help": "Video quality, e.g. 720p. Set to 'source' to get best quality.",
+            (["-t", "--type"], {
+                "help": "Broadcast type. Defaults to `archive`.",
                 "type": str,
+                "choices": ["archive", "highlight", "upload"],
+                "default": "archive",
             }),
-            (["-a", "--auth-token"], {
-                "help": "Authentication token, passed to Twitch to access subscriber only "
-                        "VODs. Can be copied from the 'auth_token' cookie in any browser "
-                        "logged in on Twitch.",
+            (["--db"], {
+                "help": "Path to the database which keeps track of downloaded videos. "
+                        "Defaults to `~/.local/share/twitch-dl/sync.db`.",
                 "type": str,
-                "default": None,
             }),
-            (["--no-join"], {
-                "help": "Don't run ffmpeg to join the downloaded vods, implies --keep.",
+            (["--dry-run"], {
+                "help": "Only list videos which would be downloaded.",
                 "action": "store_true",
                 "default": False,
             }),
-            (["--overwrite"], {
-                "help": "Overwrite the target file if it already exists without prompting.",
-                "action": "store_true",
-                "default": False,
-            }),
-            (["-o", "--output"], {
-                "help": "Output file name template. See docs for details.",
-                "type": str,
-                "default": "{date}_{id}_{channel_login}_{title_slug}.{format}"
-            }),
-            (["-r", "--rate-limit"], {
-                "help": "Limit the maximum download speed in bytes per second. "
-                        "Use 'k' and 'm' suffixes for kbps and mbps.",
-                "type": rate,
-            }),
-        ],
+        ] + [option for option in DOWNLOAD_OPTIONS if option[0][-1] not in SYNC_EXCLUDED],
     ),
     Command(
         name="info",
@@ -250,6 +454,29 @@ COMMANDS = [
             }),
         ],
     ),
+    Command(
+        name="cache",
+        description="List or prune VODs kept in the segment cache.",
+        arguments=[
+            (["--prune"], {
+                "help": "Remove least recently used VODs until the cache is under the "
+                        "maximum size",
+                "action": "store_true",
+                "default": False,
+            }),
+            (["--max-size"], {
+                "help": "Maximum size of the cache when pruning. Use 'k', 'm' and 'g' "
+                        "suffixes for kB, MB and GB. Defaults to 10g.",
+                "type": size,
+                "default": 10 * 1024 ** 3,
+            }),
+            (["--clear"], {
+                "help": "Remove all VODs from the cache",
+                "action": "store_true",
+                "default": False,
+            }),
+        ],
+    ),
     Command(
         name="env",
         description="Print environment information for inclusion in bug reports.",
@@ -267,7 +494,29 @@ COMMON_ARGUMENTS = [
         "help": "disable ANSI colors in output",
         "action": 'store_true',
         "default": False,
-    })
+    }),
+    (["--cache"], {
+        "help": "cache video metadata, game IDs, access tokens and playlists on disk, "
+                "enabled by default if TWITCH_DL_CACHE is set",
+        "action": 'store_true',
+        "default": bool(os.getenv("TWITCH_DL_CACHE")),
+    }),
+    (["--no-cache"], {
+        "help": "don't use the cache",
+        "action": 'store_false',
+        "dest": "cache",
+    }),
+    (["--refresh"], {
+        "help": "ignore cached entries, fetch them again and update the cache",
+        "action": 'store_true',
+        "default": False,
+    }),
+    (["--profile"], {
+        "help": "profile the command and save the stats to given file, print a "
+                "summary including event loop stalls while downloading",
+        "metavar": "PATH",
+        "type": str,
+    }),
 ]
 
 
@@ -310,6 +559,11 @@ def main():
         parser.print_help()
         return
 
+    cache.configure(args.cache, args.refresh)
+
+    if args.profile:
+        profiling.start(args.profile)
+
     try:
         args.func(args)
     except ConsoleError as e:
@@ -323,3 +577,5 @@ def main():
         for err in e.errors:
             print_err("*", err["message"])
         sys.exit(1)
+    finally:
+        profiling.stop()
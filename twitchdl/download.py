@@ -1,6 +1,8 @@
 import os
 import httpx
 
+from twitchdl.http import get_client
+
 CHUNK_SIZE = 1024
 CONNECT_TIMEOUT = 5
 RETRY_COUNT = 5
@@ -13,7 +15,7 @@ class DownloadFailed(Exception):
 def _download(url: str, path: str):
     tmp_path = path + ".tmp"
     size = 0
-    with httpx.stream("GET", url, timeout=CONNECT_TIMEOUT) as response:
+    with get_client().stream("GET", url, timeout=CONNECT_TIMEOUT) as response:
         with open(tmp_path, "wb") as target:
             for chunk in response.iter_bytes(chunk_size=CHUNK_SIZE):
                 target.write(chunk)
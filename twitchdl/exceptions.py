@@ -2,3 +2,8 @@
 class ConsoleError(Exception):
     """Raised when an error occurs and script exectuion should halt."""
     pass
+
+
+class OutputExists(ConsoleError):
+    """Raised when a target file exists and prompting to overwrite it is disabled."""
+    pass
@@ -0,0 +1,184 @@
+"""
+Hedged requests for VODs which are downloading much slower than the rest.
+
+Near the end of a download, when no VODs are waiting for a worker, a few slow
+VODs decide when the download finishes. Such stragglers are requested again
+on an idle connection, the first request to finish wins and the other one is
+cancelled. The amount of data downloaded by hedged requests is capped.
+"""
+
+import asyncio
+import logging
+import os
+import statistics
+import time
+
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from twitchdl.progress import Progress
+
+logger = logging.getLogger(__name__)
+
+HEDGE_INTERVAL = 0.5
+"""Seconds between checks for stragglers"""
+
+HEDGE_THRESHOLD = 3.0
+"""A VOD is a straggler when it takes this many times longer than the median VOD"""
+
+HEDGE_MIN_SAMPLES = 5
+"""Minimum number of downloaded VODs needed to tell a straggler"""
+
+HEDGE_BUDGET_SHARE = 0.05
+"""Default cap on hedged data, relative to the estimated size of the download"""
+
+Fetch = Callable[[int, str], Awaitable[None]]
+"""Downloads a VOD to given path, reporting progress under given task ID"""
+
+
+def _hedge_id(task_id: int) -> int:
+    """Progress task ID for the hedged request of a task."""
+    return -1 - task_id
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+@dataclass
+class _InFlight:
+    task_id: int
+    target: str
+    fetch: Fetch
+    started: float
+    result: asyncio.Future
+    primary: Optional[asyncio.Task] = None
+    hedge: Optional[asyncio.Task] = None
+
+    @property
+    def hedge_target(self) -> str:
+        return f"{self.target}.hedge"
+
+
+@dataclass
+class Hedger:
+    """
+    Runs VOD downloads and hedges stragglers. `max_active` returns the
+    current number of workers, hedged requests are not started while as many
+    requests are active. `budget` is the maximum number of bytes hedged
+    requests may download, by default a share of the estimated download size.
+    """
+    progress: Progress
+    task_count: int
+    max_active: Callable[[], int]
+    budget: Optional[int] = None
+    queued: int = field(init=False)
+    hedged_bytes: int = 0
+    hedged: Set[int] = field(default_factory=set)
+    won: Set[int] = field(default_factory=set)
+    durations: List[float] = field(default_factory=list)
+    sizes: List[int] = field(default_factory=list)
+    in_flight: Dict[int, _InFlight] = field(default_factory=dict)
+
+    def __post_init__(self):
+        self.queued = self.task_count
+
+    def dequeued(self):
+        """Called when a VOD gets a worker."""
+        self.queued -= 1
+
+    async def run(self, task_id: int, target: str, fetch: Fetch):
+        """Download a VOD using `fetch`, racing a hedged request if it falls behind."""
+        entry = _InFlight(task_id, target, fetch, time.monotonic(),
+                          asyncio.get_running_loop().create_future())
+        entry.primary = self._start(entry, task_id, target)
+        self.in_flight[task_id] = entry
+
+        try:
+            winner = await entry.result
+        finally:
+            del self.in_flight[task_id]
+            tasks = [task for task in (entry.primary, entry.hedge) if task]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+            if entry.hedge and entry.hedge.cancelled():
+                self._discard(_hedge_id(task_id), entry.hedge_target)
+            if entry.primary.cancelled():
+                self._discard(task_id, target)
+
+        if winner is entry.hedge:
+            os.replace(entry.hedge_target, target)
+            self.won.add(task_id)
+
+        self.durations.append(time.monotonic() - entry.started)
+        self.sizes.append(os.path.getsize(target))
+
+    async def monitor(self):
+        """Periodically hedge stragglers, runs until cancelled."""
+        while True:
+            await asyncio.sleep(HEDGE_INTERVAL)
+            self._hedge_stragglers()
+
+    def _start(self, entry: _InFlight, task_id: int, target: str) -> asyncio.Task:
+        task = asyncio.create_task(entry.fetch(task_id, target))
+        task.add_done_callback(lambda task: self._on_done(entry, task, task_id))
+        return task
+
+    def _on_done(self, entry: _InFlight, task: asyncio.Task, task_id: int):
+        if task.cancelled() or entry.result.done():
+            return
+
+        error = task.exception()
+        if error is None:
+            entry.result.set_result(task)
+            return
+
+        if task_id in self.progress.tasks:
+            self.progress.abort(task_id)
+
+        # Keep waiting for the other request, if there is one
+        other = entry.hedge if task is entry.primary else entry.primary
+        if other is None or other.done():
+            entry.result.set_exception(error)
+
+    def _discard(self, task_id: int, target: str):
+        """Clean up after a cancelled request."""
+        if task_id in self.progress.tasks:
+            self.progress.abort(task_id)
+        _remove(f"{target}.tmp")
+
+    def _hedge_stragglers(self):
+        if self.queued or len(self.durations) < HEDGE_MIN_SAMPLES:
+            return
+
+        threshold = statistics.median(self.durations) * HEDGE_THRESHOLD
+        budget = self.budget
+        if budget is None:
+            budget = int(statistics.median(self.sizes) * self.task_count * HEDGE_BUDGET_SHARE)
+
+        now = time.monotonic()
+        max_active = self.max_active()
+        active = sum(2 if entry.hedge else 1 for entry in self.in_flight.values())
+        for entry in sorted(self.in_flight.values(), key=lambda entry: entry.started):
+            if active >= max_active:
+                break
+
+            if entry.hedge or entry.result.done() or now - entry.started < threshold:
+                continue
+
+            # Reserve the whole VOD, so the budget is never exceeded
+            task = self.progress.tasks.get(entry.task_id)
+            size = task.size if task and task.size else statistics.median(self.sizes)
+            if self.hedged_bytes + size > budget:
+                continue
+
+            logger.info(f"Task {entry.task_id}: slow after {now - entry.started:.1f}s, hedging")
+            self.hedged_bytes += size
+            self.hedged.add(entry.task_id)
+            entry.hedge = self._start(entry, _hedge_id(entry.task_id), entry.hedge_target)
+            active += 1
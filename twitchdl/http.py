@@ -1,12 +1,26 @@
 import asyncio
+import atexit
 import httpx
 import logging
 import os
+import random
+import re
 import time
 
-from typing import List, Optional, Union
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Callable, List, Optional, Tuple, Union
+from urllib.parse import urlparse
 
+from twitchdl.hedging import Hedger
+from twitchdl.metrics import (
+    STATUS_DOWNLOADED, STATUS_EXISTING, STATUS_FAILED, VodMetrics, get_metrics)
+from twitchdl.output import print_out
+from twitchdl.profiling import lag_sampler
 from twitchdl.progress import Progress
+from twitchdl.utils import format_size
+from twitchdl.validator import VALIDATE_NONE, InvalidVod, VodValidator
+from twitchdl.writer import VodWriter, WriteOptions, written_length
 
 logger = logging.getLogger(__name__)
 
@@ -18,35 +32,167 @@ CHUNK_SIZE = 256 * KB
 RETRY_COUNT = 5
 """Number of times to retry failed downloads before aborting."""
 
+RETRY_BACKOFF = 1.0
+"""Base delay in seconds between retries, doubled on each subsequent retry."""
+
+RETRY_MAX_DELAY = 60.0
+"""Maximum delay in seconds between retries, also caps `Retry-After`."""
+
+RETRY_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+"""HTTP status codes which indicate a temporary failure worth retrying."""
+
 TIMEOUT = 30
 """
 Number of seconds to wait before aborting when there is no network activity.
 https://www.python-httpx.org/advanced/#timeout-configuration
 """
 
+KEEPALIVE_EXPIRY = 30
+"""
+Number of seconds to keep idle connections open for reuse.
+https://www.python-httpx.org/advanced/#pool-limit-configuration
+"""
+
+AUTO_INITIAL_WORKERS = 2
+"""Number of workers to start with when worker count is chosen automatically."""
+
+AUTO_MAX_WORKERS = 20
+"""Maximum number of workers when worker count is chosen automatically."""
+
+AUTO_WINDOW = 4
+"""Minimum number of downloaded VODs over which throughput is measured."""
+
+AUTO_THRESHOLD = 0.05
+"""Relative change in throughput considered to be significant."""
+
+
+@dataclass
+class ConnectionStats:
+    """Counts requests and connections made by a client, to show connection reuse."""
+    requests: int = 0
+    connections: int = 0
+    tls_handshakes: int = 0
+
+    async def on_request(self, request: httpx.Request):
+        """Request event hook which enables tracing of the request."""
+        request.extensions["trace"] = self.trace
+
+    async def trace(self, event_name: str, info: dict):
+        if event_name == "connection.connect_tcp.complete":
+            self.connections += 1
+        elif event_name == "connection.start_tls.complete":
+            self.tls_handshakes += 1
+        elif event_name.endswith(".send_request_headers.started"):
+            self.requests += 1
+
+    def __str__(self):
+        return (f"{self.requests} requests over {self.connections} connections, "
+                f"{self.tls_handshakes} TLS handshakes")
+
+
+def make_download_client(workers: Optional[int], http2: bool = False) -> httpx.AsyncClient:
+    """
+    Make a client for `download_all` with a connection pool large enough to
+    serve all workers. Passing the same client to multiple calls keeps
+    connections open between them.
+    """
+    workers = workers or AUTO_MAX_WORKERS
+    limits = httpx.Limits(
+        max_connections=workers,
+        max_keepalive_connections=workers,
+        keepalive_expiry=KEEPALIVE_EXPIRY,
+    )
+
+    return httpx.AsyncClient(
+        timeout=TIMEOUT,
+        limits=limits,
+        http2=http2,
+        event_hooks={"request": []},
+    )
+
+
+_client: Optional[httpx.Client] = None
+_async_client: Optional[httpx.AsyncClient] = None
+_async_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_client() -> httpx.Client:
+    """
+    Returns the shared client, created on first use. Connections are kept
+    alive between requests, so subsequent requests to the same host skip
+    connecting and the TLS handshake.
+    """
+    global _client
+    if _client is None:
+        limits = httpx.Limits(keepalive_expiry=KEEPALIVE_EXPIRY)
+        _client = httpx.Client(timeout=TIMEOUT, limits=limits)
+        atexit.register(_client.close)
+    return _client
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    Returns the shared async client for the running event loop, created on
+    first use. Close it with `close_async_client` before the loop ends.
+    """
+    global _async_client, _async_client_loop
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client_loop is not loop:
+        limits = httpx.Limits(keepalive_expiry=KEEPALIVE_EXPIRY)
+        _async_client = httpx.AsyncClient(timeout=TIMEOUT, limits=limits)
+        _async_client_loop = loop
+    return _async_client
+
+
+async def close_async_client():
+    global _async_client, _async_client_loop
+    if _async_client is not None and _async_client_loop is asyncio.get_running_loop():
+        await _async_client.aclose()
+    _async_client = None
+    _async_client_loop = None
+
 
 class TokenBucket:
-    """Limit the download speed by strategically inserting sleeps."""
+    """
+    Limit the download speed by strategically inserting sleeps.
+
+    Sleeps are awaited so the event loop keeps running while a worker is
+    throttled. Workers are served in FIFO order, one chunk at a time, which
+    shares the available bandwidth fairly between them.
+    """
 
     def __init__(self, rate: int, capacity: Optional[int] = None):
         self.rate: int = rate
         self.capacity: int = capacity or rate * 2
         self.available: int = 0
-        self.last_refilled: float = time.time()
+        self.last_refilled: float = time.monotonic()
+        self.lock = asyncio.Lock()
 
-    def advance(self, size: int):
+    async def advance(self, size: int):
         """Called every time a chunk of data is downloaded."""
-        self._refill()
+        async with self.lock:
+            self._refill()
+
+            if self.available < size:
+                deficit = size - self.available
+                await asyncio.sleep(deficit / self.rate)
 
-        if self.available < size:
-            deficit = size - self.available
-            time.sleep(deficit / self.rate)
+            self.available -= size
 
-        self.available -= size
+    async def set_rate(self, rate: int, capacity: Optional[int] = None):
+        """
+        Change the rate limit, takes effect from the next chunk. Tokens
+        accumulated until now are counted at the previous rate.
+        """
+        async with self.lock:
+            self._refill()
+            self.rate = rate
+            self.capacity = capacity or rate * 2
+            self.available = min(self.available, self.capacity)
 
     def _refill(self):
         """Increase available capacity according to elapsed time since last refill."""
-        now = time.time()
+        now = time.monotonic()
         elapsed = now - self.last_refilled
         refill_amount = int(elapsed * self.rate)
         self.available = min(self.available + refill_amount, self.capacity)
@@ -55,13 +201,193 @@ class TokenBucket:
 
 class EndlessTokenBucket:
     """Used when download speed is not limited."""
-    def advance(self, size: int):
+    async def advance(self, size: int):
         pass
 
 
 AnyTokenBucket = Union[TokenBucket, EndlessTokenBucket]
 
 
+class AdaptiveSemaphore:
+    """
+    A semaphore which adjusts the number of workers based on measured
+    throughput and latency.
+
+    Starts with a few workers and adds one at a time while doing so increases
+    throughput, up to `max_workers`. When adding a worker stops helping, it
+    settles on the best performing worker count. Once settled, a worker is
+    removed if throughput drops while VOD download latency grows.
+    """
+
+    def __init__(self, max_workers: int, initial_workers: int = AUTO_INITIAL_WORKERS):
+        self.max_workers = max_workers
+        self.limit = min(initial_workers, max_workers)
+        self.active = 0
+        self.settled = False
+        self.condition = asyncio.Condition()
+        self.best_limit = self.limit
+        self.best_throughput = 0.0
+        self.best_latency = 0.0
+        self._reset_window()
+
+    async def __aenter__(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+
+    async def __aexit__(self, *args):
+        async with self.condition:
+            self.active -= 1
+            self.condition.notify(max(self.limit - self.active, 0))
+
+    def record(self, size: int, duration: float):
+        """Called every time a VOD is downloaded."""
+        self.window_bytes += size
+        self.window_duration += duration
+        self.window_count += 1
+
+        if self.window_count >= max(self.limit, AUTO_WINDOW):
+            self._adjust()
+
+    def _adjust(self):
+        elapsed = time.monotonic() - self.window_start
+        throughput = self.window_bytes / elapsed if elapsed > 0 else 0.0
+        latency = self.window_duration / self.window_count
+
+        if not self.settled:
+            if throughput > self.best_throughput * (1 + AUTO_THRESHOLD):
+                self.best_limit = self.limit
+                self.best_throughput = throughput
+                self.best_latency = latency
+                if self.limit < self.max_workers:
+                    self.limit += 1
+                else:
+                    self.settled = True
+            else:
+                self.limit = self.best_limit
+                self.settled = True
+        elif self.limit > 1 and self._is_congested(throughput, latency):
+            self.limit -= 1
+            self.best_limit = self.limit
+            self.best_throughput = throughput
+            self.best_latency = latency
+
+        logger.debug(f"{throughput:.0f} B/s, {latency:.2f}s latency, now {self.limit} workers")
+        self._reset_window()
+
+    def _is_congested(self, throughput: float, latency: float) -> bool:
+        """Throughput dropped while latency grew, likely due to too many workers."""
+        slower = throughput < self.best_throughput * (1 - AUTO_THRESHOLD)
+        laggier = latency > self.best_latency * (1 + AUTO_THRESHOLD)
+        return slower and laggier
+
+    def _reset_window(self):
+        self.window_start = time.monotonic()
+        self.window_bytes = 0
+        self.window_duration = 0.0
+        self.window_count = 0
+
+
+AnySemaphore = Union[asyncio.Semaphore, AdaptiveSemaphore]
+
+
+class ShortRead(Exception):
+    """Raised when a response body is shorter than announced."""
+    pass
+
+
+def _parse_retry_after(response: httpx.Response) -> Optional[float]:
+    """Returns the delay requested by the Retry-After header, if any."""
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+
+    if value.isdigit():
+        return float(value)
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    return max(retry_at.timestamp() - time.time(), 0.0)
+
+
+@dataclass
+class RetryPolicy:
+    """Decides which failed downloads are retried, and how long to wait before doing so."""
+    retries: int = RETRY_COUNT
+    backoff: float = RETRY_BACKOFF
+    max_delay: float = RETRY_MAX_DELAY
+
+    def is_retryable(self, error: Exception) -> bool:
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code in RETRY_STATUS_CODES
+        return True
+
+    def get_delay(self, attempt: int, error: Exception) -> float:
+        """Exponential backoff with full jitter, unless the server says otherwise."""
+        # Corrupt content is not a sign of an overloaded server, retry right away
+        if isinstance(error, InvalidVod):
+            return 0
+
+        if isinstance(error, httpx.HTTPStatusError):
+            retry_after = _parse_retry_after(error.response)
+            if retry_after is not None:
+                return min(retry_after, self.max_delay)
+
+        return random.uniform(0, min(self.backoff * 2 ** attempt, self.max_delay))
+
+
+class RangeNotHonored(Exception):
+    """Raised when a server responds to a range request with unexpected content."""
+    pass
+
+
+def _get_offset_and_size(response: httpx.Response, offset: int) -> Tuple[int, Optional[int]]:
+    """
+    Given a response to a request for content starting at `offset`, returns
+    the offset at which the response content starts and the total size of the
+    resource, or None if the size is not known, e.g. for chunked responses.
+    """
+    if offset and response.status_code == 416:
+        raise RangeNotHonored("Range not satisfiable")
+
+    response.raise_for_status()
+
+    if not offset or response.status_code == 200:
+        # Either not resuming, or the server ignored the range header
+        length = response.headers.get("content-length")
+        return 0, int(length) if length else None
+
+    content_range = response.headers.get("content-range", "")
+    match = re.match(r"^bytes (\d+)-(\d+)/(\d+|\*)$", content_range)
+    if not match or int(match.group(1)) != offset:
+        raise RangeNotHonored(f"Unexpected Content-Range '{content_range}'")
+
+    end = int(match.group(2)) + 1
+    length = response.headers.get("content-length")
+    if length and end - offset != int(length):
+        raise RangeNotHonored(f"Content-Range '{content_range}' does not match length {length}")
+
+    total = match.group(3)
+    if total != "*" and int(total) != end:
+        raise RangeNotHonored(f"Content-Range '{content_range}' does not reach the end")
+
+    return offset, end
+
+
+def _validate_file(validator: VodValidator, path: str, size: int):
+    """Validate the first `size` bytes of a partially downloaded file."""
+    with open(path, "rb") as f:
+        while size > 0:
+            chunk = f.read(min(size, CHUNK_SIZE))
+            if not chunk:
+                break
+            validator.feed(chunk)
+            size -= len(chunk)
+
+
 async def download(
     client: httpx.AsyncClient,
     task_id: int,
@@ -69,61 +395,225 @@ async def download(
     target: str,
     progress: Progress,
     token_bucket: AnyTokenBucket,
+    chunk_size: int = CHUNK_SIZE,
+    write_options: WriteOptions = WriteOptions(),
+    validation: str = VALIDATE_NONE,
+    vod_metrics: Optional[VodMetrics] = None,
 ):
     # Download to a temp file first, then copy to target when over to avoid
-    # getting saving chunks which may persist if canceled or --keep is used
+    # getting saving chunks which may persist if canceled or --keep is used.
+    # If a temp file exists from a previous attempt, resume it using a range
+    # request.
     tmp_target = f"{target}.tmp"
-    with open(tmp_target, "wb") as f:
-        async with client.stream("GET", source) as response:
-            size = int(response.headers.get("content-length"))
-            progress.start(task_id, size)
-            async for chunk in response.aiter_bytes(chunk_size=CHUNK_SIZE):
-                f.write(chunk)
-                size = len(chunk)
-                token_bucket.advance(size)
-                progress.advance(task_id, size)
-            progress.end(task_id)
+    offset = written_length(tmp_target)
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+    downloaded = offset
+    requested = time.monotonic()
+    responded = None
+    writer = None
+    refetch = False
+
+    try:
+        async with client.stream("GET", source, headers=headers) as response:
+            responded = time.monotonic()
+            offset, size = _get_offset_and_size(response, offset)
+            downloaded = offset
+
+            # Only MPEG-TS content can be validated, other VODs are checked for length
+            is_ts = urlparse(source).path.endswith(".ts")
+            validator = VodValidator(validation if is_ts else VALIDATE_NONE)
+            if offset:
+                _validate_file(validator, tmp_target, offset)
+
+            # Without a known size, nothing is preallocated and the length isn't checked
+            with VodWriter(tmp_target, size or 0, offset, write_options) as writer:
+                progress.start(task_id, size or 0, offset)
+                async for chunk in response.aiter_bytes(chunk_size=chunk_size):
+                    validator.feed(chunk)
+                    writer.write(chunk)
+                    downloaded += len(chunk)
+                    await token_bucket.advance(len(chunk))
+                    progress.advance(task_id, len(chunk))
+
+                if size is None:
+                    progress.set_size(task_id, downloaded)
+                elif downloaded < size:
+                    raise ShortRead(f"Task {task_id}: got {downloaded}b, expected {size}b")
+                validator.finish()
+                progress.end(task_id)
+    except InvalidVod as e:
+        # Don't resume from corrupt content on retry
+        os.unlink(tmp_target)
+        raise InvalidVod(f"Task {task_id}: {e}")
+    except RangeNotHonored as e:
+        logger.warning(f"Task {task_id}: cannot resume, refetching. {e}")
+        os.unlink(tmp_target)
+        refetch = True
+    finally:
+        if vod_metrics and responded:
+            vod_metrics.ttfb = responded - requested
+            vod_metrics.transfer_time = time.monotonic() - responded
+            vod_metrics.write_time += writer.write_time if writer else 0
+            vod_metrics.bytes += downloaded - offset
+
+    if refetch:
+        return await download(client, task_id, source, target, progress, token_bucket,
+                              chunk_size, write_options, validation, vod_metrics)
+
     os.rename(tmp_target, target)
 
 
 async def download_with_retries(
     client: httpx.AsyncClient,
-    semaphore: asyncio.Semaphore,
+    semaphore: AnySemaphore,
     task_id: int,
     source: str,
     target: str,
     progress: Progress,
     token_bucket: AnyTokenBucket,
+    retry_policy: RetryPolicy,
+    chunk_size: int = CHUNK_SIZE,
+    write_options: WriteOptions = WriteOptions(),
+    validation: str = VALIDATE_NONE,
+    hedger: Optional[Hedger] = None,
+    vod_metrics: Optional[VodMetrics] = None,
 ):
     async with semaphore:
+        if hedger:
+            hedger.dequeued()
+        if vod_metrics:
+            vod_metrics.started()
+
         if os.path.exists(target):
             size = os.path.getsize(target)
             progress.already_downloaded(task_id, size)
+            if vod_metrics:
+                vod_metrics.status = STATUS_EXISTING
             return
 
-        for n in range(RETRY_COUNT):
+        for n in range(retry_policy.retries):
             try:
-                return await download(client, task_id, source, target, progress, token_bucket)
-            except httpx.RequestError:
-                logger.exception("Task {task_id} failed. Retrying. Maybe.")
-                progress.abort(task_id)
-                if n + 1 >= RETRY_COUNT:
+                start = time.monotonic()
+                if hedger:
+                    # Hedged requests are not measured, they would overwrite timings
+                    await hedger.run(task_id, target, lambda progress_id, path: download(
+                        client, progress_id, source, path, progress, token_bucket,
+                        chunk_size, write_options, validation,
+                        vod_metrics if progress_id == task_id else None))
+                else:
+                    await download(client, task_id, source, target, progress, token_bucket,
+                                   chunk_size, write_options, validation, vod_metrics)
+                if isinstance(semaphore, AdaptiveSemaphore):
+                    semaphore.record(os.path.getsize(target), time.monotonic() - start)
+                if vod_metrics:
+                    vod_metrics.status = STATUS_DOWNLOADED
+                return
+            except (httpx.RequestError, httpx.HTTPStatusError, ShortRead, InvalidVod) as e:
+                if task_id in progress.tasks:
+                    progress.abort(task_id)
+                if n + 1 >= retry_policy.retries or not retry_policy.is_retryable(e):
+                    if vod_metrics:
+                        vod_metrics.status = STATUS_FAILED
+                        vod_metrics.error = str(e)
                     raise
 
+                if vod_metrics:
+                    vod_metrics.retries += 1
+
+                delay = retry_policy.get_delay(n, e)
+                logger.warning(f"Task {task_id} failed: {e}. Retrying in {delay:.1f}s.")
+                await asyncio.sleep(delay)
+
         raise Exception("Should not happen")
 
 
 async def download_all(
     sources: List[str],
     targets: List[str],
-    workers: int,
+    workers: Optional[int],
     /, *,
-    rate_limit: Optional[int] = None
+    rate_limit: Optional[int] = None,
+    retry_policy: Optional[RetryPolicy] = None,
+    on_complete: Optional[Callable[[int], None]] = None,
+    http2: bool = False,
+    chunk_size: int = CHUNK_SIZE,
+    write_options: Optional[WriteOptions] = None,
+    validation: str = VALIDATE_NONE,
+    hedge_budget: Optional[int] = None,
+    token_bucket: Optional[AnyTokenBucket] = None,
+    client: Optional[httpx.AsyncClient] = None,
 ):
+    """
+    Download sources to targets concurrently. If given, `on_complete` is
+    called with the index of each target once it has been downloaded.
+
+    Download speed is limited to `rate_limit`, unless a `token_bucket` is
+    given, which lets the caller change the limit while downloading.
+
+    A client made by `make_download_client` can be given to reuse connections
+    between calls, otherwise a new one is made and closed when done.
+
+    Slow VODs are hedged once all VODs are being downloaded, `hedge_budget`
+    caps the extra bytes that may take, 0 disables hedging.
+    """
     progress = Progress(len(sources))
-    token_bucket = TokenBucket(rate_limit) if rate_limit else EndlessTokenBucket()
-    async with httpx.AsyncClient(timeout=TIMEOUT) as client:
-        semaphore = asyncio.Semaphore(workers)
-        tasks = [download_with_retries(client, semaphore, task_id, source, target, progress, token_bucket)
+    retry_policy = retry_policy or RetryPolicy()
+    write_options = write_options or WriteOptions()
+    if not token_bucket:
+        token_bucket = TokenBucket(rate_limit) if rate_limit else EndlessTokenBucket()
+    semaphore = asyncio.Semaphore(workers) if workers else AdaptiveSemaphore(AUTO_MAX_WORKERS)
+    # Don't let hedged requests exceed the concurrency settled on by --max-workers auto
+    max_active = (lambda: workers) if workers else (lambda: semaphore.limit)
+    hedger = (Hedger(progress, len(sources), max_active, hedge_budget)
+              if hedge_budget != 0 else None)
+
+    metrics = get_metrics()
+    run = metrics.start_run(workers) if metrics else None
+    vod_metrics = [VodMetrics(source) if run else None for source in sources]
+    if run:
+        run.vods.extend(vod_metrics)
+
+    async def download_one(client: httpx.AsyncClient, task_id: int, source: str, target: str):
+        await download_with_retries(client, semaphore, task_id, source, target, progress,
+                                    token_bucket, retry_policy, chunk_size, write_options,
+                                    validation, hedger, vod_metrics[task_id])
+        if on_complete:
+            on_complete(task_id)
+
+    own_client = client is None
+    if own_client:
+        client = make_download_client(workers, http2)
+
+    # Count only requests made by this call, the client may be shared
+    stats = ConnectionStats()
+    client.event_hooks["request"].append(stats.on_request)
+
+    monitor = asyncio.create_task(hedger.monitor()) if hedger else None
+    sampler = lag_sampler()
+    sampling = asyncio.create_task(sampler.run()) if sampler else None
+    try:
+        tasks = [download_one(client, task_id, source, target)
                  for task_id, (source, target) in enumerate(zip(sources, targets))]
         await asyncio.gather(*tasks)
+    finally:
+        if monitor:
+            monitor.cancel()
+        if sampling:
+            sampling.cancel()
+        if metrics and run:
+            if hedger:
+                for task_id in hedger.hedged:
+                    run.vods[task_id].hedged = True
+                run.hedge_wins = len(hedger.won)
+            metrics.end_run(run)
+
+        client.event_hooks["request"].remove(stats.on_request)
+        if own_client:
+            await client.aclose()
+
+    print_out(f"\n<dim>Made {stats}</dim>")
+    if hedger and hedger.hedged:
+        print_out(f"<dim>Hedged {len(hedger.hedged)} slow VODs, {len(hedger.won)} finished sooner, "
+                  f"using up to {format_size(hedger.hedged_bytes)} extra</dim>")
+    if isinstance(semaphore, AdaptiveSemaphore):
+        print_out(f"<dim>Adaptive concurrency settled on {semaphore.limit} workers</dim>")
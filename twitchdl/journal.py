@@ -0,0 +1,94 @@
+"""
+Journal of a video download, kept in its temp dir.
+
+The journal is an append-only JSON lines file which records the download job
+and each VOD once it has been downloaded, along with the file it was saved to
+and its size. An interrupted download can be resumed from the journal without
+looking up the video again or reading VODs which have already been downloaded.
+"""
+
+import json
+import os
+
+from typing import Dict, Optional
+
+JOURNAL_FILE = "journal.jsonl"
+
+
+class Journal:
+    def __init__(self, target_dir: str):
+        self.path = os.path.join(target_dir, JOURNAL_FILE)
+        self.job: Optional[dict] = None
+        self.completed: Dict[str, dict] = {}
+        self.file = None
+        self.incomplete = False
+        self._read()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def start(self, job: dict):
+        """Record the job, unless it's the same as the one already recorded."""
+        if self.job != job:
+            self.job = job
+            self._append({"type": "job", "job": job})
+
+    def is_completed(self, vod_path: str, target: str) -> bool:
+        """Whether the VOD has been downloaded to given target, and it still has that size."""
+        record = self.completed.get(vod_path)
+        if record is None or record["target"] != os.path.basename(target):
+            return False
+
+        try:
+            return os.path.getsize(target) == record["size"]
+        except FileNotFoundError:
+            return False
+
+    def record(self, vod_path: str, target: str):
+        """Record a downloaded VOD."""
+        record = {
+            "type": "vod",
+            "path": vod_path,
+            "target": os.path.basename(target),
+            "size": os.path.getsize(target),
+        }
+        self.completed[vod_path] = record
+        self._append(record)
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def _read(self):
+        try:
+            f = open(self.path)
+        except FileNotFoundError:
+            return
+
+        with f:
+            for line in f:
+                # Last line is incomplete if interrupted while writing it
+                self.incomplete = not line.endswith("\n")
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+
+                if record["type"] == "job":
+                    self.job = record["job"]
+                elif record["type"] == "vod":
+                    self.completed[record["path"]] = record
+
+    def _append(self, record: dict):
+        if not self.file:
+            self.file = open(self.path, "a")
+            if self.incomplete:
+                self.file.write("\n")
+                self.incomplete = False
+
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
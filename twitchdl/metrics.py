@@ -0,0 +1,183 @@
+"""
+Metrics of VOD downloads, for telling apart slow CDN responses, slow disks and
+badly tuned concurrency.
+
+Timings are recorded for each VOD and totals for each run of `download_all`.
+Once a run finishes, they are appended to a JSON lines file, or totals for all
+runs are written to a file in the Prometheus text format, to be picked up by
+the node exporter's textfile collector.
+"""
+
+import json
+import os
+import time
+
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+FORMAT_JSON_LINES = "json-lines"
+FORMAT_PROMETHEUS = "prometheus"
+
+FORMATS = [FORMAT_JSON_LINES, FORMAT_PROMETHEUS]
+
+STATUS_PENDING = "pending"
+STATUS_DOWNLOADED = "downloaded"
+STATUS_EXISTING = "existing"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+
+HISTOGRAM_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+"""Upper bounds of Prometheus histogram buckets in seconds"""
+
+
+@dataclass
+class VodMetrics:
+    url: str
+    queued_at: float = field(default_factory=time.monotonic, repr=False)
+    queue_wait: Optional[float] = None
+    ttfb: Optional[float] = None
+    transfer_time: Optional[float] = None
+    write_time: float = 0.0
+    bytes: int = 0
+    retries: int = 0
+    hedged: bool = False
+    status: str = STATUS_PENDING
+    error: Optional[str] = None
+
+    def started(self):
+        """Called when the VOD gets a worker."""
+        self.queue_wait = time.monotonic() - self.queued_at
+
+    def to_record(self) -> dict:
+        record = asdict(self)
+        del record["queued_at"]
+        return {"type": "vod", **record}
+
+
+@dataclass
+class RunMetrics:
+    workers: Optional[int]
+    started_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    started: float = field(default_factory=time.monotonic)
+    duration: Optional[float] = None
+    vods: List[VodMetrics] = field(default_factory=list)
+    hedge_wins: int = 0
+
+    def to_record(self) -> dict:
+        statuses: Dict[str, int] = {}
+        for vod in self.vods:
+            statuses[vod.status] = statuses.get(vod.status, 0) + 1
+
+        return {
+            "type": "run",
+            "started_at": self.started_at.isoformat(),
+            "duration": self.duration,
+            "workers": self.workers,
+            "vods": len(self.vods),
+            "statuses": statuses,
+            "bytes": sum(vod.bytes for vod in self.vods),
+            "retries": sum(vod.retries for vod in self.vods),
+            "hedged": sum(vod.hedged for vod in self.vods),
+            "hedge_wins": self.hedge_wins,
+        }
+
+
+class Metrics:
+    def __init__(self, path: str, format: str = FORMAT_JSON_LINES):
+        self.path = path
+        self.format = format
+        self.runs: List[RunMetrics] = []
+
+    def start_run(self, workers: Optional[int]) -> RunMetrics:
+        run = RunMetrics(workers)
+        self.runs.append(run)
+        return run
+
+    def end_run(self, run: RunMetrics):
+        run.duration = time.monotonic() - run.started
+        for vod in run.vods:
+            if vod.status == STATUS_PENDING:
+                vod.status = STATUS_CANCELLED
+
+        if self.format == FORMAT_PROMETHEUS:
+            self._write_prometheus()
+        else:
+            self._write_json_lines(run)
+
+    def _write_json_lines(self, run: RunMetrics):
+        with open(self.path, "a") as f:
+            for vod in run.vods:
+                f.write(json.dumps(vod.to_record()) + "\n")
+            f.write(json.dumps(run.to_record()) + "\n")
+
+    def _write_prometheus(self):
+        # The collector may read the file at any time, so replace it in one go
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(_prometheus_text(self.runs))
+        os.replace(tmp_path, self.path)
+
+
+def _prometheus_text(runs: List[RunMetrics]) -> str:
+    vods = [vod for run in runs for vod in run.vods]
+    lines: List[str] = []
+
+    def metric(name, type, help, samples):
+        lines.append(f"# HELP twitchdl_{name} {help}")
+        lines.append(f"# TYPE twitchdl_{name} {type}")
+        for labels, value in samples:
+            lines.append(f"twitchdl_{name}{labels} {value}")
+
+    def histogram(name, help, values):
+        samples = []
+        for bound in HISTOGRAM_BUCKETS:
+            samples.append((f'_bucket{{le="{bound}"}}', sum(value <= bound for value in values)))
+        samples.append(('_bucket{le="+Inf"}', len(values)))
+        samples.append(("_sum", round(sum(values), 6)))
+        samples.append(("_count", len(values)))
+        metric(name, "histogram", help, samples)
+
+    statuses = sorted(set(vod.status for vod in vods))
+    metric("vods_total", "counter", "VODs by final status.",
+           [(f'{{status="{status}"}}', sum(vod.status == status for vod in vods))
+            for status in statuses])
+    metric("vod_bytes_total", "counter", "Bytes of VODs downloaded.",
+           [("", sum(vod.bytes for vod in vods))])
+    metric("vod_retries_total", "counter", "Retried VOD downloads.",
+           [("", sum(vod.retries for vod in vods))])
+    metric("vod_hedged_total", "counter", "VODs requested again for being slow.",
+           [("", sum(vod.hedged for vod in vods))])
+    metric("vod_hedge_wins_total", "counter", "Hedged requests which finished first.",
+           [("", sum(run.hedge_wins for run in runs))])
+
+    histogram("vod_queue_wait_seconds", "Time VODs waited for a worker.",
+              [vod.queue_wait for vod in vods if vod.queue_wait is not None])
+    histogram("vod_ttfb_seconds", "Time to first byte of VOD responses.",
+              [vod.ttfb for vod in vods if vod.ttfb is not None])
+    histogram("vod_transfer_seconds", "Time spent receiving VOD content.",
+              [vod.transfer_time for vod in vods if vod.transfer_time is not None])
+    histogram("vod_write_seconds", "Time spent writing VODs to disk.",
+              [vod.write_time for vod in vods if vod.status == STATUS_DOWNLOADED])
+
+    metric("runs_total", "counter", "Download runs.", [("", len(runs))])
+    metric("run_duration_seconds", "gauge", "Duration of the last download run.",
+           [("", round(runs[-1].duration or 0, 6))] if runs else [])
+    metric("run_workers", "gauge", "Workers used by the last download run, 0 if automatic.",
+           [("", runs[-1].workers or 0)] if runs else [])
+    metric("last_run_timestamp_seconds", "gauge", "When the last download run started.",
+           [("", runs[-1].started_at.timestamp())] if runs else [])
+
+    return "\n".join(lines) + "\n"
+
+
+_metrics: Optional[Metrics] = None
+
+
+def configure(path: Optional[str], format: str = FORMAT_JSON_LINES):
+    global _metrics
+    _metrics = Metrics(path, format) if path else None
+
+
+def get_metrics() -> Optional[Metrics]:
+    return _metrics
@@ -6,7 +6,7 @@ import re
 
 from itertools import islice
 from twitchdl import utils
-from typing import Any, Match
+from typing import Any, Iterable, Match
 
 
 START_CODES = {
@@ -65,6 +65,19 @@ def print_json(data: Any):
     print(json.dumps(data))
 
 
+def print_json_lines(items: Iterable[Any], flush_every: int):
+    """
+    Print each item as a separate line of JSON as soon as it is available,
+    flushing output after every `flush_every` items.
+    """
+    for count, item in enumerate(items, start=1):
+        sys.stdout.write(json.dumps(item) + "\n")
+        if count % flush_every == 0:
+            sys.stdout.flush()
+
+    sys.stdout.flush()
+
+
 def print_err(*args, **kwargs):
     args = ["<red>{}</red>".format(a) for a in args]
     args = [colorize(a) if USE_ANSI_COLOR else strip_tags(a) for a in args]
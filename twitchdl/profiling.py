@@ -0,0 +1,137 @@
+"""
+Profiling of a whole command, enabled with `--profile`.
+
+The command runs under cProfile, and the stats are saved to a file which can
+be inspected with `python -m pstats`. While VODs are downloading, the event
+loop is sampled for lag, which shows when it's blocked by work which should
+not run on it. A summary of both is printed when the command ends.
+"""
+
+import asyncio
+import cProfile
+import io
+import pstats
+import time
+
+from typing import List, NamedTuple, Optional
+
+from twitchdl.output import print_log
+
+LAG_INTERVAL = 0.01
+"""Seconds between event loop lag samples"""
+
+STALL_THRESHOLD = 0.05
+"""Event loop lag in seconds which is reported as a stall"""
+
+WORST_STALLS = 5
+"""Number of stalls to show in the summary"""
+
+TOP_FUNCTIONS = 15
+"""Number of functions to show in the summary"""
+
+
+class Stall(NamedTuple):
+    at: float
+    """Seconds since the start of the command"""
+    lag: float
+
+
+class LagSampler:
+    """Measures how late the event loop wakes up from short sleeps."""
+
+    def __init__(self, started: float, interval: float = LAG_INTERVAL):
+        self.started = started
+        self.interval = interval
+        self.samples: List[float] = []
+        self.stalls: List[Stall] = []
+
+    async def run(self):
+        """Sample until cancelled."""
+        while True:
+            before = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = max(time.monotonic() - before - self.interval, 0.0)
+            self.samples.append(lag)
+            if lag >= STALL_THRESHOLD:
+                self.stalls.append(Stall(before - self.started, lag))
+
+
+class Profiler:
+    def __init__(self, path: str):
+        self.path = path
+        self.profile = cProfile.Profile()
+        self.started = time.monotonic()
+        self.samplers: List[LagSampler] = []
+
+    def start(self):
+        self.started = time.monotonic()
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+        self.profile.dump_stats(self.path)
+
+    def lag_sampler(self) -> LagSampler:
+        sampler = LagSampler(self.started)
+        self.samplers.append(sampler)
+        return sampler
+
+    def summary(self) -> str:
+        stream = io.StringIO()
+        stats = pstats.Stats(self.profile, stream=stream)
+        stats.strip_dirs().sort_stats("tottime").print_stats(TOP_FUNCTIONS)
+
+        lines = [
+            f"Profile saved to {self.path}, inspect it with: python -m pstats {self.path}",
+            "",
+            "Functions with the most own time (main thread only):",
+            stream.getvalue().strip(),
+        ]
+
+        samples = sorted(lag for sampler in self.samplers for lag in sampler.samples)
+        if samples:
+            p99 = samples[min(int(len(samples) * 0.99), len(samples) - 1)]
+            lines += [
+                "",
+                "Event loop lag over {} samples: median {}, p99 {}, max {}".format(
+                    len(samples), _ms(samples[len(samples) // 2]), _ms(p99), _ms(samples[-1])),
+            ]
+
+            stalls = [stall for sampler in self.samplers for stall in sampler.stalls]
+            worst = sorted(stalls, key=lambda stall: stall.lag, reverse=True)[:WORST_STALLS]
+            if worst:
+                lines.append("{} stalls over {}, worst ones:".format(
+                    len(stalls), _ms(STALL_THRESHOLD)))
+                for stall in sorted(worst):
+                    lines.append("  at {:.1f}s: {}".format(stall.at, _ms(stall.lag)))
+            else:
+                lines.append("No stalls over {}".format(_ms(STALL_THRESHOLD)))
+
+        return "\n".join(lines)
+
+
+def _ms(seconds: float) -> str:
+    return "{:.1f}ms".format(seconds * 1000)
+
+
+_profiler: Optional[Profiler] = None
+
+
+def start(path: str):
+    global _profiler
+    _profiler = Profiler(path)
+    _profiler.start()
+
+
+def stop():
+    """Stop profiling if started, save the stats and print the summary."""
+    global _profiler
+    if _profiler:
+        _profiler.stop()
+        print_log("\n" + _profiler.summary())
+        _profiler = None
+
+
+def lag_sampler() -> Optional[LagSampler]:
+    """Returns a new event loop lag sampler when profiling, None otherwise."""
+    return _profiler.lag_sampler() if _profiler else None
@@ -1,10 +1,8 @@
 import logging
 import time
 
-from collections import deque
 from dataclasses import dataclass, field
-from statistics import mean
-from typing import Dict, NamedTuple, Optional, Deque
+from typing import Dict, Optional
 
 from twitchdl.output import print_out
 from twitchdl.utils import format_size, format_time
@@ -14,6 +12,12 @@ logger = logging.getLogger(__name__)
 
 TaskId = int
 
+SPEED_BUCKET = 0.5
+"""Number of seconds over which downloaded bytes are summed to estimate speed"""
+
+SPEED_SMOOTHING = 0.3
+"""Weight given to the latest bucket in the exponentially weighted speed average"""
+
 
 @dataclass
 class Task:
@@ -25,11 +29,6 @@ class Task:
         self.downloaded += size
 
 
-class Sample(NamedTuple):
-    downloaded: int
-    timestamp: float
-
-
 @dataclass
 class Progress:
     vod_count: int
@@ -42,18 +41,34 @@ class Progress:
     speed: Optional[float] = None
     start_time: float = field(default_factory=time.time)
     tasks: Dict[TaskId, Task] = field(default_factory=dict)
+    total_size: int = 0
     vod_downloaded_count: int = 0
-    samples: Deque[Sample] = field(default_factory=lambda: deque(maxlen=100))
+    bucket_bytes: int = 0
+    bucket_start: float = field(default_factory=time.time)
 
-    def start(self, task_id: int, size: int):
+    def start(self, task_id: int, size: int, downloaded: int = 0):
+        """Start a task, `downloaded` bytes are already present when resuming."""
         if task_id in self.tasks:
             raise ValueError(f"Task {task_id}: cannot start, already started")
 
-        self.tasks[task_id] = Task(task_id, size)
+        self.tasks[task_id] = Task(task_id, size, downloaded)
+        self.total_size += size
+        self.progress_bytes += downloaded
         self._calculate_total()
         self._calculate_progress()
         self.print()
 
+    def set_size(self, task_id: int, size: int):
+        """Set the size of a task which was started without knowing it."""
+        if task_id not in self.tasks:
+            raise ValueError(f"Task {task_id}: cannot set size, not started")
+
+        task = self.tasks[task_id]
+        self.total_size += size - task.size
+        task.size = size
+        self._calculate_total()
+        self._calculate_progress()
+
     def advance(self, task_id: int, size: int):
         if task_id not in self.tasks:
             raise ValueError(f"Task {task_id}: cannot advance, not started")
@@ -61,7 +76,7 @@ class Progress:
         self.downloaded += size
         self.progress_bytes += size
         self.tasks[task_id].advance(size)
-        self.samples.append(Sample(self.downloaded, time.time()))
+        self._calculate_speed(size)
         self._calculate_progress()
         self.print()
 
@@ -70,6 +85,7 @@ class Progress:
             raise ValueError(f"Task {task_id}: cannot mark as downloaded, already started")
 
         self.tasks[task_id] = Task(task_id, size)
+        self.total_size += size
         self.progress_bytes += size
         self.vod_downloaded_count += 1
         self._calculate_total()
@@ -80,8 +96,9 @@ class Progress:
         if task_id not in self.tasks:
             raise ValueError(f"Task {task_id}: cannot abort, not started")
 
-        del self.tasks[task_id]
-        self.progress_bytes = sum(t.downloaded for t in self.tasks.values())
+        task = self.tasks.pop(task_id)
+        self.total_size -= task.size
+        self.progress_bytes -= task.downloaded
 
         self._calculate_total()
         self._calculate_progress()
@@ -99,24 +116,34 @@ class Progress:
         self.print()
 
     def _calculate_total(self):
-        self.estimated_total = int(mean(t.size for t in self.tasks.values()) * self.vod_count) if self.tasks else None
+        self.estimated_total = self.total_size * self.vod_count // len(self.tasks) if self.tasks else None
 
     def _calculate_progress(self):
-        self.speed = self._calculate_speed()
         self.progress_perc = int(100 * self.progress_bytes / self.estimated_total) if self.estimated_total else 0
-        self.remaining_time = int((self.estimated_total - self.progress_bytes) / self.speed) if self.estimated_total and self.speed else None
-
-    def _calculate_speed(self):
-        if len(self.samples) < 2:
-            return None
-
-        first_sample = self.samples[0]
-        last_sample = self.samples[-1]
+        self.remaining_time = (
+            int((self.estimated_total - self.progress_bytes) / self.speed)
+            if self.estimated_total and self.speed else None
+        )
+
+    def _calculate_speed(self, size: int):
+        """
+        Sum downloaded bytes into time buckets, and update the speed estimate
+        as a weighted average each time a bucket fills up.
+        """
+        self.bucket_bytes += size
+        now = time.time()
+        elapsed = now - self.bucket_start
+        if elapsed < SPEED_BUCKET:
+            return
 
-        size = last_sample.downloaded - first_sample.downloaded
-        duration = last_sample.timestamp - first_sample.timestamp
+        bucket_speed = self.bucket_bytes / elapsed
+        if self.speed is None:
+            self.speed = bucket_speed
+        else:
+            self.speed = SPEED_SMOOTHING * bucket_speed + (1 - SPEED_SMOOTHING) * self.speed
 
-        return size / duration
+        self.bucket_bytes = 0
+        self.bucket_start = now
 
     def print(self):
         now = time.time()
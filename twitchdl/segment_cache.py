@@ -0,0 +1,169 @@
+"""
+Persistent cache of downloaded VOD segments, shared between runs.
+
+Segments are stored in a directory per video and quality, with file names
+derived from the segment path. Segments of a VOD never change once published,
+so they can be reused when downloading overlapping parts of the same video.
+When the cache grows over the size limit, least recently used segments are
+evicted.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+
+from datetime import datetime
+from typing import List, NamedTuple, Optional
+from urllib.parse import urlparse
+
+from twitchdl.cache import cache_dir
+
+MAX_SIZE = 10 * 1024 * 1024 * 1024
+"""Default maximum total size of cached segments in bytes"""
+
+INFO_FILE = "info.json"
+
+
+class CachedVideo(NamedTuple):
+    video_id: str
+    title: str
+    quality_path: str
+    segment_count: int
+    size: int
+    last_used: datetime
+    path: str
+
+
+def default_path() -> str:
+    return os.path.join(cache_dir(), "segments")
+
+
+def _link_or_copy(source: str, target: str):
+    """Hard link the file if possible, copy it otherwise (e.g. across file systems)."""
+    try:
+        os.link(source, target)
+    except OSError:
+        tmp_path = target + ".tmp"
+        shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, target)
+
+
+def _hash(value: str) -> str:
+    return hashlib.sha256(value.encode()).hexdigest()
+
+
+class SegmentCache:
+    def __init__(self, path: str, max_size: int = MAX_SIZE):
+        self.path = path
+        self.max_size = max_size
+
+    def restore(self, video: dict, base_uri: str, vod_paths: List[str], targets: List[str]) -> int:
+        """
+        Copy cached segments to targets which don't exist yet, so they don't
+        need to be downloaded. Returns the number of restored segments.
+        """
+        video_dir = self._video_dir(video, base_uri)
+        restored = 0
+        for vod_path, target in zip(vod_paths, targets):
+            cached = self._segment_path(video_dir, vod_path)
+            if os.path.exists(target) or not os.path.exists(cached):
+                continue
+
+            _link_or_copy(cached, target)
+            # Modification time is used for evicting least recently used segments
+            os.utime(cached)
+            restored += 1
+
+        return restored
+
+    def store(self, video: dict, base_uri: str, vod_paths: List[str], targets: List[str]):
+        """Add downloaded segments to the cache, then evict segments over the size limit."""
+        video_dir = self._video_dir(video, base_uri)
+        os.makedirs(video_dir, exist_ok=True)
+
+        info_path = os.path.join(video_dir, INFO_FILE)
+        if not os.path.exists(info_path):
+            with open(info_path, "w") as f:
+                json.dump({
+                    "video_id": video["id"],
+                    "title": video["title"],
+                    "quality_path": urlparse(base_uri).path,
+                }, f)
+
+        for vod_path, target in zip(vod_paths, targets):
+            cached = self._segment_path(video_dir, vod_path)
+            if os.path.exists(target) and not os.path.exists(cached):
+                _link_or_copy(target, cached)
+
+        self.prune()
+
+    def list(self) -> List[CachedVideo]:
+        videos = []
+        for video_dir in self._video_dirs():
+            try:
+                with open(os.path.join(video_dir, INFO_FILE)) as f:
+                    info = json.load(f)
+            except (OSError, ValueError):
+                info = {}
+
+            segments = self._segments(video_dir)
+            videos.append(CachedVideo(
+                video_id=info.get("video_id", "?"),
+                title=info.get("title", "?"),
+                quality_path=info.get("quality_path", "?"),
+                segment_count=len(segments),
+                size=sum(stat.st_size for stat, _ in segments),
+                last_used=datetime.fromtimestamp(
+                    max((stat.st_mtime for stat, _ in segments), default=0)),
+                path=video_dir,
+            ))
+
+        return sorted(videos, key=lambda video: video.last_used, reverse=True)
+
+    def prune(self, max_size: Optional[int] = None) -> int:
+        """
+        Evict least recently used segments until the cache is under the size
+        limit. Returns the number of bytes freed.
+        """
+        max_size = self.max_size if max_size is None else max_size
+        segments = [segment for video_dir in self._video_dirs()
+                    for segment in self._segments(video_dir)]
+
+        total_size = sum(stat.st_size for stat, _ in segments)
+        freed = 0
+        for stat, path in sorted(segments, key=lambda segment: segment[0].st_mtime):
+            if total_size - freed <= max_size:
+                break
+            os.remove(path)
+            freed += stat.st_size
+
+        for video_dir in self._video_dirs():
+            if not self._segments(video_dir):
+                shutil.rmtree(video_dir)
+
+        return freed
+
+    def _video_dir(self, video: dict, base_uri: str) -> str:
+        # CDN host differs between requests, the path identifies the video and quality
+        quality_path = urlparse(base_uri).path
+        return os.path.join(self.path, "{}_{}".format(video["id"], _hash(quality_path)[:16]))
+
+    def _segment_path(self, video_dir: str, vod_path: str) -> str:
+        return os.path.join(video_dir, _hash(vod_path) + ".ts")
+
+    def _video_dirs(self) -> List[str]:
+        try:
+            names = os.listdir(self.path)
+        except FileNotFoundError:
+            return []
+        paths = [os.path.join(self.path, name) for name in names]
+        return [path for path in paths if os.path.isdir(path)]
+
+    def _segments(self, video_dir: str):
+        segments = []
+        for name in os.listdir(video_dir):
+            if name.endswith(".ts"):
+                path = os.path.join(video_dir, name)
+                segments.append((os.stat(path), path))
+        return segments
@@ -0,0 +1,79 @@
+"""
+State of channel archives kept in sync by the sync command.
+
+Stored in a SQLite database which tracks videos seen while listing a channel,
+and whether they have been downloaded.
+"""
+
+import os
+import sqlite3
+
+from datetime import datetime, timezone
+from typing import List, NamedTuple, Set
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    id TEXT PRIMARY KEY,
+    channel TEXT NOT NULL,
+    title TEXT NOT NULL,
+    published_at TEXT NOT NULL,
+    seen_at TEXT NOT NULL,
+    completed_at TEXT
+);
+
+CREATE INDEX IF NOT EXISTS videos_channel ON videos (channel, completed_at);
+"""
+
+
+class PendingVideo(NamedTuple):
+    id: str
+    title: str
+    published_at: str
+
+
+def default_path() -> str:
+    base = os.getenv("XDG_DATA_HOME") or os.path.join(os.path.expanduser("~"), ".local", "share")
+    return os.path.join(base, "twitch-dl", "sync.db")
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class SyncState:
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.connection.close()
+
+    def seen_ids(self, channel: str) -> Set[str]:
+        rows = self.connection.execute(
+            "SELECT id FROM videos WHERE channel = ?", (channel.lower(),))
+        return {id for id, in rows}
+
+    def add_seen(self, channel: str, videos: List[dict]):
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO videos (id, channel, title, published_at, seen_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(video["id"], channel.lower(), video["title"], video["publishedAt"], _now())
+                 for video in videos])
+
+    def pending(self, channel: str) -> List[PendingVideo]:
+        """Videos which have been seen but not downloaded, oldest first."""
+        rows = self.connection.execute(
+            "SELECT id, title, published_at FROM videos "
+            "WHERE channel = ? AND completed_at IS NULL ORDER BY published_at",
+            (channel.lower(),))
+        return [PendingVideo(*row) for row in rows]
+
+    def mark_completed(self, video_id: str):
+        with self.connection:
+            self.connection.execute(
+                "UPDATE videos SET completed_at = ? WHERE id = ?", (_now(), video_id))
@@ -3,10 +3,25 @@ Twitch API access.
 """
 
 import httpx
+import json
+import queue
+import threading
 
-from typing import Dict
-from twitchdl import CLIENT_ID
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from twitchdl import CLIENT_ID, cache
 from twitchdl.exceptions import ConsoleError
+from twitchdl.http import get_async_client, get_client
+
+GQL_URL = "https://gql.twitch.tv/gql"
+
+GQL_BATCH_SIZE = 35
+"""Maximum number of lookups to combine into a single GraphQL request"""
+
+PAGE_SIZE = 100
+"""Maximum number of videos or clips which can be fetched in one request"""
+
+PREFETCH_PAGES = 2
+"""Number of pages of videos or clips to fetch ahead of the one being consumed"""
 
 
 class GQLError(Exception):
@@ -18,7 +33,18 @@ class GQLError(Exception):
 def authenticated_post(url, data=None, json=None, headers={}):
     headers['Client-ID'] = CLIENT_ID
 
-    response = httpx.post(url, data=data, json=json, headers=headers)
+    response = get_client().post(url, data=data, json=json, headers=headers)
+    return _check_response(response)
+
+
+async def authenticated_post_async(url, data=None, json=None, headers={}):
+    headers['Client-ID'] = CLIENT_ID
+
+    response = await get_async_client().post(url, data=data, json=json, headers=headers)
+    return _check_response(response)
+
+
+def _check_response(response: httpx.Response) -> httpx.Response:
     if response.status_code == 400:
         data = response.json()
         raise ConsoleError(data["message"])
@@ -29,8 +55,7 @@ def authenticated_post(url, data=None, json=None, headers={}):
 
 
 def gql_post(query):
-    url = "https://gql.twitch.tv/gql"
-    response = authenticated_post(url, data=query).json()
+    response = authenticated_post(GQL_URL, data=query).json()
 
     if "errors" in response:
         raise GQLError(response["errors"])
@@ -39,8 +64,7 @@ def gql_post(query):
 
 
 def gql_query(query: str, headers: Dict[str, str] = {}):
-    url = "https://gql.twitch.tv/gql"
-    response = authenticated_post(url, json={"query": query}, headers=headers).json()
+    response = authenticated_post(GQL_URL, json={"query": query}, headers=headers).json()
 
     if "errors" in response:
         raise GQLError(response["errors"])
@@ -48,6 +72,52 @@ def gql_query(query: str, headers: Dict[str, str] = {}):
     return response
 
 
+def gql_batch(operations: List[dict]) -> List[dict]:
+    """Send multiple operations in a single request, returns a list of responses."""
+    responses = authenticated_post(GQL_URL, json=operations).json()
+    return _check_batch_responses(responses)
+
+
+async def gql_batch_async(operations: List[dict]) -> List[dict]:
+    response = await authenticated_post_async(GQL_URL, json=operations)
+    return _check_batch_responses(response.json())
+
+
+def _check_batch_responses(responses: List[dict]) -> List[dict]:
+    for response in responses:
+        if "errors" in response:
+            raise GQLError(response["errors"])
+
+    return responses
+
+
+def _batches(items: Iterable[str]) -> Iterable[List[str]]:
+    """Split unique items into batches of GQL_BATCH_SIZE."""
+    items = list(dict.fromkeys(items))
+    for start in range(0, len(items), GQL_BATCH_SIZE):
+        yield items[start:start + GQL_BATCH_SIZE]
+
+
+def gql_query_aliased(
+    make_field: Callable[[str], str],
+    items: Iterable[str],
+    headers: Dict[str, str] = {},
+) -> Dict[str, Any]:
+    """
+    Look up multiple items by combining aliased fields into one query, where
+    `make_field` returns the field for a given item. Returns a dict mapping
+    each item to the value of its field.
+    """
+    results = {}
+    for batch in _batches(items):
+        fields = "\n".join("item{}: {}".format(n, make_field(item)) for n, item in enumerate(batch))
+        response = gql_query("{{\n{}\n}}".format(fields), headers=headers)
+        for n, item in enumerate(batch):
+            results[item] = response["data"]["item{}".format(n)]
+
+    return results
+
+
 VIDEO_FIELDS = """
     id
     title
@@ -89,6 +159,10 @@ CLIP_FIELDS = """
 
 
 def get_video(video_id):
+    return cache.get_cache().cached(cache.VIDEO, video_id, lambda: _get_video(video_id))
+
+
+def _get_video(video_id):
     query = """
     {{
         video(id: "{video_id}") {{
@@ -103,6 +177,18 @@ def get_video(video_id):
     return response["data"]["video"]
 
 
+def get_videos(video_ids: Iterable[str]) -> Dict[str, Optional[dict]]:
+    """Look up multiple videos using as few requests as possible."""
+    return cache.get_cache().cached_many(cache.VIDEO, video_ids, _get_videos)
+
+
+def _get_videos(video_ids: Iterable[str]) -> Dict[str, Optional[dict]]:
+    return gql_query_aliased(
+        lambda video_id: 'video(id: "{}") {{ {} }}'.format(video_id, VIDEO_FIELDS),
+        video_ids
+    )
+
+
 def get_clip(slug):
     query = """
     {{
@@ -116,26 +202,69 @@ def get_clip(slug):
     return response["data"]["clip"]
 
 
-def get_clip_access_token(slug):
-    query = """
-    {{
+def get_clips(slugs: Iterable[str]) -> Dict[str, Optional[dict]]:
+    """Look up multiple clips using as few requests as possible."""
+    return gql_query_aliased(
+        lambda slug: 'clip(slug: "{}") {{ {} }}'.format(slug, CLIP_FIELDS),
+        slugs
+    )
+
+
+def _clip_access_token_operation(slug):
+    return {
         "operationName": "VideoAccessToken_Clip",
-        "variables": {{
-            "slug": "{slug}"
-        }},
-        "extensions": {{
-            "persistedQuery": {{
+        "variables": {
+            "slug": slug
+        },
+        "extensions": {
+            "persistedQuery": {
                 "version": 1,
                 "sha256Hash": "36b89d2507fce29e5ca551df756d27c1cfe079e2609642b4390aa4c35796eb11"
-            }}
-        }}
-    }}
-    """
+            }
+        }
+    }
+
+
+def get_clip_access_token(slug):
+    return cache.get_cache().cached(
+        cache.CLIP_ACCESS_TOKEN, slug, lambda: _get_clip_access_token(slug))
 
-    response = gql_post(query.format(slug=slug).strip())
+
+def _get_clip_access_token(slug):
+    response = gql_post(json.dumps(_clip_access_token_operation(slug)))
     return response["data"]["clip"]
 
 
+def get_clip_access_tokens(slugs: Iterable[str]) -> Dict[str, Optional[dict]]:
+    """Fetch access tokens for multiple clips, batching persisted query operations."""
+    return cache.get_cache().cached_many(cache.CLIP_ACCESS_TOKEN, slugs, _get_clip_access_tokens)
+
+
+def _get_clip_access_tokens(slugs: Iterable[str]) -> Dict[str, Optional[dict]]:
+    tokens = {}
+    for batch in _batches(slugs):
+        responses = gql_batch([_clip_access_token_operation(slug) for slug in batch])
+        for slug, response in zip(batch, responses):
+            tokens[slug] = response["data"]["clip"]
+
+    return tokens
+
+
+async def get_clip_access_tokens_async(slugs: Iterable[str]) -> Dict[str, Optional[dict]]:
+    return await cache.get_cache().cached_many_async(
+        cache.CLIP_ACCESS_TOKEN, slugs, _get_clip_access_tokens_async)
+
+
+async def _get_clip_access_tokens_async(slugs: Iterable[str]) -> Dict[str, Optional[dict]]:
+    tokens = {}
+    for batch in _batches(slugs):
+        responses = await gql_batch_async([_clip_access_token_operation(slug) for slug in batch])
+        for slug, response in zip(batch, responses):
+            tokens[slug] = response["data"]["clip"]
+
+    return tokens
+
+
 def get_channel_clips(channel_id, period, limit, after=None):
     """
     List channel clips.
@@ -181,26 +310,64 @@ def get_channel_clips(channel_id, period, limit, after=None):
     return response["data"]["user"]["clips"]
 
 
-def channel_clips_generator(channel_id, period, limit):
-    def _generator(clips, limit):
-        for clip in clips["edges"]:
-            if limit < 1:
+def _paginate(first_page: dict, fetch_page: Callable[[int, str], dict], limit: int):
+    """
+    Yield nodes from a paginated connection, starting with `first_page`, up to
+    `limit` nodes. Following pages are fetched in a background thread while
+    previous ones are being consumed, up to PREFETCH_PAGES ahead.
+    """
+    pages: queue.Queue = queue.Queue(PREFETCH_PAGES)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        # Give up when the consumer stops iterating
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def fetch_pages():
+        page = first_page
+        fetched = 0
+        try:
+            while True:
+                fetched += len(page["edges"])
+                has_next = page["pageInfo"]["hasNextPage"] and page["edges"] and fetched < limit
+                if not put(page) or not has_next:
+                    break
+                page = fetch_page(min(limit - fetched, PAGE_SIZE), page["edges"][-1]["cursor"])
+        except Exception as e:
+            put(e)
+        put(None)
+
+    threading.Thread(target=fetch_pages, daemon=True).start()
+
+    try:
+        count = 0
+        while True:
+            page = pages.get()
+            if page is None:
                 return
-            yield clip["node"]
-            limit -= 1
+            if isinstance(page, Exception):
+                raise page
+            for edge in page["edges"]:
+                if count >= limit:
+                    return
+                yield edge["node"]
+                count += 1
+    finally:
+        stop.set()
 
-        has_next = clips["pageInfo"]["hasNextPage"]
-        if limit < 1 or not has_next:
-            return
 
-        req_limit = min(limit, 100)
-        cursor = clips["edges"][-1]["cursor"]
-        clips = get_channel_clips(channel_id, period, req_limit, cursor)
-        yield from _generator(clips, limit)
+def channel_clips_generator(channel_id, period, limit):
+    def fetch_page(req_limit, cursor):
+        return get_channel_clips(channel_id, period, req_limit, cursor)
 
-    req_limit = min(limit, 100)
-    clips = get_channel_clips(channel_id, period, req_limit)
-    return _generator(clips, limit)
+    clips = get_channel_clips(channel_id, period, min(limit, PAGE_SIZE))
+    return _paginate(clips, fetch_page, limit)
 
 
 def channel_clips_generator_old(channel_id, period, limit):
@@ -251,7 +418,7 @@ def get_channel_videos(channel_id, limit, sort, type="archive", game_ids=[], aft
 
     query = query.format(
         channel_id=channel_id,
-        game_ids=game_ids,
+        game_ids=json.dumps(game_ids or []),
         after=after if after else "",
         limit=limit,
         sort=sort.upper(),
@@ -268,75 +435,114 @@ def get_channel_videos(channel_id, limit, sort, type="archive", game_ids=[], aft
 
 
 def channel_videos_generator(channel_id, max_videos, sort, type, game_ids=None):
-    def _generator(videos, max_videos):
-        for video in videos["edges"]:
-            if max_videos < 1:
-                return
-            yield video["node"]
-            max_videos -= 1
+    def fetch_page(limit, cursor):
+        return get_channel_videos(channel_id, limit, sort, type, game_ids, cursor)
 
-        has_next = videos["pageInfo"]["hasNextPage"]
-        if max_videos < 1 or not has_next:
-            return
+    videos = get_channel_videos(channel_id, min(max_videos, PAGE_SIZE), sort, type, game_ids)
+    return videos["totalCount"], _paginate(videos, fetch_page, max_videos)
 
-        limit = min(max_videos, 100)
-        cursor = videos["edges"][-1]["cursor"]
-        videos = get_channel_videos(channel_id, limit, sort, type, game_ids, cursor)
-        yield from _generator(videos, max_videos)
 
-    limit = min(max_videos, 100)
-    videos = get_channel_videos(channel_id, limit, sort, type, game_ids)
-    return videos["totalCount"], _generator(videos, max_videos)
-
-
-def get_access_token(video_id, auth_token=None):
-    query = """
-    {{
-        videoPlaybackAccessToken(
-            id: {video_id},
-            params: {{
-                platform: "web",
-                playerBackend: "mediaplayer",
-                playerType: "site"
-            }}
-        ) {{
-            signature
-            value
+ACCESS_TOKEN_FIELD = """
+    videoPlaybackAccessToken(
+        id: {video_id},
+        params: {{
+            platform: "web",
+            playerBackend: "mediaplayer",
+            playerType: "site"
         }}
+    ) {{
+        signature
+        value
     }}
-    """
+"""
 
-    query = query.format(video_id=video_id)
 
+def _access_token_headers(auth_token):
     headers = {}
     if auth_token is not None:
         headers['authorization'] = f'OAuth {auth_token}'
+    return headers
+
+
+def _access_token_error(error: httpx.HTTPStatusError, auth_token):
+    """
+    Provide a more useful error message when server returns HTTP 401
+    Unauthorized while using a user-provided auth token.
+    """
+    if error.response.status_code == 401:
+        if auth_token:
+            return ConsoleError("Unauthorized. The provided auth token is not valid.")
+        else:
+            return ConsoleError(
+                "Unauthorized. This video may be subscriber-only. See docs:\n"
+                "https://twitch-dl.bezdomni.net/commands/download.html#downloading-subscriber-only-vods"
+            )
+
+    return error
+
+
+def _access_token_key(video_id, auth_token):
+    # Tokens obtained with an auth token grant more access, don't share them
+    return f"{video_id}:{auth_token or ''}"
+
+
+def get_access_token(video_id, auth_token=None):
+    return cache.get_cache().cached(
+        cache.ACCESS_TOKEN,
+        _access_token_key(video_id, auth_token),
+        lambda: _get_access_token(video_id, auth_token)
+    )
+
+
+def _get_access_token(video_id, auth_token=None):
+    query = "{{ {} }}".format(ACCESS_TOKEN_FIELD.format(video_id=video_id))
 
     try:
-        response = gql_query(query, headers=headers)
+        response = gql_query(query, headers=_access_token_headers(auth_token))
         return response["data"]["videoPlaybackAccessToken"]
     except httpx.HTTPStatusError as error:
-        # Provide a more useful error message when server returns HTTP 401
-        # Unauthorized while using a user-provided auth token.
-        if error.response.status_code == 401:
-            if auth_token:
-                raise ConsoleError("Unauthorized. The provided auth token is not valid.")
-            else:
-                raise ConsoleError(
-                    "Unauthorized. This video may be subscriber-only. See docs:\n"
-                    "https://twitch-dl.bezdomni.net/commands/download.html#downloading-subscriber-only-vods"
-                )
+        raise _access_token_error(error, auth_token)
+
+
+def get_access_tokens(video_ids: Iterable[str], auth_token=None) -> Dict[str, Optional[dict]]:
+    """Fetch access tokens for multiple videos using as few requests as possible."""
+    keys = {_access_token_key(video_id, auth_token): video_id for video_id in video_ids}
 
-        raise
+    def fetch(missing_keys):
+        tokens = _get_access_tokens([keys[key] for key in missing_keys], auth_token)
+        return {_access_token_key(video_id, auth_token): token
+                for video_id, token in tokens.items()}
+
+    tokens = cache.get_cache().cached_many(cache.ACCESS_TOKEN, keys, fetch)
+    return {keys[key]: token for key, token in tokens.items()}
+
+
+def _get_access_tokens(video_ids: Iterable[str], auth_token=None) -> Dict[str, Optional[dict]]:
+    try:
+        return gql_query_aliased(
+            lambda video_id: ACCESS_TOKEN_FIELD.format(video_id=video_id),
+            video_ids,
+            _access_token_headers(auth_token)
+        )
+    except httpx.HTTPStatusError as error:
+        raise _access_token_error(error, auth_token)
 
 
 def get_playlists(video_id, access_token):
     """
     For a given video return a playlist which contains possible video qualities.
     """
+    return cache.get_cache().cached(
+        cache.PLAYLISTS,
+        _access_token_key(video_id, access_token["value"]),
+        lambda: _get_playlists(video_id, access_token)
+    )
+
+
+def _get_playlists(video_id, access_token):
     url = "http://usher.twitch.tv/vod/{}".format(video_id)
 
-    response = httpx.get(url, params={
+    response = get_client().get(url, params={
         "nauth": access_token['value'],
         "nauthsig": access_token['signature'],
         "allow_audio_only": "true",
@@ -348,6 +554,10 @@ def get_playlists(video_id, access_token):
 
 
 def get_game_id(name):
+    return cache.get_cache().cached(cache.GAME_ID, name.strip(), lambda: _get_game_id(name))
+
+
+def _get_game_id(name):
     query = """
     {{
         game(name: "{}") {{
@@ -360,3 +570,17 @@ def get_game_id(name):
     game = response["data"]["game"]
     if game:
         return game["id"]
+
+
+def get_game_ids(names: Iterable[str]) -> Dict[str, Optional[str]]:
+    """Look up IDs for multiple games using as few requests as possible."""
+    names = [name.strip() for name in names]
+    return cache.get_cache().cached_many(cache.GAME_ID, names, _get_game_ids)
+
+
+def _get_game_ids(names: List[str]) -> Dict[str, Optional[str]]:
+    games = gql_query_aliased(
+        lambda name: 'game(name: {}) {{ id }}'.format(json.dumps(name)),
+        names
+    )
+    return {name: game["id"] if game else None for name, game in games.items()}
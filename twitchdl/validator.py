@@ -0,0 +1,98 @@
+"""
+Validating downloaded VODs while they are being downloaded.
+"""
+
+from typing import Dict
+
+TS_PACKET_SIZE = 188
+TS_SYNC_BYTE = 0x47
+TS_NULL_PID = 0x1FFF
+
+VALIDATE_NONE = "none"
+VALIDATE_SYNC = "sync"
+VALIDATE_CONTINUITY = "continuity"
+
+VALIDATION_LEVELS = [VALIDATE_NONE, VALIDATE_SYNC, VALIDATE_CONTINUITY]
+"""
+How to validate MPEG-TS VODs, in addition to checking their length:
+* none - don't look at the content
+* sync - check that each 188 byte packet starts with a sync byte
+* continuity - also check continuity counters of each stream
+"""
+
+
+class InvalidVod(Exception):
+    """Raised when a downloaded VOD is not a valid MPEG-TS stream."""
+    pass
+
+
+class VodValidator:
+    """
+    Validates MPEG-TS packets of a VOD incrementally, as chunks are downloaded.
+    Packets are checked in batches using slices, so that validation keeps up
+    with fast downloads.
+    """
+
+    def __init__(self, level: str = VALIDATE_SYNC):
+        self.level = level
+        self.position = 0
+        self.buffer = bytearray()
+        self.counters: Dict[int, int] = {}
+
+    def feed(self, chunk: bytes):
+        """Validate the next chunk of the VOD, raises InvalidVod if it's invalid."""
+        if self.level == VALIDATE_NONE:
+            return
+
+        self.buffer += chunk
+        length = len(self.buffer) - len(self.buffer) % TS_PACKET_SIZE
+        if not length:
+            return
+
+        packets = bytes(self.buffer[:length])
+        del self.buffer[:length]
+
+        sync_bytes = packets[::TS_PACKET_SIZE]
+        if sync_bytes.count(TS_SYNC_BYTE) != len(sync_bytes):
+            index = next(n for n, byte in enumerate(sync_bytes) if byte != TS_SYNC_BYTE)
+            raise InvalidVod("Missing sync byte at offset {}".format(
+                self.position + index * TS_PACKET_SIZE))
+
+        if self.level == VALIDATE_CONTINUITY:
+            self._check_continuity(packets)
+
+        self.position += length
+
+    def finish(self):
+        """Check that the VOD doesn't end in a partial packet."""
+        if self.level != VALIDATE_NONE and self.buffer:
+            raise InvalidVod("VOD ends with a partial packet of {} bytes".format(len(self.buffer)))
+
+    def _check_continuity(self, packets: bytes):
+        headers = zip(packets[1::TS_PACKET_SIZE],
+                      packets[2::TS_PACKET_SIZE],
+                      packets[3::TS_PACKET_SIZE],
+                      packets[5::TS_PACKET_SIZE])
+
+        for n, (byte1, byte2, byte3, flags) in enumerate(headers):
+            pid = (byte1 & 0x1F) << 8 | byte2
+            adaptation_field = byte3 & 0x20
+            has_payload = byte3 & 0x10
+            counter = byte3 & 0x0F
+            if pid == TS_NULL_PID:
+                continue
+
+            # The counter may jump where the discontinuity indicator is set
+            discontinuity = adaptation_field and packets[n * TS_PACKET_SIZE + 4] and flags & 0x80
+            previous = self.counters.get(pid)
+            self.counters[pid] = counter
+            if previous is None or discontinuity:
+                continue
+
+            # Counter is incremented only by packets with payload, and a
+            # packet may be sent twice
+            expected = (previous + 1) % 16 if has_payload else previous
+            if counter != expected and counter != previous:
+                raise InvalidVod(
+                    "Continuity counter of PID {} at offset {} is {}, expected {}".format(
+                        pid, self.position + n * TS_PACKET_SIZE, counter, expected))
@@ -0,0 +1,160 @@
+"""
+Writing downloaded VODs to disk.
+"""
+
+import logging
+import os
+import time
+
+from dataclasses import dataclass
+from typing import Iterable
+
+logger = logging.getLogger(__name__)
+
+BUFFER_SIZE = 1024 * 1024
+"""Chunks are coalesced into writes of this many bytes"""
+
+FSYNC_NONE = "none"
+FSYNC_VOD = "vod"
+FSYNC_END = "end"
+
+FSYNC_POLICIES = [FSYNC_NONE, FSYNC_VOD, FSYNC_END]
+"""
+When to flush written data to disk:
+* none - leave it to the operating system
+* vod - after each VOD is downloaded
+* end - after all VODs of a video are downloaded, before joining them
+"""
+
+OFFSET_SUFFIX = ".offset"
+"""Suffix of the file which records how much of a preallocated file was written"""
+
+
+@dataclass
+class WriteOptions:
+    buffer_size: int = BUFFER_SIZE
+    fsync: str = FSYNC_NONE
+
+
+class VodWriter:
+    """
+    Writes a VOD to a file, coalescing downloaded chunks into large writes.
+
+    When the size is known, space for the whole file is preallocated to reduce
+    fragmentation. The file is truncated to the written length when closed, so
+    a partial file can be resumed later. Until then, the written length is
+    recorded in a separate file, so it can be found with `written_length` if
+    the process dies before closing.
+    """
+
+    def __init__(self, path: str, size: int, offset: int, options: WriteOptions):
+        self.options = options
+        self.written = offset
+        self.write_time = 0.0
+        self.buffer = bytearray()
+        self.offset_path = path + OFFSET_SUFFIX
+        self.offset_fd = None
+        self.file = open(path, "r+b" if offset else "wb", buffering=0)
+        try:
+            # Drop any space preallocated by a previous attempt
+            self.file.truncate(offset)
+            self.file.seek(offset)
+            self._preallocate(size)
+        except BaseException:
+            self.file.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(fsync=exc_type is None)
+
+    def write(self, chunk: bytes):
+        self.buffer += chunk
+        if len(self.buffer) >= self.options.buffer_size:
+            self.flush()
+
+    def flush(self):
+        start = time.monotonic()
+        with memoryview(self.buffer) as view:
+            flushed = 0
+            while flushed < len(view):
+                flushed += self.file.write(view[flushed:])
+
+        self.written += flushed
+        self.buffer.clear()
+        self._record_offset()
+        self.write_time += time.monotonic() - start
+
+    def close(self, fsync: bool = True):
+        try:
+            self.flush()
+            self.file.truncate(self.written)
+            if fsync and self.options.fsync == FSYNC_VOD:
+                start = time.monotonic()
+                os.fsync(self.file.fileno())
+                self.write_time += time.monotonic() - start
+        finally:
+            self.file.close()
+            self._remove_offset()
+
+    def _preallocate(self, size: int):
+        if not hasattr(os, "posix_fallocate") or size <= self.written:
+            self._remove_offset()
+            return
+
+        # Record the offset before the file grows past the written data
+        self.offset_fd = os.open(self.offset_path, os.O_WRONLY | os.O_CREAT)
+        self._record_offset()
+
+        try:
+            os.posix_fallocate(self.file.fileno(), self.written, size - self.written)
+        except OSError as e:
+            # Not supported by all file systems
+            logger.debug(f"Preallocation failed: {e}")
+            self._remove_offset()
+
+    def _record_offset(self):
+        if self.offset_fd is not None:
+            # Fixed width, so the previous value is always fully overwritten
+            os.pwrite(self.offset_fd, f"{self.written:020d}".encode(), 0)
+
+    def _remove_offset(self):
+        if self.offset_fd is not None:
+            os.close(self.offset_fd)
+            self.offset_fd = None
+
+        try:
+            os.remove(self.offset_path)
+        except FileNotFoundError:
+            pass
+
+
+def written_length(path: str) -> int:
+    """
+    Returns the length of data written to a partially downloaded file, which
+    is shorter than the file if it was preallocated and not closed properly.
+    """
+    if not os.path.exists(path):
+        return 0
+
+    size = os.path.getsize(path)
+    try:
+        with open(path + OFFSET_SUFFIX, "rb") as f:
+            return min(int(f.read()), size)
+    except FileNotFoundError:
+        return size
+    except ValueError:
+        # Unreadable record, the data after it can't be trusted
+        return 0
+
+
+def fsync_files(paths: Iterable[str]):
+    """Flush given files to disk."""
+    for path in paths:
+        fd = os.open(path, os.O_RDWR)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)